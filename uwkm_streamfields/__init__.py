@@ -0,0 +1,2 @@
+# UWKM Streamfields.
+default_app_config = 'uwkm_streamfields.apps.StreamfieldsConfig'
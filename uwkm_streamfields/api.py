@@ -0,0 +1,280 @@
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.encoding import force_text
+
+from rest_framework.filters import BaseFilterBackend
+from wagtail.api.v2.endpoints import PagesAPIEndpoint
+from wagtail.api.v2.serializers import PageSerializer, StreamField
+from wagtail.api.v2.utils import BadRequestError
+from wagtail.wagtailcore import fields as wagtailcore_fields
+from wagtail.wagtailcore.blocks import (
+    BaseStreamBlock, BaseStructBlock, ChooserBlock, ListBlock)
+from wagtail.wagtailimages.models import AbstractImage, Filter
+
+from .block_index import find_blocks
+from .blocks import GridBlock, GridContentBlock
+from .conf import get_setting
+from .encoding import get_prep_default
+from .models import PageRenderVersion
+from .rendering import get_fragment_cache
+from .stream import get_raw_stream
+
+
+class RepresentationOptions(object):
+    def __init__(self, block_types=None, block_fields=None, renditions=()):
+        self.block_types = block_types
+        self.block_fields = block_fields
+        self.renditions = renditions
+
+    @classmethod
+    def from_request(cls, request):
+        """
+        Return the options of an API request. Only the filter specs in
+        STREAMFIELDS_API_RENDITIONS may be requested, so clients cannot
+        have arbitrary renditions generated.
+        """
+        def split(name):
+            value = request.GET.get(name) if request is not None else None
+            if not value:
+                return None
+            return frozenset(item.strip() for item in value.split(',') if item.strip())
+
+        renditions = split('renditions') or frozenset()
+        unknown_renditions = renditions - set(get_setting('STREAMFIELDS_API_RENDITIONS'))
+        if unknown_renditions:
+            raise BadRequestError(
+                "renditions not available: %s" % ', '.join(sorted(unknown_renditions)))
+
+        return cls(
+            block_types=split('block_types'),
+            block_fields=split('block_fields'),
+            renditions=sorted(renditions),
+        )
+
+    def get_key(self):
+        return '%s:%s:%s' % (
+            ','.join(sorted(self.block_types or ['*'])),
+            ','.join(sorted(self.block_fields or ['*'])),
+            ','.join(self.renditions))
+
+
+class StreamRepresentation(object):
+    """
+    Builds the API representation of stored stream data in two passes: the
+    tree is built with a placeholder dict for every chosen object, then the
+    objects are loaded in bulk and filled in.
+    """
+    def __init__(self, options):
+        self.options = options
+        # (model, object id) -> placeholders
+        self.references = {}
+
+    def represent(self, block, raw):
+        if raw in (None, ''):
+            return raw
+
+        if isinstance(block, ChooserBlock):
+            placeholder = {'id': raw}
+            self.references.setdefault((block.target_model, raw), []).append(placeholder)
+            return placeholder
+
+        if isinstance(block, BaseStreamBlock):
+            return [
+                {'type': child['type'], 'value': self.represent(
+                    block.child_blocks[child['type']], child['value'])}
+                for child in raw
+                if child['type'] in block.child_blocks and self.include_type(block, child['type'])
+            ]
+
+        if isinstance(block, ListBlock):
+            expand_item = getattr(block, 'expand_item', lambda child: child)
+            return [self.represent(block.child_block, expand_item(child)) for child in raw]
+
+        if isinstance(block, BaseStructBlock):
+            # fields holding their default are not stored, see encoding.py
+            return dict(
+                (name, self.represent(
+                    child_block,
+                    raw[name] if name in raw else get_prep_default(child_block)))
+                for name, child_block in block.child_blocks.items()
+                if self.include_field(block, name)
+            )
+
+        return raw
+
+    def include_type(self, block, block_type):
+        if self.options.block_types is None or not isinstance(block, GridContentBlock):
+            return True
+        return block_type in self.options.block_types
+
+    def include_field(self, block, name):
+        if self.options.block_fields is None or isinstance(block, GridBlock):
+            return True
+        return name in self.options.block_fields
+
+    def resolve(self):
+        """Load the chosen objects, one query per model, and fill them in."""
+        ids_by_model = {}
+        for model, object_id in self.references:
+            ids_by_model.setdefault(model, set()).add(object_id)
+
+        for model, ids in ids_by_model.items():
+            objects = model.objects.in_bulk(ids)
+            if issubclass(model, AbstractImage):
+                renditions = self.get_renditions(model, objects.values())
+            for object_id in ids:
+                obj = objects.get(object_id)
+                if obj is None:
+                    continue
+                if issubclass(model, AbstractImage):
+                    data = self.represent_image(obj, renditions)
+                else:
+                    data = self.represent_object(obj)
+                for placeholder in self.references[(model, object_id)]:
+                    placeholder.update(data)
+
+    def get_renditions(self, model, images):
+        """
+        Return the requested renditions of the images by (image id, filter
+        spec), generating only the ones which do not exist yet.
+        """
+        if not self.options.renditions or not images:
+            return {}
+
+        filters = dict((spec, Filter(spec=spec)) for spec in self.options.renditions)
+        existing = {}
+        for rendition in model.get_rendition_model().objects.filter(
+                image_id__in=[image.pk for image in images],
+                filter_spec__in=list(filters)):
+            existing[(rendition.image_id, rendition.filter_spec, rendition.focal_point_key)] = rendition
+
+        renditions = {}
+        for image in images:
+            for spec, image_filter in filters.items():
+                rendition = existing.get((image.pk, spec, image_filter.get_cache_key(image)))
+                if rendition is None:
+                    rendition = image.get_rendition(image_filter)
+                renditions[(image.pk, spec)] = rendition
+        return renditions
+
+    def represent_image(self, image, renditions):
+        data = {
+            'title': image.title,
+            'width': image.width,
+            'height': image.height,
+        }
+        if self.options.renditions:
+            data['renditions'] = dict(
+                (spec, {
+                    'url': renditions[(image.pk, spec)].url,
+                    'width': renditions[(image.pk, spec)].width,
+                    'height': renditions[(image.pk, spec)].height,
+                })
+                for spec in self.options.renditions
+            )
+        return data
+
+    def represent_object(self, obj):
+        data = {'title': force_text(getattr(obj, 'title', obj))}
+        if hasattr(obj, 'url'):
+            data['url'] = obj.url
+        return data
+
+
+def get_stream_representation(stream_block, raw, options):
+    representation = StreamRepresentation(options)
+    data = representation.represent(stream_block, raw)
+    representation.resolve()
+    return data
+
+
+class GridStreamField(StreamField):
+    """
+    Serializes StreamField values from their stored JSON with bulk resolved
+    choosers. The result is cached per page render version and content.
+    """
+    def get_attribute(self, instance):
+        return instance, super(GridStreamField, self).get_attribute(instance)
+
+    def to_representation(self, value):
+        page, value = value
+        request = self.context.get('request')
+        options = RepresentationOptions.from_request(request)
+        raw = get_raw_stream(page, page._meta.get_field(self.source))
+
+        cache = get_fragment_cache({'request': request})
+        if cache is not None:
+            digest = hashlib.sha1(json.dumps(
+                raw, sort_keys=True, cls=DjangoJSONEncoder).encode('utf-8'))
+            render_version = PageRenderVersion.objects.filter(
+                page_id=page.pk).values_list('version', flat=True).first()
+            key = 'uwkm_streamfields:api:%s.%s:%s:%s:%s' % (
+                page.pk, render_version or 0, self.source,
+                digest.hexdigest(), options.get_key())
+            data = cache.get(key)
+            if data is not None:
+                return data
+
+        data = get_stream_representation(value.stream_block, raw, options)
+        if cache is not None:
+            cache.set(key, data, get_setting('STREAMFIELDS_CACHE_TIMEOUT'))
+        return data
+
+
+class GridPageSerializer(PageSerializer):
+    serializer_field_mapping = PageSerializer.serializer_field_mapping.copy()
+    serializer_field_mapping.update({
+        wagtailcore_fields.StreamField: GridStreamField,
+    })
+
+
+class BlockIndexFilter(BaseFilterBackend):
+    """
+    Filters pages on the blocks they contain, looked up in the block index:
+    ?has_block=google_maps,video (any of the block types),
+    ?has_block_class=ButtonBlock and ?has_block_field=ext_link:https://...
+    (fields in STREAMFIELDS_INDEXED_FIELDS). Combined, they must hold for
+    the same block.
+    """
+    def filter_queryset(self, request, queryset, view):
+        block_types = [
+            block_type.strip() for block_type in request.GET.get('has_block', '').split(',')
+            if block_type.strip()]
+        block_class = request.GET.get('has_block_class') or None
+        fields = {}
+        for lookup in request.GET.getlist('has_block_field'):
+            name, separator, value = lookup.partition(':')
+            if not separator or name not in get_setting('STREAMFIELDS_INDEXED_FIELDS'):
+                raise BadRequestError(
+                    "has_block_field must be 'field:value' with an indexed field")
+            fields[name] = value
+        if not block_types and block_class is None and not fields:
+            return queryset
+
+        blocks = find_blocks(block_class=block_class, **fields)
+        if block_types:
+            blocks = blocks.filter(block_type__in=block_types)
+        return queryset.filter(pk__in=blocks.values('page_id'))
+
+
+class GridPagesAPIEndpoint(PagesAPIEndpoint):
+    base_serializer_class = GridPageSerializer
+    filter_backends = [BlockIndexFilter] + PagesAPIEndpoint.filter_backends
+    known_query_parameters = PagesAPIEndpoint.known_query_parameters.union([
+        'block_types',
+        'block_fields',
+        'renditions',
+        'has_block',
+        'has_block_class',
+        'has_block_field',
+    ])
+
+    def check_query_parameters(self, queryset):
+        super(GridPagesAPIEndpoint, self).check_query_parameters(queryset)
+        RepresentationOptions.from_request(self.request)
+
+    def detail_view(self, request, pk):
+        RepresentationOptions.from_request(request)
+        return super(GridPagesAPIEndpoint, self).detail_view(request, pk)
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class StreamfieldsConfig(AppConfig):
+    name = 'uwkm_streamfields'
+    verbose_name = 'UWKM Streamfields'
+
+    def ready(self):
+        from .signal_handlers import register_signal_handlers
+        register_signal_handlers()
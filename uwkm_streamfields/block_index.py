@@ -0,0 +1,100 @@
+from django.db import transaction
+from django.db.models import Count
+
+from wagtail.wagtailcore.blocks import BaseStreamBlock, BaseStructBlock
+
+from .conf import get_setting
+from .models import BlockInstance, BlockInstanceValue
+from .stream import walk_page
+
+SCALAR_TYPES = (bool, int, float, type(u''), type(''))
+
+
+def iter_block_instances(page):
+    """
+    Yield (path, block, raw value, block type, depth) for every child of a
+    StreamBlock and every StructBlock value in the stream data of a page.
+    """
+    stack = []  # (path, block type) of the enclosing instances
+    for path, block, raw, parent in walk_page(page):
+        while stack and path[:len(stack[-1][0])] != stack[-1][0]:
+            stack.pop()
+
+        is_stream_child = isinstance(parent, BaseStreamBlock)
+        if not is_stream_child and not isinstance(block, BaseStructBlock):
+            continue
+
+        if is_stream_child:
+            block_type = path[-1]
+        else:
+            block_type = stack[-1][1] if stack else ''
+        yield path, block, raw, block_type, len(stack)
+        stack.append((path, block_type))
+
+
+def update_block_index(page):
+    """Replace the indexed block instances of a live page."""
+    indexed_fields = get_setting('STREAMFIELDS_INDEXED_FIELDS')
+    instances = []
+    values = {}
+    for path, block, raw, block_type, depth in iter_block_instances(page):
+        path = '.'.join(path)[:255]
+        instances.append(BlockInstance(
+            page_id=page.pk,
+            block_type=block_type,
+            block_class=type(block).__name__,
+            path=path,
+            depth=depth,
+        ))
+        if isinstance(block, BaseStructBlock) and isinstance(raw, dict):
+            values[path] = [
+                (name, ('%s' % raw[name])[:255]) for name in indexed_fields
+                if isinstance(raw.get(name), SCALAR_TYPES)
+            ]
+
+    with transaction.atomic():
+        BlockInstance.objects.filter(page_id=page.pk).delete()
+        BlockInstance.objects.bulk_create(instances)
+        # bulk_create does not return ids on every database
+        ids = dict(BlockInstance.objects.filter(
+            page_id=page.pk).values_list('path', 'id'))
+        BlockInstanceValue.objects.bulk_create([
+            BlockInstanceValue(block_id=ids[path], name=name, value=value)
+            for path, fields in values.items()
+            for name, value in fields
+        ])
+
+
+def remove_block_index(page):
+    BlockInstance.objects.filter(page_id=page.pk).delete()
+
+
+def find_blocks(block_type=None, block_class=None, **fields):
+    """
+    Return the indexed block instances matching a block type, block class
+    and indexed field lookups, e.g.
+    find_blocks(block_class='ButtonBlock', ext_link__startswith='http').
+    """
+    queryset = BlockInstance.objects.all()
+    if block_type is not None:
+        queryset = queryset.filter(block_type=block_type)
+    if block_class is not None:
+        queryset = queryset.filter(block_class=block_class)
+    for lookup, value in fields.items():
+        name, _, operator = lookup.partition('__')
+        queryset = queryset.filter(**{
+            'values__name': name,
+            'values__value__%s' % (operator or 'exact'): value,
+        })
+    return queryset
+
+
+def get_block_usage():
+    """
+    Return the number of instances and of live pages per block type and
+    class, most used first.
+    """
+    return BlockInstance.objects.values('block_type', 'block_class').annotate(
+        instances=Count('id'),
+        pages=Count('page', distinct=True),
+    ).order_by('-instances')
@@ -1,20 +1,35 @@
+import threading
+
 from django.conf import settings
 
 from django import forms
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
 from django.db import models
+from django.forms.utils import ErrorList
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+from django.template.loader import render_to_string
 from django.utils.functional import cached_property
+from django.utils.html import format_html
 from django.utils.translation import ugettext_lazy as _
 
 from modelcluster.fields import ParentalKey
 
 from wagtail.contrib.table_block.blocks import TableBlock
 from wagtail.wagtailcore import blocks
+from wagtail.wagtailcore.blocks.stream_block import StreamBlockValidationError
 from wagtail.wagtailimages.blocks import ImageChooserBlock
 from wagtail.wagtailforms.models import AbstractEmailForm, AbstractFormField
 from wagtail.wagtaildocs.blocks import DocumentChooserBlock
 
+from .conf import get_setting
+from .encoding import compact
 from .icons import IconChoiceBlock
-from .widgets import ColorPickerWidget
+from .rendering import render_stream
+from .widgets import ColorPickerWidget, StoredTableInput
 
 TABLE_OPTIONS = {
     'minSpareRows': 0,
@@ -31,6 +46,19 @@ TABLE_OPTIONS = {
     'autoColumnSize': False,
 }
 
+TEMPLATE_EXTENSIONS = {
+    'django': 'html',
+    'jinja2': 'jinja2',
+}
+
+
+def streamfield_template(name, engine=None):
+    """
+    Return the name of a streamfields block template for the configured
+    STREAMFIELDS_TEMPLATE_ENGINE, or the given engine.
+    """
+    engine = engine or get_setting('STREAMFIELDS_TEMPLATE_ENGINE')
+    return 'streamfields/%s.%s' % (name, TEMPLATE_EXTENSIONS[engine])
 
 
 class ColorPickerBlock(blocks.FieldBlock):
@@ -38,6 +66,81 @@ class ColorPickerBlock(blocks.FieldBlock):
         self.field = forms.CharField(required=required, widget=ColorPickerWidget)
         super(ColorPickerBlock, self).__init__(**kwargs)
 
+    class Meta:
+        # what the widget submits when no color is chosen
+        default = ''
+
+
+class BulkImageListBlock(blocks.ListBlock):
+    """
+    ListBlock of images, or of StructBlocks with an image field, which can be
+    extended with many images at once from the admin, see views.py.
+    """
+    # bulk_key -> block
+    bulk_blocks = {}
+
+    def __init__(self, child_block, **kwargs):
+        super(BulkImageListBlock, self).__init__(child_block, **kwargs)
+        BulkImageListBlock.bulk_blocks[self.meta.bulk_key] = self
+
+    def expand_item(self, raw):
+        """Return the stored data of an item, which may be just an image id."""
+        if self.meta.image_field is not None and not isinstance(raw, dict):
+            return {self.meta.image_field: raw}
+        return raw
+
+    def to_python(self, value):
+        return [self.child_block.to_python(self.expand_item(item)) for item in value]
+
+    def get_image_item(self, image):
+        """Return a new list item holding the image."""
+        if self.meta.image_field is None:
+            return image
+        value = self.child_block.get_default()
+        value[self.meta.image_field] = image
+        return value
+
+    def render_form(self, value, prefix='', errors=None):
+        html = super(BulkImageListBlock, self).render_form(value, prefix, errors)
+        return format_html(
+            '{}<button type="button" class="button bicolor icon icon-image bulk-images"'
+            ' data-chooser-url="{}" data-list-url="{}" data-prefix="{}">{}</button>',
+            html,
+            reverse('uwkm_streamfields_bulk_images', args=[self.meta.bulk_key]),
+            reverse('uwkm_streamfields_bulk_image_list', args=[self.meta.bulk_key]),
+            prefix, _('Add images'))
+
+    class Meta:
+        bulk_key = None
+        # name of the image field of StructBlock children
+        image_field = None
+
+
+class PaginatedListBlock(blocks.ListBlock):
+    """
+    ListBlock rendering only its first STREAMFIELDS_LIST_PAGE_SIZE items, the
+    template gets a ListPage as list_page to load the next ones, see
+    listing.py. Lists with search_fields can be searched on those fields.
+    """
+    def get_context(self, value, parent_context=None):
+        from .listing import paginate_list
+
+        context = super(PaginatedListBlock, self).get_context(value, parent_context)
+        list_page = paginate_list(self, value, context)
+        context.update({
+            'self': list_page.items,
+            self.TEMPLATE_VAR: list_page.items,
+            'list_page': list_page,
+        })
+        return context
+
+    class Meta:
+        search_fields = ()
+
+
+class PaginatedBulkImageListBlock(PaginatedListBlock, BulkImageListBlock):
+    """BulkImageListBlock rendering its images a page at a time."""
+
 
 class AlignChoiceBlock(blocks.ChoiceBlock):
     choices = [
@@ -82,12 +185,23 @@ class MasonryGalleryBlock(blocks.StructBlock):
         required = False,
         help_text = 'Optional: how many pictures (from the pictures below) will be a "big picture".'
     )
-    image = blocks.ListBlock(
+    image = PaginatedBulkImageListBlock(
         ImageChooserBlock(),
+        bulk_key='masonry_gallery',
         icon='image',
         label=_('Image'),
+        template=streamfield_template('masonry_gallery_images'),
     )
 
+    def get_context(self, value, parent_context=None):
+        context = super(MasonryGalleryBlock, self).get_context(value, parent_context)
+        # the template of the image list lays them out by the gallery's fields
+        context['gallery'] = value
+        return context
+
+    class Meta:
+        template = streamfield_template('masonry_gallery_item')
+
 
 class SliderBlock(blocks.StructBlock):
     image = ImageChooserBlock()
@@ -475,6 +589,16 @@ class CallToActionBlock(blocks.StructBlock):
     button = ButtonBlock()
 
 
+class StoredTableChooserBlock(blocks.ChooserBlock):
+    """An imported table, see tables.py."""
+    widget = StoredTableInput()
+
+    @cached_property
+    def target_model(self):
+        from .models import StoredTable
+        return StoredTable
+
+
 class TableStructBlock(blocks.StructBlock):
     type_table = blocks.ChoiceBlock(
         choices = [(' ', 'Ordinary table'), ('price-table', 'Price table')],
@@ -527,6 +651,23 @@ class TableStructBlock(blocks.StructBlock):
         table_options=TABLE_OPTIONS,
         help_text='HTML is possible in the table'
     )
+    stored_table = StoredTableChooserBlock(
+        label=_('Imported table'),
+        required=False,
+    )
+
+    def get_context(self, value, parent_context=None):
+        context = super(TableStructBlock, self).get_context(value, parent_context)
+        stored_table = value.get('stored_table')
+        if stored_table is not None:
+            context['table'] = {
+                'data': stored_table.get_rows(),
+                'first_row_is_table_header': stored_table.first_row_is_table_header,
+                'first_col_is_header': stored_table.first_col_is_header,
+            }
+        else:
+            context['table'] = value.get('table') or {}
+        return context
 
 
 class ActionBlock(blocks.StructBlock):
@@ -618,137 +759,146 @@ class SubscribeBlock(blocks.StructBlock):
         required = True,
     )
 
+    class Meta:
+        # reported by export_streamfields_static
+        needs_request = True
+
 
 
 grid_array = \
     [('tables', TableStructBlock(
         label=_('Tables'),
-        template = 'streamfields/table.html',
+        template = streamfield_template('table'),
         icon='fa-table'))
     ,('quotes', blocks.ListBlock(
         QuoteBlock(),
         label=_('Quotes'),
-        template = 'streamfields/quotes.html',
+        template = streamfield_template('quotes'),
         icon="openquote",))
     ,('heads', blocks.ListBlock(
         HeaderBlock(),
         label=_('Heads'),
-        template = 'streamfields/header.html',
+        template = streamfield_template('header'),
         icon="title",))
     ,('text_fields', blocks.ListBlock(
         TextFieldBlock(),
         label=_('Text fields'),
-        template = 'streamfields/text_field.html',
+        template = streamfield_template('text_field'),
         icon="fa-align-justify",))
     ,('list', blocks.ListBlock(
         UnorderedListBlock(),
         label=_('List'),
-        template = 'streamfields/list.html',
+        template = streamfield_template('list'),
         icon="list-ul"))
     ,('accordions', blocks.ListBlock(
         AccordionBlock(),
         label=_('accordions'),
-        template = 'streamfields/accordion.html',
+        template = streamfield_template('accordion'),
         icon='list-ol',))
     ,('tabs', blocks.ListBlock(
         TabBlock(),
         label=_('Tabs'),
-        template = 'streamfields/tab.html',
+        template = streamfield_template('tab'),
         icon='list-ol',))
     ,('verticale_tabs', blocks.ListBlock(
         TabBlock(),
         label=_('Verticale tabs'),
-        template = 'streamfields/vertical_tab.html',
+        template = streamfield_template('vertical_tab'),
         icon='list-ol',))
     ,('image_with_text', blocks.ListBlock(
         BackgroundBlock(),
         label=_('Image with text'),
-        template = 'streamfields/background_with_text.html',
+        template = streamfield_template('background_with_text'),
         icon='doc-full',))
     ,('colored_blocks', blocks.ListBlock(
         ColoredTextBlock(),
         label=_('Colored blocks'),
-        template = 'streamfields/colored_block.html',
+        template = streamfield_template('colored_block'),
         icon="doc-full-inverse",))
     ,('masonry_gallery', blocks.ListBlock(
         MasonryGalleryBlock(),
         label=_('masonry gallery'),
-        template = 'streamfields/masonry_gallery.html',
+        template = streamfield_template('masonry_gallery'),
         icon='fa-th',))
-    ,('owl_gallery', blocks.ListBlock(
+    ,('owl_gallery', BulkImageListBlock(
         OwlGalleryBlock(),
-        template = 'streamfields/owl_gallery.html',
+        bulk_key='owl_gallery',
+        image_field='image',
+        template = streamfield_template('owl_gallery'),
         icon='image',))
     ,('image', ImageChooserBlock(
-        template = 'streamfields/image.html',
+        template = streamfield_template('image'),
         label=_('Image'),
         icon='image'))
     ,('divider', blocks.ListBlock(
         DividerBlock(),
         label=_('Divider'),
-        template = 'streamfields/divider.html',
+        template = streamfield_template('divider'),
         icon="horizontalrule",))
     ,('html', blocks.ListBlock(
         HTMLBlock(),
         label=_('Html'),
-        template = 'streamfields/raw_html.html',
+        template = streamfield_template('raw_html'),
         icon="code",))
     ,('button', blocks.ListBlock(
         ButtonBlock(),
         label=_('Button'),
-        template = 'streamfields/button.html',
+        template = streamfield_template('button'),
         icon="fa-hand-pointer-o",))
     ,('video', blocks.ListBlock(
         VideoBlock(),
         label=_('Video'),
-        template = 'streamfields/video.html',
+        template = streamfield_template('video'),
         icon="media",))
     ,('icon', blocks.ListBlock(
         IconBlock(),
         label=_('Icon'),
-        template = 'streamfields/icon_block.html',
+        template = streamfield_template('icon_block'),
         icon="fa-font-awesome",))
     ,('call_to_action', blocks.ListBlock(
         CallToActionBlock(),
         label=_('CallToAction'),
-        template = 'streamfields/call_to_action.html',
+        template = streamfield_template('call_to_action'),
         icon="fa-reply",))
     ,('tab_slider', blocks.ListBlock(
         SliderBlock(),
         label=_('Tab Slider'),
-        template = 'streamfields/tab_slider.html',
+        template = streamfield_template('tab_slider'),
         icon="image"))
     ,('action', blocks.ListBlock(
         ActionBlock(),
         label=_('Action'),
-        template = 'streamfields/action.html',
+        template = streamfield_template('action'),
         icon="fa-exclamation"))
-    ,('logo_blocks', blocks.ListBlock(
+    ,('logo_blocks', PaginatedListBlock(
         LogoBlock(),
         label=_('Logo Blocks'),
-        template = 'streamfields/logo_block.html',
+        template = streamfield_template('logo_block'),
         icon="image"))
     ,('download_link', blocks.ListBlock(
         DownloadLinkBlock(),
-        template = 'streamfields/download_link.html',
+        template = streamfield_template('download_link'),
         icon='fa-download'))
-    ,('rev_slider', blocks.ListBlock(
+    ,('rev_slider', BulkImageListBlock(
         RevSliderBlock(),
-        template = 'streamfields/rev_slider.html',
+        bulk_key='rev_slider',
+        image_field='image',
+        template = streamfield_template('rev_slider'),
         icon="image"))
-    ,('collaborator', blocks.ListBlock(
+    ,('collaborator', PaginatedListBlock(
         CoworkerBlock(),
-        template = 'streamfields/coworker.html',
+        search_fields=('name', 'job_function', 'address'),
+        template = streamfield_template('coworker'),
         icon="fa-user-plus"))
-    ,('project', blocks.ListBlock(
+    ,('project', PaginatedListBlock(
         ProjectBlock(),
-        template = 'streamfields/project.html',
+        template = streamfield_template('project'),
         icon="fa-comments-o"))
     ,('google_maps', GoogleMapsBlock(
-        template = 'streamfields/google_maps.html',
+        template = streamfield_template('google_maps'),
         icon='fa-map-o'))
     ,('subscribe_form', SubscribeBlock(
-        template = 'streamfields/subscribe.html',
+        template = streamfield_template('subscribe'),
         icon='code'))
     ,]
 
@@ -779,27 +929,117 @@ if 'oscar_wagtail' in settings.INSTALLED_APPS:
     grid_array.append(
         ('product', blocks.ListBlock(
             ProductBlock(),
-            template = 'streamfields/product.html',
+            template = streamfield_template('product'),
             icon="fa-shopping-cart")
         ),
     )
 
-validated_grid_array = []
+def get_grid_array(streamfields='__all__', exclude_streamfields=()):
+    """
+    Return the entries of grid_array allowed by the given allowlist and
+    exclude list, in grid_array order.
+    """
+    return [
+        streamfield for streamfield in grid_array
+        if (streamfields == '__all__' or streamfield[0] in streamfields)
+        and streamfield[0] not in exclude_streamfields
+    ]
+
+
 STREAMFIELDS = settings.STREAMFIELDS
 EXCLUDE_STREAMFIELDS = settings.EXCLUDE_STREAMFIELDS
 
 # validate streamfields
-if STREAMFIELDS == '__all__':
-    if len(EXCLUDE_STREAMFIELDS) > 0:
-        for streamfield in grid_array:
-            if streamfield[0] not in EXCLUDE_STREAMFIELDS:
-                validated_grid_array.append(streamfield)
-    else:
-        validated_grid_array = grid_array
-else:
-    for streamfield in grid_array:
-        if streamfield[0] in STREAMFIELDS:
-            validated_grid_array.append(streamfield)
+validated_grid_array = get_grid_array(STREAMFIELDS, EXCLUDE_STREAMFIELDS)
+
+
+# The allowlist of the site being edited, set by
+# uwkm_streamfields.middleware.StreamfieldsSiteMiddleware.
+_active = threading.local()
+
+
+def activate_grid_block(grid_block):
+    _active.grid_block = grid_block
+
+
+def deactivate_grid_block():
+    _active.grid_block = None
+
+
+def get_active_grid_block():
+    return getattr(_active, 'grid_block', None)
+
+
+class GridContentBlock(blocks.StreamBlock):
+    """
+    StreamBlock for the content of a GridBlock. When a per-site GridBlock
+    variant is active, only the block types of that variant are offered in
+    the editor and accepted on save; rendering always knows every block type
+    so existing content keeps working.
+    """
+    def allowed_child_blocks(self):
+        grid_block = get_active_grid_block()
+        if grid_block is None:
+            return self.child_blocks.values()
+        allowed = grid_block.child_blocks['content'].child_blocks
+        if allowed is self.child_blocks:
+            return self.child_blocks.values()
+        return [
+            child_block for name, child_block in self.child_blocks.items()
+            if name in allowed
+        ]
+
+    def render_list_member(self, block_type_name, value, prefix, index, errors=None):
+        child_block = self.child_blocks[block_type_name]
+        child = child_block.bind(value, prefix="%s-value" % prefix, errors=errors)
+        return render_to_string('wagtailadmin/block_forms/stream_member.html', {
+            'child_blocks': self.allowed_child_blocks(),
+            'block_type_name': block_type_name,
+            'prefix': prefix,
+            'child': child,
+            'index': index,
+        })
+
+    def render_form(self, value, prefix='', errors=None):
+        error_dict = {}
+        if errors:
+            if len(errors) > 1:
+                raise TypeError('StreamBlock.render_form unexpectedly received multiple errors')
+            error_dict = errors.as_data()[0].params
+
+        if value is None:
+            value = self.get_default()
+        valid_children = [child for child in value if child.block_type in self.child_blocks]
+
+        list_members_html = [
+            self.render_list_member(child.block_type, child.value, "%s-%d" % (prefix, i), i,
+                                    errors=error_dict.get(i))
+            for (i, child) in enumerate(valid_children)
+        ]
+
+        return render_to_string('wagtailadmin/block_forms/stream.html', {
+            'prefix': prefix,
+            'list_members_html': list_members_html,
+            'child_blocks': self.allowed_child_blocks(),
+            'header_menu_prefix': '%s-before' % prefix,
+            'block_errors': error_dict.get(NON_FIELD_ERRORS),
+        })
+
+    def clean(self, value):
+        allowed = set(child_block.name for child_block in self.allowed_child_blocks())
+        errors = {}
+        for i, child in enumerate(value):
+            if child.block_type not in allowed:
+                errors[i] = ErrorList([ValidationError(
+                    _('%s is not available on this site.') % child.block.label
+                )])
+        if errors:
+            raise StreamBlockValidationError(block_errors=errors)
+
+        return super(GridContentBlock, self).clean(value)
+
+    def render_basic(self, value, context=None):
+        return render_stream(value, context=context)
 
 
 class GridBlock(blocks.StructBlock):
@@ -818,8 +1058,48 @@ class GridBlock(blocks.StructBlock):
         label = _('Classes'),
         help_text = _('The classes of the grid.'),
     )
-    content = blocks.StreamBlock(
+    content = GridContentBlock(
         validated_grid_array,
         label="Content"
     )
 
+    def get_prep_value(self, value):
+        # defaults are left out, see encoding.py
+        return compact(self, super(GridBlock, self).get_prep_value(value))
+
+
+_grid_blocks = {}
+_grid_blocks_lock = threading.Lock()
+
+
+def get_grid_block(streamfields='__all__', exclude_streamfields=()):
+    """
+    Return the GridBlock variant for an allowlist. Variants are built once
+    per distinct allowlist and shared; the child blocks themselves are the
+    instances from grid_array and are never copied.
+    """
+    if streamfields != '__all__':
+        streamfields = frozenset(streamfields)
+    key = (streamfields, frozenset(exclude_streamfields))
+    try:
+        return _grid_blocks[key]
+    except KeyError:
+        pass
+
+    with _grid_blocks_lock:
+        if key not in _grid_blocks:
+            _grid_blocks[key] = GridBlock(local_blocks=[
+                ('content', GridContentBlock(get_grid_array(*key), label="Content")),
+            ])
+    return _grid_blocks[key]
+
+
+def get_grid_block_for_site(site):
+    """
+    Return the GridBlock variant for the allowlist stored on the site's
+    StreamfieldsSettings.
+    """
+    from .models import StreamfieldsSettings
+    streamfields, exclude_streamfields = \
+        StreamfieldsSettings.for_site(site).get_streamfields()
+    return get_grid_block(streamfields, exclude_streamfields)
@@ -0,0 +1,260 @@
+"""
+Performance budgets of pages: the number of blocks, how deep they nest, the
+images and iframes, the estimated transfer weight of the images and the
+bytes of stream data, measured in one pass over the stored stream data.
+Pages with PerformanceBudgetMixin are checked while they are edited in the
+admin (see StreamfieldsSiteMiddleware): exceeding a warning limit adds a
+message after saving, exceeding an error limit is a validation error of the
+StreamField.
+"""
+import json
+import re
+import threading
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template.defaultfilters import filesizeformat
+from django.utils.translation import ugettext as _
+from django.utils.translation import ugettext_lazy
+
+from wagtail.wagtailcore.blocks import BaseStreamBlock, ListBlock
+from wagtail.wagtailimages import get_image_model
+from wagtail.wagtailimages.blocks import ImageChooserBlock
+
+from .conf import get_setting
+from .critical_css import read_template
+from .models import BUDGET_NAMES, StreamfieldsSettings
+from .renditions import get_block_filter_specs
+from .stream import get_raw_stream, get_stream_fields, walk
+from .tables import get_stored_table_bytes
+
+DESCRIPTIONS = {
+    'blocks': ugettext_lazy("%s blocks"),
+    'depth': ugettext_lazy("blocks nested %s levels deep"),
+    'images': ugettext_lazy("%s images"),
+    'iframes': ugettext_lazy("%s iframes"),
+    'transfer_bytes': ugettext_lazy("an estimated %s of images"),
+    'stream_bytes': ugettext_lazy("%s of block data"),
+}
+
+LOOPED_IFRAME_RE = re.compile(r'\{%-?\s*for\b.*?<iframe\b.*?\{%-?\s*endfor\b', re.DOTALL)
+RESIZE_RE = re.compile(r'^(max|min|fill|width|height)-(\d+)(?:x(\d+))?')
+
+# for images whose file size is unknown
+BYTES_PER_PIXEL = 0.25
+
+_active = threading.local()
+# template name -> iframes it renders: 0, 1 or ITEM_IFRAMES
+_iframe_templates = {}
+# one iframe per item of a ListBlock
+ITEM_IFRAMES = 'items'
+
+
+def activate_budgets(site):
+    """Check the budgets of the site's pages saved in this thread."""
+    _active.site = site
+    _active.checking = True
+    _active.warnings = []
+
+
+def deactivate_budgets():
+    _active.site = None
+    _active.checking = False
+    _active.warnings = []
+
+
+def pop_budget_warnings():
+    warnings = getattr(_active, 'warnings', [])
+    _active.warnings = []
+    return warnings
+
+
+def get_template_iframes(template):
+    if template not in _iframe_templates:
+        source = read_template(template)
+        if LOOPED_IFRAME_RE.search(source):
+            _iframe_templates[template] = ITEM_IFRAMES
+        else:
+            _iframe_templates[template] = 1 if '<iframe' in source else 0
+    return _iframe_templates[template]
+
+
+def count_iframes(block, raw):
+    """
+    Return the iframes the template of a block renders: one per item for
+    ListBlocks whose template loops over an iframe, else one if it has any.
+    """
+    template = getattr(block.meta, 'template', None)
+    if not template:
+        return 0
+    iframes = get_template_iframes(template)
+    if iframes == ITEM_IFRAMES:
+        return len(raw or ()) if isinstance(block, ListBlock) else 1
+    return iframes
+
+
+def measure_stream(block, raw, path=()):
+    """
+    Measure stored stream data, returning the measures and the (image id,
+    filter specs) of every chosen image for get_transfer_bytes(). The rows
+    of imported tables count as stream data.
+    """
+    from .blocks import GridContentBlock, StoredTableChooserBlock
+
+    block_filter_specs = get_block_filter_specs()
+    all_specs = set().union(*block_filter_specs.values())
+    measures = dict((name, 0) for name in BUDGET_NAMES)
+    images = []
+    # path -> number of streams it is nested in
+    depths = {}
+    grid_child = None
+    table_ids = set()
+    for child_path, child_block, child_raw, parent in walk(block, raw, path):
+        if parent is None:
+            depths[child_path] = 0
+            continue
+        if isinstance(parent, BaseStreamBlock):
+            # stream children add an index and a block type to the path
+            depth = depths[child_path[:-2]] + 1
+            measures['depth'] = max(measures['depth'], depth)
+        else:
+            depth = depths[child_path[:-1]]
+        depths[child_path] = depth
+        # a ListBlock counts as its items
+        if isinstance(parent, ListBlock) or (
+                isinstance(parent, BaseStreamBlock) and not isinstance(child_block, ListBlock)):
+            measures['blocks'] += 1
+
+        if isinstance(parent, GridContentBlock):
+            grid_child = child_path
+        measures['iframes'] += count_iframes(child_block, child_raw)
+        if isinstance(child_block, ImageChooserBlock) and child_raw:
+            measures['images'] += 1
+            if grid_child is not None and child_path[:len(grid_child)] == grid_child:
+                specs = block_filter_specs.get(grid_child[-1], all_specs)
+            else:
+                specs = all_specs
+            images.append((child_raw, specs))
+        elif isinstance(child_block, StoredTableChooserBlock) and child_raw:
+            table_ids.add(child_raw)
+
+    measures['stream_bytes'] = (
+        len(json.dumps(raw, cls=DjangoJSONEncoder)) + get_stored_table_bytes(table_ids))
+    return measures, images
+
+
+def estimate_size(spec, width, height):
+    """Return the (width, height) a filter spec resizes an image to."""
+    for operation in spec.split('|'):
+        match = RESIZE_RE.match(operation)
+        if match is None:
+            continue
+        method, a, b = match.group(1), int(match.group(2)), int(match.group(3) or 0)
+        if method == 'fill':
+            return min(a, width), min(b, height)
+        if method == 'max':
+            scale = min(float(a) / width, float(b) / height)
+        elif method == 'min':
+            scale = max(float(a) / width, float(b) / height)
+        elif method == 'width':
+            scale = float(a) / width
+        else:
+            scale = float(a) / height
+        scale = min(scale, 1)
+        return int(width * scale), int(height * scale)
+    return width, height
+
+
+def get_transfer_bytes(images):
+    """
+    Estimate the bytes of the renditions of images, from the size of the
+    existing renditions or else from their filter specs, and the bytes per
+    pixel of the original files. The largest rendition of each image counts.
+    """
+    image_ids = set(image_id for image_id, specs in images)
+    if not image_ids:
+        return 0
+    Image = get_image_model()
+    originals = dict(
+        (pk, (width, height, file_size))
+        for pk, width, height, file_size in Image.objects.filter(
+            pk__in=image_ids).values_list('pk', 'width', 'height', 'file_size'))
+    rendered = dict(
+        ((image_id, spec), (width, height))
+        for image_id, spec, width, height in Image.get_rendition_model().objects.filter(
+            image_id__in=image_ids).values_list('image_id', 'filter_spec', 'width', 'height'))
+
+    total = 0
+    for image_id, specs in images:
+        if image_id not in originals:
+            continue
+        width, height, file_size = originals[image_id]
+        if not width or not height:
+            continue
+        pixels = max(
+            rendition_width * rendition_height
+            for rendition_width, rendition_height in (
+                rendered.get((image_id, spec)) or estimate_size(spec, width, height)
+                for spec in specs or ['original']))
+        bytes_per_pixel = float(file_size) / (width * height) if file_size else BYTES_PER_PIXEL
+        total += int(pixels * bytes_per_pixel)
+    return total
+
+
+def format_value(name, value):
+    return filesizeformat(value) if name.endswith('_bytes') else value
+
+
+def check_budgets(page, budgets, exclude=()):
+    """
+    Measure the StreamFields of a page against budgets (name -> (warning
+    limit, error limit)), returning the warnings and the errors by the
+    StreamField that contributes most.
+    """
+    field_measures = {}
+    for field in get_stream_fields(type(page)):
+        if field.name in exclude:
+            continue
+        measures, images = measure_stream(
+            field.stream_block, get_raw_stream(page, field), (field.name,))
+        if budgets.get('transfer_bytes', (None, None)) != (None, None):
+            measures['transfer_bytes'] = get_transfer_bytes(images)
+        field_measures[field.name] = measures
+    if not field_measures:
+        return [], {}
+
+    warnings = []
+    errors = {}
+    for name in BUDGET_NAMES:
+        warning_limit, error_limit = budgets.get(name, (None, None))
+        combine = max if name == 'depth' else sum
+        value = combine(measures[name] for measures in field_measures.values())
+        if error_limit is not None and value > error_limit:
+            field_name = max(field_measures, key=lambda field_name: field_measures[field_name][name])
+            errors.setdefault(field_name, []).append(_("The page has %(measure)s, the limit is %(limit)s.") % {
+                'measure': DESCRIPTIONS[name] % format_value(name, value),
+                'limit': format_value(name, error_limit)})
+        elif warning_limit is not None and value > warning_limit:
+            warnings.append(_("The page has %(measure)s, more than the recommended %(limit)s.") % {
+                'measure': DESCRIPTIONS[name] % format_value(name, value),
+                'limit': format_value(name, warning_limit)})
+    return warnings, errors
+
+
+def check_page_budgets(page, exclude=()):
+    """
+    Check the budgets of a page being edited, returning the errors by
+    StreamField and keeping the warnings for pop_budget_warnings(). Nothing
+    is checked outside of activate_budgets().
+    """
+    if not getattr(_active, 'checking', False):
+        return {}
+    if _active.site is not None:
+        budgets = StreamfieldsSettings.for_site(_active.site).get_budgets()
+    else:
+        budgets = get_setting('STREAMFIELDS_BUDGETS')
+    warnings, errors = check_budgets(page, budgets, exclude)
+    # pages are cleaned again when their revision is saved and published
+    for warning in warnings:
+        if warning not in _active.warnings:
+            _active.warnings.append(warning)
+    return errors
@@ -0,0 +1,11 @@
+from django.conf import settings
+
+from .settings import base
+
+
+def get_setting(name):
+    """
+    Return a streamfields setting from the project settings, falling back to
+    the default in uwkm_streamfields.settings.base.
+    """
+    return getattr(settings, name, getattr(base, name))
@@ -0,0 +1,416 @@
+"""
+Purging of the block stylesheets (STREAMFIELDS_CRITICAL_CSS_SOURCES) down to
+the selectors the block templates can produce, and critical CSS per block
+type. Pages inline the rules of the block types in their first GridBlock
+sections and load the purged stylesheet asynchronously.
+
+A selector is kept for a block type when every class and id it names occurs
+in the templates of the block (literally, or as the fixed part of a class
+built from a variable like fa-{{ icon }}), in its choices or in
+STREAMFIELDS_CRITICAL_CSS_TEMPLATES. Selectors naming only elements are
+always kept. Classes added by scripts are kept in the purged stylesheet when
+they match STREAMFIELDS_CRITICAL_CSS_SAFELIST.
+"""
+import hashlib
+import io
+import json
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+from django.utils.six.moves.urllib.parse import urljoin
+
+from wagtail.wagtailcore import blocks
+
+from .conf import get_setting
+from .models import PurgedStylesheet
+from .rendering import get_fragment_cache, minify_css
+from .stream import walk_page
+
+CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+CSS_URL_RE = re.compile(r'''url\(\s*(["']?)([^"')]+)\1\s*\)''', re.IGNORECASE)
+AT_RULE_RE = re.compile(r'@([\w-]+)')
+NESTING_AT_RULES = ('media', 'supports', 'document', '-moz-document')
+
+SELECTOR_IGNORED_RE = re.compile(r'\[[^\]]*\]|::?[\w-]+(?:\([^)]*\))?')
+SELECTOR_CLASS_RE = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+SELECTOR_ID_RE = re.compile(r'#(-?[_a-zA-Z][\w-]*)')
+
+TEMPLATE_TAG_RE = re.compile(r'\{%.*?%\}|\{#.*?#\}', re.DOTALL)
+TEMPLATE_VARIABLE_RE = re.compile(r'\{\{.*?\}\}', re.DOTALL)
+ATTRIBUTE_RE = re.compile(r'''\b(class|id)\s*=\s*(["'])(.*?)\2''', re.IGNORECASE | re.DOTALL)
+# stands for the output of a template variable within an attribute
+VARIABLE = '\x00'
+
+CACHE_KEY = 'uwkm_streamfields:purged_stylesheet'
+
+
+class Vocabulary(object):
+    """The classes and ids a set of templates can produce."""
+    def __init__(self):
+        self.names = {'class': set(), 'id': set()}
+        self.patterns = {'class': [], 'id': []}
+
+    def add_names(self, kind, value):
+        for token in value.split():
+            if VARIABLE not in token:
+                self.names[kind].add(token)
+                continue
+            pieces = token.split(VARIABLE)
+            if any(pieces):
+                self.patterns[kind].append(re.compile(
+                    '^%s$' % '.*'.join(re.escape(piece) for piece in pieces)))
+
+    def add_template(self, source):
+        markup = TEMPLATE_TAG_RE.sub(' ', source)
+        markup = TEMPLATE_VARIABLE_RE.sub(VARIABLE, markup)
+        for kind, quote, value in ATTRIBUTE_RE.findall(markup):
+            self.add_names(kind.lower(), value)
+
+    def update(self, other):
+        for kind in ('class', 'id'):
+            self.names[kind] |= other.names[kind]
+            self.patterns[kind].extend(other.patterns[kind])
+
+    def has(self, kind, name):
+        return name in self.names[kind] or any(
+            pattern.match(name) for pattern in self.patterns[kind])
+
+    def matches(self, requirements):
+        classes, ids = requirements
+        return all(self.has('class', name) for name in classes) and \
+            all(self.has('id', name) for name in ids)
+
+
+def get_requirements(selector):
+    """Return the classes and ids an element tree needs to match a selector."""
+    selector = SELECTOR_IGNORED_RE.sub('', selector)
+    return (
+        set(SELECTOR_CLASS_RE.findall(selector)),
+        set(SELECTOR_ID_RE.findall(selector)),
+    )
+
+
+def find_block_end(css, start):
+    """Return the index of the brace closing the block starting at start."""
+    depth = 1
+    quote = None
+    i = start
+    while i < len(css):
+        char = css[i]
+        if quote is not None:
+            if char == '\\':
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return len(css)
+
+
+def parse_css(css, media=(), rules=None, imports=None):
+    """
+    Return the (media, selectors, body, is_style_rule) of every rule of a
+    stylesheet, in order, and its @import rules. media holds the preludes of
+    the @media and @supports rules around a rule; other at-rules (@font-face,
+    @keyframes) are returned whole with their prelude as the selector.
+    """
+    if rules is None:
+        rules, imports = [], []
+        css = CSS_COMMENT_RE.sub('', css)
+    pos = 0
+    while True:
+        brace = css.find('{', pos)
+        semicolon = css.find(';', pos)
+        if 0 <= semicolon < brace or (brace == -1 and semicolon != -1):
+            statement = css[pos:semicolon].strip().lstrip(';').strip()
+            if statement.lower().startswith('@import'):
+                imports.append(statement + ';')
+            if statement.startswith('@') or brace == -1:
+                pos = semicolon + 1
+                continue
+        if brace == -1:
+            break
+        prelude = css[pos:brace].strip().lstrip(';').strip()
+        end = find_block_end(css, brace + 1)
+        body = css[brace + 1:end].strip()
+        pos = end + 1
+
+        at_rule = AT_RULE_RE.match(prelude)
+        if at_rule is not None and at_rule.group(1).lower() in NESTING_AT_RULES:
+            parse_css(body, media + (prelude,), rules, imports)
+        elif at_rule is not None:
+            rules.append((media, [prelude], body, False))
+        elif prelude:
+            selectors = [selector.strip() for selector in prelude.split(',') if selector.strip()]
+            rules.append((media, selectors, body, True))
+    return rules, imports
+
+
+def absolute_urls(css, path):
+    """Make the relative urls in a static stylesheet absolute."""
+    def replace(match):
+        quote, url = match.groups()
+        url = url.strip()
+        if url.startswith(('data:', '/', '#')) or '://' in url:
+            return match.group(0)
+        suffix = ''
+        for separator in ('#', '?'):
+            if separator in url:
+                url, rest = url.split(separator, 1)
+                suffix = separator + rest + suffix
+        name = posixpath.normpath(posixpath.join(posixpath.dirname(path), url))
+        try:
+            url = staticfiles_storage.url(name)
+        except ValueError:
+            # not in the manifest
+            url = urljoin(settings.STATIC_URL, name)
+        return 'url(%s%s%s%s)' % (quote, url, suffix, quote)
+    return CSS_URL_RE.sub(replace, css)
+
+
+def iter_blocks(block):
+    yield block
+    children = list(getattr(block, 'child_blocks', {}).values())
+    if getattr(block, 'child_block', None) is not None:
+        children.append(block.child_block)
+    for child in children:
+        for descendant in iter_blocks(child):
+            yield descendant
+
+
+def read_template(name):
+    try:
+        template = get_template(name)
+    except TemplateDoesNotExist:
+        return ''
+    with io.open(template.origin.name, encoding='utf-8') as f:
+        return f.read()
+
+
+def get_block_vocabulary(block_type, block):
+    """Return the classes and ids the templates and choices of a block produce."""
+    vocabulary = Vocabulary()
+    # every block is wrapped in one by render_stream()
+    vocabulary.add_names('class', 'block-%s' % block_type)
+    for descendant in iter_blocks(block):
+        template = getattr(descendant.meta, 'template', None)
+        if template:
+            vocabulary.add_template(read_template(template))
+        if isinstance(descendant, blocks.ChoiceBlock):
+            for value, label in descendant.field.choices:
+                # option groups hold (value, label) pairs
+                values = [choice[0] for choice in label] \
+                    if isinstance(label, (list, tuple)) else [value]
+                for value in values:
+                    vocabulary.add_names('class', '%s' % value)
+    return vocabulary
+
+
+def get_page_vocabulary():
+    vocabulary = Vocabulary()
+    for name in get_setting('STREAMFIELDS_CRITICAL_CSS_TEMPLATES'):
+        vocabulary.add_template(read_template(name))
+    return vocabulary
+
+
+def purge(rules, vocabularies, safelist):
+    """
+    Return the rules any vocabulary or the safelist needs, with only their
+    needed selectors, and by vocabulary the selectors it needs per rule.
+    Vocabulary '' gets the selectors naming no class or id.
+    """
+    everything = Vocabulary()
+    for vocabulary in vocabularies.values():
+        everything.update(vocabulary)
+    everything.patterns['class'].extend(re.compile(pattern) for pattern in safelist)
+
+    purged = []
+    critical = dict((name, {}) for name in vocabularies)
+    for media, selectors, body, is_style_rule in rules:
+        if not is_style_rule:
+            purged.append((media, selectors, body))
+            continue
+        kept = []
+        for selector in selectors:
+            requirements = get_requirements(selector)
+            if not everything.matches(requirements):
+                continue
+            index = len(kept)
+            kept.append(selector)
+            if any(requirements):
+                names = [name for name, vocabulary in vocabularies.items()
+                         if vocabulary.matches(requirements)]
+            else:
+                names = ['']
+            for name in names:
+                critical[name].setdefault(str(len(purged)), []).append(index)
+        if kept:
+            purged.append((media, kept, body))
+    return purged, critical
+
+
+def render_rules(rules, selected=None):
+    """
+    Return the CSS of rules, only with the selected selectors (rule index ->
+    selector indexes) when given.
+    """
+    output = []
+    current = ()
+    for i, (media, selectors, body) in enumerate(rules):
+        if selected is not None:
+            indexes = selected.get(str(i))
+            if not indexes:
+                continue
+            selectors = [selectors[index] for index in indexes]
+        media = tuple(media)
+        common = 0
+        while common < min(len(current), len(media)) and current[common] == media[common]:
+            common += 1
+        output.append('}' * (len(current) - common))
+        output.extend('%s{' % prelude for prelude in media[common:])
+        output.append('%s{%s}' % (','.join(selectors), body))
+        current = media
+    output.append('}' * len(current))
+    return minify_css(''.join(output))
+
+
+def build_purged_stylesheet():
+    """
+    Purge the block stylesheets, write the purged stylesheet and record it
+    with the critical rules of each block type as the current
+    PurgedStylesheet.
+    """
+    from .blocks import grid_array
+
+    rules = []
+    imports = []
+    for path in get_setting('STREAMFIELDS_CRITICAL_CSS_SOURCES'):
+        with io.open(finders.find(path), encoding='utf-8') as f:
+            source_rules, source_imports = parse_css(absolute_urls(f.read(), path))
+        rules.extend(source_rules)
+        imports.extend(source_imports)
+
+    vocabularies = {'': get_page_vocabulary()}
+    for block_type, block in grid_array:
+        vocabularies[block_type] = get_block_vocabulary(block_type, block)
+    rules, critical = purge(rules, vocabularies, get_setting('STREAMFIELDS_CRITICAL_CSS_SAFELIST'))
+
+    css = ''.join(imports) + render_rules(rules)
+    name = default_storage.save(
+        '%s/streamfields-%s.css' % (
+            get_setting('STREAMFIELDS_CRITICAL_CSS_PATH').rstrip('/'),
+            hashlib.sha1(css.encode('utf-8')).hexdigest()[:12]),
+        ContentFile(css.encode('utf-8')))
+
+    purged_stylesheet = PurgedStylesheet.objects.create(
+        stylesheet=name, rules=json.dumps({'rules': rules, 'critical': critical}))
+    cache.delete(CACHE_KEY)
+    return purged_stylesheet
+
+
+def get_purged_stylesheet():
+    """Return the current PurgedStylesheet without its rules, or None."""
+    purged_stylesheet = cache.get(CACHE_KEY)
+    if purged_stylesheet is None:
+        purged_stylesheet = PurgedStylesheet.objects.defer('rules').order_by(
+            '-pk').first() or False
+        cache.set(CACHE_KEY, purged_stylesheet, None)
+    return purged_stylesheet or None
+
+
+def get_critical_css(purged_stylesheet, block_types):
+    """Return the critical CSS of the given block types, cached per combination."""
+    block_types = sorted(set(block_types))
+    key = 'uwkm_streamfields:critical_css:%s:%s' % (
+        purged_stylesheet.pk,
+        hashlib.sha1(','.join(block_types).encode('utf-8')).hexdigest())
+    css = cache.get(key)
+    if css is None:
+        data = json.loads(PurgedStylesheet.objects.filter(
+            pk=purged_stylesheet.pk).values_list('rules', flat=True).get())
+        selected = {}
+        for name in [''] + block_types:
+            for index, selectors in data['critical'].get(name, {}).items():
+                selected.setdefault(index, set()).update(selectors)
+        css = render_rules(data['rules'], dict(
+            (index, sorted(selectors)) for index, selectors in selected.items()))
+        cache.set(key, css, get_setting('STREAMFIELDS_CACHE_TIMEOUT'))
+    return css
+
+
+def compute_critical_block_types(page):
+    """Return the block types of the first STREAMFIELDS_CRITICAL_CSS_SECTIONS GridBlocks of a page."""
+    from .blocks import GridContentBlock
+
+    sections = []
+    block_types = set()
+    for path, block, raw, parent in walk_page(page):
+        if not isinstance(parent, GridContentBlock):
+            continue
+        # path ends with the index and type of the block within its GridBlock
+        if path[:-2] not in sections:
+            if len(sections) == get_setting('STREAMFIELDS_CRITICAL_CSS_SECTIONS'):
+                break
+            sections.append(path[:-2])
+        block_types.add(path[-1])
+    return sorted(block_types)
+
+
+def get_critical_block_types(page, request=None):
+    """Return the critical block types of a live page, cached per render version."""
+    fragment_cache = get_fragment_cache({'request': request})
+    if fragment_cache is None:
+        return compute_critical_block_types(page)
+
+    from .models import PageRenderVersion
+    render_version = PageRenderVersion.objects.filter(
+        page_id=page.pk).values_list('version', flat=True).first()
+    key = 'uwkm_streamfields:critical_blocks:%s.%s' % (page.pk, render_version or 0)
+    block_types = fragment_cache.get(key)
+    if block_types is None:
+        block_types = compute_critical_block_types(page)
+        fragment_cache.set(key, block_types, get_setting('STREAMFIELDS_CACHE_TIMEOUT'))
+    return block_types
+
+
+def render_stylesheets(context):
+    """
+    Return the block stylesheets of a page: its critical CSS inlined and the
+    purged stylesheet loaded asynchronously, or the unpurged stylesheets
+    until build_streamfields_critical_css ran.
+    """
+    purged_stylesheet = get_purged_stylesheet()
+    if purged_stylesheet is None:
+        return format_html_join('\n', '<link href="{}" type="text/css" rel="stylesheet" />', (
+            (static(path),) for path in get_setting('STREAMFIELDS_CRITICAL_CSS_SOURCES')))
+
+    url = default_storage.url(purged_stylesheet.stylesheet)
+    page = context.get('page')
+    if getattr(page, 'pk', None) is None:
+        return format_html('<link href="{}" type="text/css" rel="stylesheet" />', url)
+
+    critical_css = get_critical_css(
+        purged_stylesheet, get_critical_block_types(page, context.get('request')))
+    return mark_safe(
+        '<style>%s</style>\n' % critical_css.replace('</', '<\\/') +
+        format_html(
+            '<link href="{0}" rel="preload" as="style" onload="this.onload=null;this.rel=\'stylesheet\'" />\n'
+            '<noscript><link href="{0}" type="text/css" rel="stylesheet" /></noscript>', url))
@@ -0,0 +1,79 @@
+"""
+Compact storage of GridBlock data: struct fields holding their default value
+are left out, Wagtail's StructBlock.to_python() puts the defaults back, and
+lists of image-only StructBlocks are stored as lists of image ids, see
+BulkImageListBlock.
+"""
+from wagtail.wagtailcore.blocks import BaseStreamBlock, BaseStructBlock, ListBlock
+
+
+def get_prep_default(block):
+    """Return the stored form of a block's default value, memoized on the block."""
+    try:
+        return block._prep_default
+    except AttributeError:
+        block._prep_default = block.get_prep_value(block.get_default())
+        return block._prep_default
+
+
+def compact(block, raw):
+    """Return the compact form of the stored data of a block."""
+    if raw is None:
+        return raw
+
+    if isinstance(block, BaseStreamBlock):
+        return [
+            dict(child, value=compact(block.child_blocks[child['type']], child['value']))
+            if child['type'] in block.child_blocks else child
+            for child in raw
+        ]
+
+    if isinstance(block, ListBlock):
+        expand_item = getattr(block, 'expand_item', lambda item: item)
+        items = [compact(block.child_block, expand_item(item)) for item in raw]
+        image_field = getattr(block.meta, 'image_field', None)
+        if image_field is not None and all(
+                isinstance(item, dict) and set(item) <= set([image_field])
+                for item in items):
+            return [item.get(image_field) for item in items]
+        return items
+
+    if isinstance(block, BaseStructBlock):
+        data = {}
+        for name, value in raw.items():
+            child_block = block.child_blocks.get(name)
+            if child_block is None:
+                data[name] = value
+            elif value != get_prep_default(child_block):
+                data[name] = compact(child_block, value)
+        return data
+
+    return raw
+
+
+def compact_stream(block, raw):
+    """
+    Compact the GridBlocks within the stored data of a StreamField, leaving
+    the rest as it is.
+    """
+    from .blocks import GridBlock
+
+    if raw is None:
+        return raw
+    if isinstance(block, GridBlock):
+        return compact(block, raw)
+    if isinstance(block, BaseStreamBlock):
+        return [
+            dict(child, value=compact_stream(block.child_blocks[child['type']], child['value']))
+            if child['type'] in block.child_blocks else child
+            for child in raw
+        ]
+    if isinstance(block, ListBlock):
+        return [compact_stream(block.child_block, item) for item in raw]
+    if isinstance(block, BaseStructBlock):
+        return dict(
+            (name, compact_stream(block.child_blocks[name], value))
+            if name in block.child_blocks else (name, value)
+            for name, value in raw.items()
+        )
+    return raw
@@ -0,0 +1,199 @@
+"""
+Static HTML export of live pages, see the export_streamfields_static command.
+Pages render through the Django test client, so all middleware applies. The
+static files and media they reference are copied next to them and their
+urls rewritten for the url the export is served from.
+"""
+import errno
+import os
+import posixpath
+import re
+import shutil
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.storage import default_storage
+from django.test import Client
+from django.utils.six.moves.urllib.parse import unquote, urlsplit
+
+from .mixins import get_etag
+from .models import PageRenderVersion, StreamfieldsSettings
+from .stream import walk_page
+
+# WSGI environ key set on export requests; paginated lists render all items
+EXPORT_ENVIRON_KEY = 'uwkm_streamfields.static_export'
+
+URL_ATTRIBUTE_RE = re.compile(
+    r'''(\s(?:src|href|srcset|poster|action|data-src|data-lazy|data-lazyload)\s*=\s*)(["'])(.*?)\2''',
+    re.IGNORECASE | re.DOTALL)
+CSS_URL_RE = re.compile(r'''url\(\s*(["']?)([^"')]+)\1\s*\)''', re.IGNORECASE)
+
+
+def get_page_signatures(page_ids, site):
+    """
+    Return the ETag of every page by id, None for pages published before
+    the render versions were tracked. A page is exported again when its
+    signature changes.
+    """
+    settings_version = StreamfieldsSettings.for_site(site).version
+    signatures = dict((page_id, None) for page_id in page_ids)
+    for render_version in PageRenderVersion.objects.filter(page_id__in=list(page_ids)):
+        signatures[render_version.page_id] = get_etag(
+            render_version.page_id, render_version, settings_version)
+    return signatures
+
+
+def get_request_blocks(page):
+    """Return the block types of a page which do not work without Django."""
+    return sorted(set(
+        path[-1] for path, block, raw, parent in walk_page(page)
+        if getattr(block.meta, 'needs_request', False) and parent is not None
+    ))
+
+
+def makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+class StaticExporter(object):
+    def __init__(self, site, output_dir, base_url='/'):
+        self.site = site
+        self.output_dir = output_dir
+        self.base_url = base_url.rstrip('/') + '/'
+        self.prefixes = [
+            (settings.STATIC_URL, 'static'),
+            (settings.MEDIA_URL, 'media'),
+        ]
+
+    def get_page_path(self, page):
+        """Return the file a page is exported to, relative to the output directory."""
+        url = page.relative_url(self.site) or '/'
+        return posixpath.join(url.lstrip('/'), 'index.html')
+
+    def rewrite_url(self, url, assets):
+        """
+        Return the url within the export, recording the static files and
+        media it points to in assets.
+        """
+        if url.startswith(self.site.root_url + '/'):
+            url = url[len(self.site.root_url):]
+        for prefix, kind in self.prefixes:
+            if prefix and url.startswith(prefix) and not url.startswith('//'):
+                name = unquote(urlsplit(url[len(prefix):]).path)
+                assets.add((kind, name))
+                return '%s%s/%s' % (self.base_url, kind, url[len(prefix):])
+        if url.startswith('/') and not url.startswith('//'):
+            return self.base_url + url[1:]
+        return url
+
+    def rewrite(self, html):
+        """Return the html with its urls rewritten and the assets it references."""
+        assets = set()
+
+        def replace_attribute(match):
+            prefix, quote, value = match.groups()
+            if prefix.strip().lower().startswith('srcset'):
+                value = ', '.join(
+                    ' '.join([self.rewrite_url(candidate.split()[0], assets)] + candidate.split()[1:])
+                    for candidate in value.split(',') if candidate.strip())
+            else:
+                value = self.rewrite_url(value, assets)
+            return '%s%s%s%s' % (prefix, quote, value, quote)
+
+        def replace_css_url(match):
+            quote, value = match.groups()
+            return 'url(%s%s%s)' % (quote, self.rewrite_url(value, assets), quote)
+
+        html = URL_ATTRIBUTE_RE.sub(replace_attribute, html)
+        html = CSS_URL_RE.sub(replace_css_url, html)
+        return html, assets
+
+    def render_page(self, page):
+        """Render a page like an anonymous visitor would see it."""
+        client = Client(HTTP_HOST=self.site.hostname if self.site.port in (80, 443)
+                        else '%s:%s' % (self.site.hostname, self.site.port))
+        return client.get(
+            page.relative_url(self.site) or '/', secure=self.site.port == 443,
+            **{EXPORT_ENVIRON_KEY: True})
+
+    def export_page(self, page):
+        """
+        Render a page to its file, returning a dict with its path, the assets
+        it references and the problems found.
+        """
+        result = {
+            'path': self.get_page_path(page),
+            'assets': [],
+            'warnings': [],
+            'error': None,
+        }
+        request_blocks = get_request_blocks(page)
+        if request_blocks:
+            result['warnings'].append(
+                "%s needs a request: %s" % (page.url_path, ', '.join(request_blocks)))
+
+        response = self.render_page(page)
+        if response.status_code != 200:
+            result['error'] = "%s responded with %d" % (page.url_path, response.status_code)
+            return result
+
+        html, assets = self.rewrite(response.content.decode(response.charset))
+        path = os.path.join(self.output_dir, result['path'])
+        makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(html.encode('utf-8'))
+        result['assets'] = sorted(assets)
+        return result
+
+    def open_asset(self, kind, name):
+        if kind == 'media':
+            return default_storage.open(name)
+        if staticfiles_storage.exists(name):
+            return staticfiles_storage.open(name)
+        path = finders.find(name)
+        return open(path, 'rb') if path else None
+
+    def copy_asset(self, kind, name, force=False):
+        """
+        Copy a static file or media file into the export, with the files a
+        stylesheet references. Return the names of the files missing.
+        """
+        target = os.path.join(self.output_dir, kind, *name.split('/'))
+        if not force and os.path.exists(target):
+            return []
+        try:
+            source = self.open_asset(kind, name)
+        except (IOError, OSError):
+            source = None
+        if source is None:
+            return ['%s/%s' % (kind, name)]
+
+        makedirs(os.path.dirname(target))
+        with source, open(target, 'wb') as f:
+            shutil.copyfileobj(source, f)
+
+        missing = []
+        if name.endswith('.css'):
+            with open(target, 'rb') as f:
+                css = f.read().decode('utf-8', 'replace')
+            for quote, url in CSS_URL_RE.findall(css):
+                url = urlsplit(url.strip())
+                if url.scheme or url.netloc or not url.path or url.path.startswith('/'):
+                    continue
+                referenced = posixpath.normpath(
+                    posixpath.join(posixpath.dirname(name), unquote(url.path)))
+                if not referenced.startswith('..'):
+                    missing.extend(self.copy_asset(kind, referenced, force))
+        return missing
+
+    def remove_page(self, path):
+        try:
+            os.remove(os.path.join(self.output_dir, path))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
@@ -0,0 +1,144 @@
+import hashlib
+import json
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+
+from wagtail.wagtailimages import get_image_model
+from wagtail.wagtailimages.models import Filter
+
+from .conf import get_setting
+from .icon_subset import get_icon_subset
+from .icons import IconChoiceBlock
+from .rendering import get_fragment_cache
+from .stream import walk_page
+
+PRELOAD_TYPES = {
+    'css': 'style',
+    'js': 'script',
+    'woff2': 'font',
+}
+
+
+# see get_static_version()
+_static_versions = {}
+
+
+def get_hero_image(block_type, raw):
+    """Return the first image of a hero block and its filter spec."""
+    field, filter_spec = get_setting('STREAMFIELDS_HERO_BLOCKS')[block_type]
+    if isinstance(raw, list):
+        raw = raw[0] if raw else {}
+    # compactly stored slides are image ids, see BulkImageListBlock
+    image_id = raw.get(field) if isinstance(raw, dict) else raw
+    return get_image_model().objects.filter(pk=image_id).first(), filter_spec
+
+
+def get_hero_image_url(image, filter_spec):
+    """
+    Return the url of an image or of its existing rendition, None while the
+    rendition was not generated yet: the page generates it as it renders.
+    """
+    if filter_spec is None:
+        return image.file.url
+    rendition = image.renditions.filter(
+        filter_spec=filter_spec,
+        focal_point_key=Filter(spec=filter_spec).get_cache_key(image)).first()
+    return rendition.url if rendition is not None else None
+
+
+def get_static_version():
+    """
+    Return a hash of the static files manifest, which changes when
+    collectstatic hashes files anew. Storages without one return ''.
+    """
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None)
+    if not hashed_files:
+        return ''
+    if id(hashed_files) not in _static_versions:
+        _static_versions.clear()
+        _static_versions[id(hashed_files)] = hashlib.sha1(json.dumps(
+            sorted(hashed_files.items())).encode('utf-8')).hexdigest()[:12]
+    return _static_versions[id(hashed_files)]
+
+
+def get_asset_link(path):
+    if path.startswith(('http://', 'https://')):
+        return '<%s>; rel=preconnect' % path
+    extension = path.rsplit('.', 1)[-1]
+    link = '<%s>; rel=preload; as=%s' % (static(path), PRELOAD_TYPES.get(extension, 'fetch'))
+    if extension == 'woff2':
+        link += '; type="font/woff2"; crossorigin'
+    return link
+
+
+def compute_page_hints(page):
+    """
+    Return the Link header values for a page, from its stored stream data:
+    the hero image when a slider or background block opens the page, the
+    assets of the block types it uses and the icon font, its subset if
+    there is one. Also return whether they are complete, which they are
+    not while the rendition of the hero image is missing.
+    """
+    from .blocks import GridContentBlock
+
+    hero_blocks = get_setting('STREAMFIELDS_HERO_BLOCKS')
+    block_assets = get_setting('STREAMFIELDS_BLOCK_ASSETS')
+    links = []
+    complete = True
+    first_block = True
+    uses_icons = False
+    for path, block, raw, parent in walk_page(page):
+        if isinstance(block, IconChoiceBlock) and raw:
+            uses_icons = True
+        if not isinstance(parent, GridContentBlock):
+            continue
+        block_type = path[-1]
+        if first_block and block_type in hero_blocks and raw:
+            image, filter_spec = get_hero_image(block_type, raw)
+            if image is not None:
+                url = get_hero_image_url(image, filter_spec)
+                if url is None:
+                    complete = False
+                else:
+                    links.append('<%s>; rel=preload; as=image' % url)
+        first_block = False
+        links.extend(get_asset_link(asset) for asset in block_assets.get(block_type, ()))
+
+    if uses_icons:
+        icon_subset = get_icon_subset()
+        if icon_subset is None:
+            links.append(get_asset_link(get_setting('STREAMFIELDS_ICON_FONT')))
+        else:
+            links.append('<%s>; rel=preload; as=font; type="font/%s"; crossorigin' % (
+                default_storage.url(icon_subset.font), icon_subset.font.rsplit('.', 1)[-1]))
+
+    # drop duplicates, keeping the first occurrence
+    seen = set()
+    return [link for link in links if not (link in seen or seen.add(link))], complete
+
+
+def get_page_hints(page, request=None):
+    """
+    Return the Link header values of a live page, cached per render
+    version, icon subset and static files manifest so they are known before
+    the page renders.
+    """
+    cache = get_fragment_cache({'request': request})
+    if cache is None:
+        return compute_page_hints(page)[0]
+
+    from .models import PageRenderVersion
+    render_version = PageRenderVersion.objects.filter(
+        page_id=page.pk).values_list('version', flat=True).first()
+    icon_subset = get_icon_subset()
+    key = 'uwkm_streamfields:hints:%s.%s:%s:%s' % (
+        page.pk, render_version or 0, icon_subset.pk if icon_subset is not None else 0,
+        get_static_version())
+    hints = cache.get(key)
+    if hints is None:
+        hints, complete = compute_page_hints(page)
+        if complete:
+            cache.set(key, hints, get_setting('STREAMFIELDS_CACHE_TIMEOUT'))
+    return hints
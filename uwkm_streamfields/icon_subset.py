@@ -0,0 +1,180 @@
+"""
+Font Awesome subsets holding only the icons the blocks use: the icons
+chosen in the stream data of live pages, the icons the block templates use
+themselves and STREAMFIELDS_ICON_SUBSET_EXTRA. The subset font and its
+stylesheet are written to the default storage under names derived from the
+icons, so they can be cached for good.
+"""
+import hashlib
+import io
+import os
+import re
+
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .conf import get_setting
+from .icons import IconChoiceBlock
+from .models import IconSubset
+from .rendering import minify_css
+from .stream import get_stream_page_models, iter_live_pages, walk_page
+
+try:
+    from fontTools import subset as font_subset
+except ImportError:
+    font_subset = None
+
+FONT_AWESOME_CSS = 'fonts/font-awesome-4.7.0/css/font-awesome.css'
+FONT_AWESOME_FONT = 'fonts/font-awesome-4.7.0/fonts/fontawesome-webfont.ttf'
+
+ICON_RULE_RE = re.compile(r'((?:\.fa-[\w-]+:before\s*,?\s*)+)\{\s*content:\s*"\\(\w+)";\s*\}')
+ICON_SELECTOR_RE = re.compile(r'\.fa-([\w-]+):before')
+FONT_FACE_RE = re.compile(r'@font-face\s*\{.*?\}', re.DOTALL)
+TEMPLATE_ICON_RE = re.compile(r'\bfa-([a-z0-9-]+)')
+
+CACHE_KEY = 'uwkm_streamfields:icon_subset'
+
+
+class IconSubsetError(Exception):
+    pass
+
+
+def read_static(path):
+    full_path = finders.find(path)
+    with io.open(full_path, encoding='utf-8') as f:
+        return f.read()
+
+
+def get_codepoints(css):
+    """Return the code point of every icon name (aliases included) in the stylesheet."""
+    codepoints = {}
+    for selectors, codepoint in ICON_RULE_RE.findall(css):
+        for name in ICON_SELECTOR_RE.findall(selectors):
+            codepoints[name] = int(codepoint, 16)
+    return codepoints
+
+
+def get_template_icons():
+    """Return the icon names the package's block templates use literally."""
+    icons = set()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for directory in ('templates', 'jinja2'):
+        for dirpath, dirnames, filenames in os.walk(os.path.join(root, directory)):
+            for filename in filenames:
+                with io.open(os.path.join(dirpath, filename), encoding='utf-8') as f:
+                    icons.update(TEMPLATE_ICON_RE.findall(f.read()))
+    return icons
+
+
+def get_page_icons(page):
+    """Return the icons chosen in the stream data of a page."""
+    return set(
+        raw.strip() for path, block, raw, parent in walk_page(page)
+        if isinstance(block, IconChoiceBlock) and raw
+    )
+
+
+def get_used_icons():
+    icons = get_template_icons() | set(get_setting('STREAMFIELDS_ICON_SUBSET_EXTRA'))
+    for model in get_stream_page_models():
+        for page in iter_live_pages(model):
+            icons |= get_page_icons(page)
+    return icons
+
+
+def subset_font(codepoints, flavor):
+    options = font_subset.Options()
+    options.flavor = flavor
+    font = font_subset.load_font(finders.find(FONT_AWESOME_FONT), options)
+    subsetter = font_subset.Subsetter(options)
+    subsetter.populate(unicodes=codepoints)
+    subsetter.subset(font)
+    output = io.BytesIO()
+    font_subset.save_font(font, output, options)
+    return output.getvalue()
+
+
+def build_icon_subset(icons):
+    """
+    Write the subset font and stylesheet holding the icons, and record them
+    as the current IconSubset. Unknown names are left out.
+    """
+    if font_subset is None:
+        raise IconSubsetError("Building icon subsets requires fontTools.")
+
+    css = read_static(FONT_AWESOME_CSS)
+    codepoints = get_codepoints(css)
+    icons = sorted(icon for icon in icons if icon in codepoints)
+    prefix = '%s/fa-%s' % (
+        get_setting('STREAMFIELDS_ICON_SUBSET_PATH').rstrip('/'),
+        hashlib.sha1(','.join(icons).encode('utf-8')).hexdigest()[:12])
+
+    fonts = []
+    unicodes = sorted(set(codepoints[icon] for icon in icons))
+    for flavor, font_format in (('woff2', 'woff2'), ('woff', 'woff')):
+        try:
+            content = subset_font(unicodes, flavor)
+        except ImportError:
+            # woff2 needs the brotli package
+            continue
+        name = default_storage.save('%s.%s' % (prefix, flavor), ContentFile(content))
+        fonts.append((name, font_format))
+
+    def keep_used_icons(match):
+        selectors = [
+            '.fa-%s:before' % name for name in ICON_SELECTOR_RE.findall(match.group(1))
+            if name in icons]
+        if not selectors:
+            return ''
+        return '%s{content:"\\%s"}' % (','.join(selectors), match.group(2))
+
+    font_face = "@font-face{font-family:'FontAwesome';src:%s;font-weight:normal;font-style:normal}" % ','.join(
+        "url('%s') format('%s')" % (default_storage.url(name), font_format)
+        for name, font_format in fonts)
+    css = FONT_FACE_RE.sub(lambda match: font_face, css, count=1)
+    css = ICON_RULE_RE.sub(keep_used_icons, css)
+    css_name = default_storage.save(
+        '%s.css' % prefix, ContentFile(minify_css(css).encode('utf-8')))
+
+    icon_subset = IconSubset.objects.create(
+        icons=','.join(icons), css=css_name, font=fonts[0][0])
+    cache.delete(CACHE_KEY)
+    return icon_subset
+
+
+def get_icon_subset():
+    """Return the current IconSubset, or None when none was built."""
+    icon_subset = cache.get(CACHE_KEY)
+    if icon_subset is None:
+        icon_subset = IconSubset.objects.order_by('-pk').first() or False
+        cache.set(CACHE_KEY, icon_subset, None)
+    return icon_subset or None
+
+
+def update_icon_subset(page):
+    """
+    Extend the current subset with the icons of a published page which it
+    lacks. Subsets only shrink when build_streamfields_icon_subset builds
+    them from scratch.
+    """
+    icon_subset = get_icon_subset()
+    if icon_subset is None or font_subset is None:
+        return None
+    icons = icon_subset.get_icons()
+    codepoints = get_codepoints(read_static(FONT_AWESOME_CSS))
+    new_icons = set(icon for icon in get_page_icons(page) if icon in codepoints) - icons
+    if not new_icons:
+        return None
+    return build_icon_subset(icons | new_icons)
+
+
+def get_icon_css_url():
+    """Return the url of the stylesheet of the icon font, the subset if there is one."""
+    from django.templatetags.static import static
+
+    icon_subset = get_icon_subset()
+    if icon_subset is None:
+        return static(get_setting('STREAMFIELDS_ICON_CSS'))
+    return default_storage.url(icon_subset.css)
@@ -0,0 +1,141 @@
+import base64
+import threading
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+
+from django.db import close_old_connections, transaction
+from PIL import Image as PILImage
+
+from wagtail.wagtailimages import get_image_model
+
+from .conf import get_setting
+from .models import ImageMetadata
+from .references import invalidate_object
+from .stream import get_object_type, iter_references
+
+
+def get_dominant_color(pil_image):
+    """Return the most common color of a 4 color reduction as #rrggbb."""
+    small = pil_image.copy()
+    small.thumbnail((64, 64))
+    quantized = small.quantize(colors=4)
+    count, index = max(quantized.getcolors())
+    palette = quantized.getpalette()
+    return '#%02x%02x%02x' % tuple(palette[index * 3:index * 3 + 3])
+
+
+def get_placeholder(pil_image):
+    """Return a tiny JPEG of the image as a data URI, browsers blur it up."""
+    size = get_setting('STREAMFIELDS_IMAGE_PLACEHOLDER_SIZE')
+    small = pil_image.copy()
+    small.thumbnail((size, size))
+    buffer = BytesIO()
+    small.save(buffer, 'JPEG', quality=40)
+    return 'data:image/jpeg;base64,%s' % base64.b64encode(
+        buffer.getvalue()).decode('ascii')
+
+
+def compute_image_metadata(image):
+    image.file.open('rb')
+    try:
+        pil_image = PILImage.open(image.file)
+        pil_image.load()
+    finally:
+        image.file.close()
+    width, height = pil_image.size
+    pil_image = pil_image.convert('RGB')
+    return {
+        'source': image.file.name,
+        'width': width,
+        'height': height,
+        'dominant_color': get_dominant_color(pil_image),
+        'placeholder': get_placeholder(pil_image),
+    }
+
+
+def is_outdated(image):
+    return not ImageMetadata.objects.filter(
+        image_id=image.pk, source=image.file.name).exists()
+
+
+def update_image_metadata(image):
+    """
+    (Re)compute the metadata of an image. Images whose file cannot be read
+    are skipped, None is returned for them.
+    """
+    try:
+        data = compute_image_metadata(image)
+    except (IOError, OSError):
+        return None
+    metadata, created = ImageMetadata.objects.update_or_create(
+        image_id=image.pk, defaults=data)
+    # fragments rendered without the metadata have to be rendered again
+    invalidate_object(image)
+    return metadata
+
+
+_metadata_pool = None
+_metadata_pool_lock = threading.Lock()
+
+
+def get_metadata_pool():
+    """
+    Return the thread pool computing the metadata of saved images, or None
+    when STREAMFIELDS_IMAGE_METADATA_WORKERS is not set.
+    """
+    global _metadata_pool
+    workers = get_setting('STREAMFIELDS_IMAGE_METADATA_WORKERS')
+    if not workers:
+        return None
+    with _metadata_pool_lock:
+        if _metadata_pool is None:
+            _metadata_pool = ThreadPool(workers)
+    return _metadata_pool
+
+
+def update_outdated_image_metadata(image_id):
+    close_old_connections()
+    try:
+        image = get_image_model().objects.filter(pk=image_id).first()
+        if image is not None and is_outdated(image):
+            update_image_metadata(image)
+    finally:
+        close_old_connections()
+
+
+def schedule_image_metadata(image):
+    """
+    Update the metadata of a saved image if it is outdated, in the metadata
+    pool once the transaction saving the image commits, so uploads do not
+    wait for the image to be decoded.
+    """
+    pool = get_metadata_pool()
+    if pool is None:
+        if is_outdated(image):
+            update_image_metadata(image)
+        return
+
+    def submit(image_id=image.pk):
+        pool.apply_async(update_outdated_image_metadata, (image_id,))
+    # before Django 1.9 there is no on_commit
+    on_commit = getattr(transaction, 'on_commit', None)
+    if on_commit is None:
+        submit()
+    else:
+        on_commit(submit)
+
+
+def get_page_image_ids(page):
+    """Return the ids of the images chosen in a page's blocks."""
+    object_type = get_object_type(get_image_model())
+    return set(
+        int(object_id) for reference_type, object_id, path in iter_references(page)
+        if reference_type == object_type
+    )
+
+
+def get_image_metadata(image_ids):
+    """Load the metadata of many images in one query, by image id."""
+    metadata = dict((image_id, None) for image_id in image_ids)
+    metadata.update(ImageMetadata.objects.in_bulk(list(image_ids)))
+    return metadata
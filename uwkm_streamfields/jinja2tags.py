@@ -0,0 +1,113 @@
+from __future__ import absolute_import
+
+import jinja2
+from django.template.defaultfilters import cut, stringformat, striptags
+from django.templatetags.static import static
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+from wagtail.contrib.settings.jinja2tags import get_setting
+from wagtail.wagtailcore.jinja2tags import WagtailCoreExtension
+from wagtail.wagtailimages.jinja2tags import image
+
+from .critical_css import render_stylesheets
+from .icon_subset import get_icon_css_url
+from .rendering import (
+    STYLES_PLACEHOLDER, get_media_loading, get_render_state, get_style_class,
+    prerender_grids)
+
+
+@jinja2.contextfunction
+def style_class(context, *args):
+    declarations = [
+        (args[i], args[i + 1]) for i in range(0, len(args) - 1, 2)
+    ]
+    return get_style_class(get_render_state(context), declarations)
+
+
+@jinja2.contextfunction
+def image_metadata(context, image):
+    if not image:
+        return None
+    return get_render_state(context).get_image_metadata(context.get('page'), image)
+
+
+@jinja2.contextfunction
+def media_loading(context):
+    return get_media_loading(context)
+
+
+@jinja2.contextfunction
+def prerender_grid(context, value):
+    prerender_grids(value, context.get_all())
+    return ''
+
+
+@jinja2.contextfunction
+def streamfields_styles(context):
+    get_render_state(context).defer_styles = True
+    return jinja2.Markup(STYLES_PLACEHOLDER)
+
+
+def streamfields_icon_css():
+    return get_icon_css_url()
+
+
+@jinja2.contextfunction
+def streamfields_stylesheets(context):
+    return render_stylesheets(context)
+
+
+def url(viewname, *args, **kwargs):
+    return reverse(viewname, args=args, kwargs=kwargs)
+
+
+def thumbnail(file_, geometry, **options):
+    if not file_:
+        return None
+    from sorl.thumbnail import get_thumbnail
+    return get_thumbnail(file_, geometry, **options)
+
+
+class StreamfieldsExtension(WagtailCoreExtension):
+    """
+    Everything the Jinja2 versions of the streamfields templates use: the
+    Wagtail core tags, image, settings, static, url and style_class, and the
+    Django filters whose Jinja2 counterparts behave differently.
+    """
+    def __init__(self, environment):
+        super(StreamfieldsExtension, self).__init__(environment)
+
+        self.environment.globals.update({
+            'image': image,
+            'settings': get_setting,
+            'static': static,
+            'url': url,
+            'style_class': style_class,
+            'image_metadata': image_metadata,
+            'media_loading': media_loading,
+            'prerender_grid': prerender_grid,
+            'streamfields_styles': streamfields_styles,
+            'streamfields_icon_css': streamfields_icon_css,
+            'streamfields_stylesheets': streamfields_stylesheets,
+            'thumbnail': thumbnail,
+        })
+        self.environment.filters.update({
+            'cut': cut,
+            'stringformat': stringformat,
+            'strip_tags': striptags,
+        })
+
+        try:
+            from oscar.templatetags.currency_filters import currency
+        except ImportError:
+            pass
+        else:
+            self.environment.filters['currency'] = currency
+
+
+# Nicer import names
+streamfields = StreamfieldsExtension
@@ -0,0 +1,138 @@
+"""
+Server side pagination of long ListBlocks, see PaginatedListBlock. The first
+page renders inline, the next pages and search results come from the
+list_fragment view, which finds the list in the page's stored data by the
+digest of its contents.
+"""
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+from .conf import get_setting
+from .encoding import compact
+from .stream import walk_page
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+ListPage = namedtuple('ListPage', ['items', 'url', 'next_url', 'searchable'])
+
+
+def get_list_digest(block, raw):
+    """
+    Return the digest identifying a list by its contents, the same for
+    compactly and fully stored data.
+    """
+    return hashlib.sha1(json.dumps(
+        compact(block, raw), sort_keys=True, cls=DjangoJSONEncoder,
+    ).encode('utf-8')).hexdigest()
+
+
+def get_list_url(page, digest):
+    return reverse('uwkm_streamfields_list_fragment', args=(page.pk, digest))
+
+
+def paginate_list(block, value, context):
+    """
+    Return the ListPage of a list rendered within a page: its first page
+    and the urls of the next one and of searching it. Lists outside a saved
+    page, previews and static exports are not paginated.
+    """
+    from .export import EXPORT_ENVIRON_KEY
+
+    page = context.get('page')
+    request = context.get('request')
+    if (context.get('streamfields_list_fragment')
+            or getattr(page, 'pk', None) is None
+            or getattr(request, 'is_preview', False)
+            or EXPORT_ENVIRON_KEY in getattr(request, 'META', {})):
+        return ListPage(value, None, None, False)
+
+    per_page = get_setting('STREAMFIELDS_LIST_PAGE_SIZE')
+    url = get_list_url(page, get_list_digest(block, block.get_prep_value(value)))
+    next_url = '%s?page=2' % url if len(value) > per_page else None
+    return ListPage(value[:per_page], url, next_url, bool(block.meta.search_fields))
+
+
+def find_list(page, digest):
+    """Return the paginated ListBlock and stored data of a page's list, or None."""
+    from .blocks import PaginatedListBlock
+
+    for path, block, raw, parent in walk_page(page):
+        if (isinstance(block, PaginatedListBlock) and raw
+                and get_list_digest(block, raw) == digest):
+            return block, raw
+    return None
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(('%s' % text).lower())
+
+
+class SearchIndex(object):
+    """
+    Inverted index of the search fields of a list's items. Every query word
+    has to prefix a word of the item.
+    """
+    def __init__(self, items, fields):
+        # word -> positions of the items containing it
+        self.words = {}
+        for position, item in enumerate(items):
+            for field in fields:
+                for word in tokenize(item.get(field) or ''):
+                    self.words.setdefault(word, set()).add(position)
+
+    def search(self, query):
+        positions = None
+        for query_word in tokenize(query):
+            matches = set()
+            for word, word_positions in self.words.items():
+                if word.startswith(query_word):
+                    matches |= word_positions
+            positions = matches if positions is None else positions & matches
+            if not positions:
+                return []
+        return sorted(positions or ())
+
+
+_search_indexes = OrderedDict()
+_search_indexes_lock = threading.Lock()
+
+
+def get_search_index(digest, items, fields):
+    """
+    Return the SearchIndex of a list. Lists are identified by their
+    contents, so the most recently used indexes are kept in memory for good.
+    """
+    with _search_indexes_lock:
+        index = _search_indexes.pop(digest, None)
+        if index is None:
+            index = SearchIndex(items, fields)
+        _search_indexes[digest] = index
+        while len(_search_indexes) > get_setting('STREAMFIELDS_LIST_SEARCH_INDEXES'):
+            _search_indexes.popitem(last=False)
+    return index
+
+
+def get_list_page(block, raw, digest, number, query=''):
+    """
+    Return the stored data of the items on a page of a list, filtered by a
+    search query, and whether there is a next page.
+    """
+    expand_item = getattr(block, 'expand_item', lambda item: item)
+    items = [expand_item(item) for item in raw]
+    if query and block.meta.search_fields:
+        index = get_search_index(digest, items, block.meta.search_fields)
+        items = [items[position] for position in index.search(query)]
+
+    per_page = get_setting('STREAMFIELDS_LIST_PAGE_SIZE')
+    start = (number - 1) * per_page
+    return items[start:start + per_page], len(items) > start + per_page
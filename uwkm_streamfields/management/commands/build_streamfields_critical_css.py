@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from ...critical_css import build_purged_stylesheet
+
+
+class Command(BaseCommand):
+    help = ("Purge the block stylesheets of the selectors no block template "
+            "can produce and compute the critical CSS of every block type. "
+            "Run it again after changing the templates or stylesheets.")
+
+    def handle(self, *args, **options):
+        purged_stylesheet = build_purged_stylesheet()
+        self.stdout.write("Built %s." % purged_stylesheet.stylesheet)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...icon_subset import IconSubsetError, build_icon_subset, get_used_icons
+
+
+class Command(BaseCommand):
+    help = ("Build a Font Awesome subset holding only the icons used by live "
+            "pages and the block templates. Publishing a page with a new icon "
+            "extends the subset.")
+
+    def handle(self, *args, **options):
+        try:
+            icon_subset = build_icon_subset(get_used_icons())
+        except IconSubsetError as e:
+            raise CommandError(str(e))
+        self.stdout.write("Built %s with %d icons." % (
+            icon_subset.css, len(icon_subset.get_icons())))
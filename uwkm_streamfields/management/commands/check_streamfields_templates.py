@@ -0,0 +1,127 @@
+import difflib
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.test import RequestFactory
+
+from wagtail.contrib.table_block.blocks import TableBlock
+from wagtail.wagtailcore import blocks
+from wagtail.wagtailcore.models import Page
+
+from ...blocks import ColorPickerBlock, GridContentBlock, grid_array, streamfield_template
+from ...rendering import minify_html
+from ...stream import walk_page
+
+
+def get_template_name(block):
+    template = getattr(block.meta, 'template', None)
+    if not template or not template.startswith('streamfields/'):
+        return None
+    return template[len('streamfields/'):].rsplit('.', 1)[0]
+
+
+def get_first_choice(choices):
+    for value, label in choices:
+        if isinstance(label, (list, tuple)):
+            value = get_first_choice(label)
+        if value:
+            return value
+    return ''
+
+
+def get_sample_value(block):
+    """
+    Return stored data filling every field of a block, with two items in
+    every list, so the loops and conditions of its template run. Choosers
+    are left empty.
+    """
+    if isinstance(block, blocks.ListBlock):
+        return [get_sample_value(block.child_block) for i in range(2)]
+    if isinstance(block, blocks.BaseStructBlock):
+        return dict(
+            (name, get_sample_value(child_block))
+            for name, child_block in block.child_blocks.items())
+    if isinstance(block, blocks.BaseStreamBlock):
+        return [
+            {'type': name, 'value': get_sample_value(child_block)}
+            for name, child_block in block.child_blocks.items()]
+    if isinstance(block, blocks.ChooserBlock):
+        return None
+    if isinstance(block, blocks.ChoiceBlock):
+        return get_first_choice(block.field.choices)
+    if isinstance(block, TableBlock):
+        return {
+            'data': [['Name', 'Price'], ['Sample', '<b>10</b>']],
+            'first_row_is_table_header': True,
+            'first_col_is_header': False,
+        }
+    samples = [
+        (blocks.BooleanBlock, True),
+        (blocks.IntegerBlock, 2),
+        (blocks.DateBlock, '2017-06-28'),
+        (blocks.URLBlock, 'https://example.com/?a=1&b=2'),
+        (blocks.EmailBlock, 'info@example.com'),
+        (blocks.RichTextBlock, '<p>Sample <b>text</b> &amp; more</p>'),
+        (blocks.RawHTMLBlock, '<p class="raw">Sample</p>'),
+        (ColorPickerBlock, '#336699'),
+        (blocks.FieldBlock, 'Sample "text" & <more>'),
+    ]
+    for block_class, sample in samples:
+        if isinstance(block, block_class):
+            return sample
+    return block.get_prep_value(block.get_default())
+
+
+def render(engine, name, block, value, page=None):
+    request = RequestFactory().get('/')
+    context = block.get_context(value)
+    context['page'] = page
+    template = engines[engine].get_template(streamfield_template(name, engine))
+    return minify_html(template.render(context, request=request))
+
+
+class Command(BaseCommand):
+    help = ("Render the streamfield blocks with both the Django and the Jinja2 "
+            "templates and report the blocks whose output differs.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page', type=int, action='append', dest='pages', default=[],
+            help="Check the grid content of this page instead of sample values.")
+
+    def iter_values(self, page_ids):
+        if not page_ids:
+            for block_type, block in grid_array:
+                yield block_type, block, block.to_python(get_sample_value(block)), None
+            return
+        for page in Page.objects.filter(pk__in=page_ids).specific():
+            for path, block, raw, parent in walk_page(page):
+                if isinstance(parent, GridContentBlock):
+                    label = '%s %s' % (page.pk, '.'.join(path))
+                    yield label, block, block.to_python(raw), page
+
+    def handle(self, *args, **options):
+        if 'jinja2' not in engines:
+            raise CommandError("No template engine named 'jinja2' is configured.")
+
+        checked = differences = 0
+        for label, block, value, page in self.iter_values(options['pages']):
+            name = get_template_name(block)
+            if name is None:
+                continue
+            checked += 1
+            django_html = render('django', name, block, value, page)
+            jinja2_html = render('jinja2', name, block, value, page)
+            if django_html == jinja2_html:
+                continue
+            differences += 1
+            self.stdout.write(self.style.WARNING('%s (%s) differs:' % (label, name)))
+            for line in difflib.unified_diff(
+                    django_html.replace('>', '>\n').splitlines(),
+                    jinja2_html.replace('>', '>\n').splitlines(),
+                    'django', 'jinja2', lineterm=''):
+                self.stdout.write(line)
+
+        self.stdout.write('%d blocks checked, %d differ.' % (checked, differences))
+        if differences:
+            raise CommandError('The Django and Jinja2 templates render differently.')
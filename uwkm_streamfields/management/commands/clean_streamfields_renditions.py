@@ -0,0 +1,172 @@
+import itertools
+from datetime import timedelta
+from multiprocessing import Pool
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from wagtail.wagtailcore.models import PageRevision
+from wagtail.wagtailimages import get_image_model
+
+from ...conf import get_setting
+from ...renditions import (
+    get_block_filter_specs, get_non_stream_image_ids,
+    get_stream_rich_text_image_ids, iter_page_streams, iter_revision_streams,
+    iter_stream_renditions)
+from ...stream import get_stream_fields, get_stream_page_models
+from .rebuild_streamfields_block_index import close_connections
+
+
+def scan_streams(streams):
+    """
+    Return the renditions stream data uses and the images embedded in its
+    rich text, which keep all of their renditions.
+    """
+    streams = list(streams)
+    return set(iter_stream_renditions(streams)), get_stream_rich_text_image_ids(streams)
+
+
+def scan_pages(args):
+    model_label, page_ids = args
+    model = apps.get_model(model_label)
+    used, image_ids = set(), set()
+    for page in model.objects.filter(pk__in=page_ids):
+        pairs, rich_text_image_ids = scan_streams(iter_page_streams(page))
+        used |= pairs
+        image_ids |= rich_text_image_ids
+    return used, image_ids
+
+
+def scan_revisions(revision_ids):
+    used, image_ids = set(), set()
+    for content_type_id, content_json in PageRevision.objects.filter(
+            pk__in=revision_ids).values_list('page__content_type', 'content_json'):
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is not None and get_stream_fields(model):
+            pairs, rich_text_image_ids = scan_streams(iter_revision_streams(model, content_json))
+            used |= pairs
+            image_ids |= rich_text_image_ids
+    return used, image_ids
+
+
+def delete_renditions(rendition_ids):
+    rendition_model = get_image_model().get_rendition_model()
+    storage = rendition_model._meta.get_field('file').storage
+    renditions = rendition_model.objects.filter(pk__in=rendition_ids)
+    names = list(renditions.values_list('file', flat=True))
+    renditions.delete()
+    # unused renditions are in no cached fragment, so none are invalidated
+    for name in names:
+        # Wagtail only removes the files of its own Rendition model
+        if name and storage.exists(name):
+            storage.delete(name)
+    return len(names)
+
+
+class Command(BaseCommand):
+    help = ("Delete the renditions with block template filter specs which "
+            "neither live pages nor recent revisions use, with their files.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report the number of unused renditions.")
+        parser.add_argument(
+            '--revision-days', type=int,
+            default=get_setting('STREAMFIELDS_RENDITION_REVISION_DAYS'),
+            help="Keep the renditions of revisions saved in this many days.")
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help="Number of worker processes.")
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help="Number of pages, revisions or renditions per task.")
+
+    def chunked(self, ids, chunk_size):
+        return [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+
+    def get_page_chunks(self, chunk_size):
+        for model in get_stream_page_models():
+            page_ids = list(model.objects.live().filter(
+                content_type=ContentType.objects.get_for_model(model),
+            ).order_by('pk').values_list('pk', flat=True))
+            for chunk in self.chunked(page_ids, chunk_size):
+                yield model._meta.label, chunk
+
+    def get_revision_ids(self, days):
+        revision_ids = set(PageRevision.objects.filter(
+            created_at__gte=timezone.now() - timedelta(days=days),
+        ).values_list('pk', flat=True))
+        # drafts are kept however old they are
+        revision_ids.update(PageRevision.objects.filter(
+            page__has_unpublished_changes=True,
+        ).values('page_id').annotate(latest=Max('pk')).values_list('latest', flat=True))
+        return sorted(revision_ids)
+
+    def get_candidate_specs(self):
+        """
+        Return the filter specs whose renditions may be deleted: the ones of
+        the block templates, but not the ones kept or offered by the API.
+        """
+        specs = set().union(*get_block_filter_specs().values())
+        specs -= set(get_setting('STREAMFIELDS_RENDITION_KEEP_SPECS'))
+        specs -= set(get_setting('STREAMFIELDS_API_RENDITIONS'))
+        return specs
+
+    def get_unused_ids(self, used, kept_image_ids, max_pk, chunk_size):
+        queryset = get_image_model().get_rendition_model().objects.filter(
+            pk__lte=max_pk, filter_spec__in=list(self.get_candidate_specs()),
+        ).order_by('pk')
+        unused_ids = []
+        last_pk = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk).values_list(
+                'pk', 'image_id', 'filter_spec')[:chunk_size])
+            if not rows:
+                return unused_ids
+            unused_ids.extend(
+                pk for pk, image_id, filter_spec in rows
+                if image_id not in kept_image_ids and (image_id, filter_spec) not in used)
+            last_pk = rows[-1][0]
+
+    def run(self, pool, function, chunks):
+        if pool is None:
+            return map(function, chunks)
+        return pool.imap_unordered(function, chunks)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        # renditions created while scanning are left alone
+        max_pk = get_image_model().get_rendition_model().objects.aggregate(
+            max_pk=Max('pk'))['max_pk'] or 0
+        pool = None
+        if options['workers'] > 1:
+            close_connections()
+            pool = Pool(options['workers'], initializer=close_connections)
+
+        try:
+            used = set()
+            kept_image_ids = get_non_stream_image_ids()
+            revision_chunks = self.chunked(
+                self.get_revision_ids(options['revision_days']), chunk_size)
+            for pairs, image_ids in itertools.chain(
+                    self.run(pool, scan_pages, list(self.get_page_chunks(chunk_size))),
+                    self.run(pool, scan_revisions, revision_chunks)):
+                used |= pairs
+                kept_image_ids |= image_ids
+
+            unused_ids = self.get_unused_ids(used, kept_image_ids, max_pk, chunk_size)
+            if options['dry_run']:
+                self.stdout.write("%d renditions are unused." % len(unused_ids))
+                return
+            deleted = sum(self.run(
+                pool, delete_renditions, self.chunked(unused_ids, chunk_size)))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        self.stdout.write("Deleted %d renditions." % deleted)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from ...conf import get_setting
+from ...tables import get_unused_tables
+
+
+class Command(BaseCommand):
+    help = ("Delete the imported tables which neither live pages nor recent "
+            "revisions choose.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report the number of unused tables.")
+        parser.add_argument(
+            '--revision-days', type=int,
+            default=get_setting('STREAMFIELDS_RENDITION_REVISION_DAYS'),
+            help="Keep the tables of revisions saved in this many days.")
+        parser.add_argument(
+            '--min-age-hours', type=int, default=24,
+            help="Keep the tables imported in this many hours, their pages may "
+                 "not be saved yet.")
+
+    def handle(self, *args, **options):
+        tables = get_unused_tables(options['revision_days'], options['min_age_hours'])
+        if options['dry_run']:
+            self.stdout.write("%d tables are unused." % tables.count())
+            return
+        # chunks are deleted along with their tables
+        deleted, counts = tables.delete()
+        self.stdout.write("Deleted %d tables." % counts.get('uwkm_streamfields.StoredTable', 0))
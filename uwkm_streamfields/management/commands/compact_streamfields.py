@@ -0,0 +1,104 @@
+import json
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import TextField, Value
+from django.utils import six
+
+from wagtail.wagtailcore.models import PageRevision
+
+from ...encoding import compact_stream
+from ...stream import get_stream_fields, get_stream_page_models
+
+
+def dump(data):
+    return json.dumps(data, cls=DjangoJSONEncoder)
+
+
+def compact_json(field, data):
+    """
+    Return the compact JSON of a StreamField's stored data, or None when it
+    is compact already.
+    """
+    if not data:
+        return None
+    raw = json.loads(data) if isinstance(data, six.string_types) else data
+    compacted = dump(compact_stream(field.stream_block, raw))
+    if compacted == (data if isinstance(data, six.string_types) else dump(data)):
+        return None
+    return compacted
+
+
+class Command(BaseCommand):
+    help = ("Rewrite the stream data of pages and their revisions in the "
+            "compact GridBlock encoding.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=200,
+            help="Number of rows loaded at a time.")
+        parser.add_argument(
+            '--skip-revisions', action='store_false', dest='revisions',
+            help="Only rewrite the pages, not their revisions.")
+
+    def iter_chunks(self, queryset, fields, chunk_size):
+        queryset = queryset.order_by('pk')
+        last_pk = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk).values_list('pk', *fields)[:chunk_size])
+            if not rows:
+                return
+            yield rows
+            last_pk = rows[-1][0]
+
+    def compact_pages(self, model, fields, chunk_size):
+        count = 0
+        queryset = model.objects.filter(content_type=ContentType.objects.get_for_model(model))
+        names = [field.attname for field in fields]
+        for rows in self.iter_chunks(queryset, names, chunk_size):
+            with transaction.atomic():
+                for row in rows:
+                    # the values are lazy StreamValues, nothing is converted
+                    changes = {}
+                    for field, value in zip(fields, row[1:]):
+                        data = value.stream_data if value is not None and value.is_lazy else None
+                        compacted = compact_json(field, data)
+                        if compacted is not None:
+                            # bypass StreamField.get_prep_value, it is JSON already
+                            changes[field.attname] = Value(compacted, output_field=TextField())
+                    if changes:
+                        model.objects.filter(pk=row[0]).update(**changes)
+                        count += 1
+        return count
+
+    def compact_revisions(self, model, fields, chunk_size):
+        count = 0
+        queryset = PageRevision.objects.filter(
+            page__content_type=ContentType.objects.get_for_model(model))
+        for rows in self.iter_chunks(queryset, ['content_json'], chunk_size):
+            with transaction.atomic():
+                for pk, content_json in rows:
+                    content = json.loads(content_json)
+                    changed = False
+                    for field in fields:
+                        compacted = compact_json(field, content.get(field.name))
+                        if compacted is not None:
+                            content[field.name] = compacted
+                            changed = True
+                    if changed:
+                        PageRevision.objects.filter(pk=pk).update(
+                            content_json=dump(content))
+                        count += 1
+        return count
+
+    def handle(self, *args, **options):
+        pages = revisions = 0
+        for model in get_stream_page_models():
+            fields = get_stream_fields(model)
+            pages += self.compact_pages(model, fields, options['chunk_size'])
+            if options['revisions']:
+                revisions += self.compact_revisions(model, fields, options['chunk_size'])
+
+        self.stdout.write("Compacted %d pages and %d revisions." % (pages, revisions))
@@ -0,0 +1,173 @@
+import json
+import os
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wagtail.wagtailcore.models import Page, Site
+
+from ...export import StaticExporter, get_page_signatures, makedirs
+from .rebuild_streamfields_block_index import close_connections
+
+MANIFEST_NAME = '.streamfields-export.json'
+
+_exporter = None
+
+
+def init_worker(site_id, output_dir, base_url):
+    global _exporter
+    close_connections()
+    _exporter = StaticExporter(Site.objects.get(pk=site_id), output_dir, base_url)
+
+
+def export_chunk(page_ids):
+    results = []
+    for page in Page.objects.filter(pk__in=page_ids).specific():
+        try:
+            result = _exporter.export_page(page)
+        except Exception as e:
+            result = {'path': None, 'assets': [], 'warnings': [],
+                      'error': "%s failed: %r" % (page.url_path, e)}
+        results.append((page.pk, result))
+    return results
+
+
+def copy_chunk(args):
+    assets, force = args
+    missing = []
+    for kind, name in assets:
+        missing.extend(_exporter.copy_asset(kind, name, force))
+    return missing
+
+
+class Command(BaseCommand):
+    help = ("Export live pages to static HTML files, with the static files and "
+            "media they reference. Only pages which changed since the last "
+            "export into the directory are rendered again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir', help="Directory to export to.")
+        parser.add_argument(
+            '--root', type=int, dest='root_id',
+            help="Only export this page and its descendants.")
+        parser.add_argument(
+            '--site', type=int, dest='site_id',
+            help="Site whose pages are exported, the default site by default.")
+        parser.add_argument(
+            '--base-url', default='/',
+            help="Url the export is served from.")
+        parser.add_argument(
+            '--all', action='store_true', dest='force',
+            help="Export all pages and copy all files again.")
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help="Number of worker processes.")
+        parser.add_argument(
+            '--chunk-size', type=int, default=20,
+            help="Number of pages rendered per task.")
+
+    def get_site(self, site_id):
+        try:
+            if site_id is not None:
+                return Site.objects.get(pk=site_id)
+            return Site.objects.get(is_default_site=True)
+        except Site.DoesNotExist:
+            raise CommandError("Site not found, use --site.")
+
+    def load_manifest(self, output_dir, base_url):
+        try:
+            with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+        except (IOError, ValueError):
+            return {}
+        # urls in the exported files depend on the base url
+        if manifest.get('base_url') != base_url:
+            return {}
+        return manifest.get('pages', {})
+
+    def save_manifest(self, output_dir, base_url, pages):
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+            json.dump({'base_url': base_url, 'pages': pages}, f, indent=1, sort_keys=True)
+
+    def run(self, pool, function, chunks):
+        if pool is None:
+            return map(function, chunks)
+        return pool.imap_unordered(function, chunks)
+
+    def handle(self, *args, **options):
+        site = self.get_site(options['site_id'])
+        output_dir = os.path.abspath(options['output_dir'])
+        base_url = options['base_url']
+        makedirs(output_dir)
+
+        root = site.root_page
+        if options['root_id'] is not None:
+            root = Page.objects.filter(pk=options['root_id']).first()
+            if root is None or not root.path.startswith(site.root_page.path):
+                raise CommandError("Page %s is not part of the site." % options['root_id'])
+        tree_paths = dict(Page.objects.live().public().descendant_of(
+            root, inclusive=True).values_list('pk', 'path'))
+        page_ids = sorted(tree_paths, key=tree_paths.get)
+
+        manifest = {} if options['force'] else self.load_manifest(output_dir, base_url)
+        signatures = get_page_signatures(page_ids, site)
+        changed_ids = [
+            page_id for page_id in page_ids
+            if signatures[page_id] is None
+            or manifest.get(str(page_id), {}).get('signature') != signatures[page_id]
+        ]
+
+        chunk_size = options['chunk_size']
+        chunks = [changed_ids[i:i + chunk_size] for i in range(0, len(changed_ids), chunk_size)]
+        initargs = (site.pk, output_dir, base_url)
+        pool = None
+        if options['workers'] > 1:
+            close_connections()
+            pool = Pool(options['workers'], initializer=init_worker, initargs=initargs)
+        else:
+            init_worker(*initargs)
+
+        try:
+            errors = 0
+            for results in self.run(pool, export_chunk, chunks):
+                for page_id, result in results:
+                    for warning in result['warnings']:
+                        self.stderr.write("Warning: %s" % warning)
+                    if result['error'] is not None:
+                        self.stderr.write(result['error'])
+                        manifest.pop(str(page_id), None)
+                        errors += 1
+                        continue
+                    manifest[str(page_id)] = {
+                        'path': result['path'],
+                        'tree_path': tree_paths[page_id],
+                        'signature': signatures[page_id],
+                        'assets': result['assets'],
+                    }
+
+            # pages of the exported tree which are no longer live
+            exporter = StaticExporter(site, output_dir, base_url)
+            live_paths = set(manifest[str(page_id)]['path'] for page_id in page_ids
+                             if str(page_id) in manifest)
+            for page_id, page in list(manifest.items()):
+                if int(page_id) not in tree_paths and page['tree_path'].startswith(root.path):
+                    if page['path'] not in live_paths:
+                        exporter.remove_page(page['path'])
+                    del manifest[page_id]
+
+            assets = sorted(set(
+                tuple(asset) for page in manifest.values() for asset in page['assets']))
+            asset_chunks = [
+                (assets[i:i + 100], options['force']) for i in range(0, len(assets), 100)]
+            for missing in self.run(pool, copy_chunk, asset_chunks):
+                for name in missing:
+                    self.stderr.write("Warning: %s not found" % name)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        self.save_manifest(output_dir, base_url, manifest)
+        self.stdout.write("Exported %d of %d pages and %d files, %d errors." % (
+            len(changed_ids) - errors, len(page_ids), len(assets), errors))
+
@@ -0,0 +1,57 @@
+from multiprocessing import Pool
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ...block_index import update_block_index
+from ...stream import get_stream_page_models
+
+
+def close_connections():
+    # forked workers must not share the parent's database connections
+    connections.close_all()
+
+
+def index_chunk(args):
+    model_label, page_ids = args
+    model = apps.get_model(model_label)
+    for page in model.objects.filter(pk__in=page_ids):
+        update_block_index(page)
+    return len(page_ids)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the index of the blocks used by live pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help="Number of worker processes.")
+        parser.add_argument(
+            '--chunk-size', type=int, default=200,
+            help="Number of pages indexed per task.")
+
+    def get_chunks(self, chunk_size):
+        for model in get_stream_page_models():
+            page_ids = list(model.objects.live().filter(
+                content_type=ContentType.objects.get_for_model(model),
+            ).order_by('pk').values_list('pk', flat=True))
+            for i in range(0, len(page_ids), chunk_size):
+                yield model._meta.label, page_ids[i:i + chunk_size]
+
+    def handle(self, *args, **options):
+        chunks = list(self.get_chunks(options['chunk_size']))
+        if options['workers'] > 1:
+            close_connections()
+            pool = Pool(options['workers'], initializer=close_connections)
+            try:
+                count = sum(pool.imap_unordered(index_chunk, chunks))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            count = sum(index_chunk(chunk) for chunk in chunks)
+
+        self.stdout.write("Indexed %d pages." % count)
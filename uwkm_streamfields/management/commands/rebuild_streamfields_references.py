@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from wagtail.wagtailcore.models import PageRevision
+
+from ...references import update_page_references
+from ...renditions import iter_page_streams, iter_revision_streams
+from ...stream import get_stream_page_models, iter_live_pages
+
+
+def get_stream_data(streams):
+    return dict((field.name, raw) for field, raw in streams if raw)
+
+
+def get_live_revision(page):
+    """
+    Return the revision a page with draft changes was published from, the
+    latest one whose stream data is the live page's: Wagtail doesn't
+    record it.
+    """
+    live_data = get_stream_data(iter_page_streams(page))
+    revisions = PageRevision.objects.filter(page_id=page.pk).order_by('-created_at', '-id')
+    for revision in revisions.iterator():
+        if get_stream_data(iter_revision_streams(type(page), revision.content_json)) == live_data:
+            return revision
+    return None
+
+
+class Command(BaseCommand):
+    help = "Rebuild the index of images, pages, documents and products " \
+           "chosen in the stream data of live pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help="Number of pages loaded at a time.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        count = 0
+        for model in get_stream_page_models():
+            chunk = []
+            for page in iter_live_pages(model, chunk_size):
+                chunk.append(page)
+                if len(chunk) == chunk_size:
+                    count += self.index_pages(chunk)
+                    chunk = []
+            count += self.index_pages(chunk)
+
+        self.stdout.write("Indexed %d pages." % count)
+
+    def index_pages(self, pages):
+        # the latest revision is the live one unless there are draft changes
+        latest_revisions = dict(
+            PageRevision.objects.filter(page_id__in=[page.pk for page in pages])
+            .values('page_id').annotate(latest=Max('id'))
+            .values_list('page_id', 'latest')
+        )
+        revisions = PageRevision.objects.in_bulk(latest_revisions.values())
+        for page in pages:
+            if page.has_unpublished_changes:
+                revision = get_live_revision(page)
+            else:
+                revision = revisions.get(latest_revisions.get(page.pk))
+            update_page_references(page, revision)
+        return len(pages)
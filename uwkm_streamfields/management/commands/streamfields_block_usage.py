@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from ...block_index import get_block_usage
+
+
+class Command(BaseCommand):
+    help = "Report how often each block is used on live pages, from the block index."
+
+    def handle(self, *args, **options):
+        self.stdout.write('%-25s %-25s %10s %10s' % (
+            'block type', 'block class', 'instances', 'pages'))
+        for row in get_block_usage():
+            self.stdout.write('%-25s %-25s %10d %10d' % (
+                row['block_type'] or '-', row['block_class'],
+                row['instances'], row['pages']))
@@ -0,0 +1,54 @@
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+
+from wagtail.wagtailimages import get_image_model
+
+from ...image_metadata import is_outdated, update_image_metadata
+from .rebuild_streamfields_block_index import close_connections
+
+
+def update_chunk(args):
+    image_ids, force = args
+    count = 0
+    for image in get_image_model().objects.filter(pk__in=image_ids):
+        if force or is_outdated(image):
+            if update_image_metadata(image) is not None:
+                count += 1
+    return count
+
+
+class Command(BaseCommand):
+    help = ("Compute the size, dominant color and placeholder of every image "
+            "whose metadata is missing or outdated.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true', dest='force',
+            help="Recompute the metadata of images which are up to date too.")
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help="Number of worker processes.")
+        parser.add_argument(
+            '--chunk-size', type=int, default=50,
+            help="Number of images processed per task.")
+
+    def handle(self, *args, **options):
+        image_ids = list(get_image_model().objects.order_by('pk').values_list('pk', flat=True))
+        chunk_size = options['chunk_size']
+        chunks = [
+            (image_ids[i:i + chunk_size], options['force'])
+            for i in range(0, len(image_ids), chunk_size)
+        ]
+        if options['workers'] > 1:
+            close_connections()
+            pool = Pool(options['workers'], initializer=close_connections)
+            try:
+                count = sum(pool.imap_unordered(update_chunk, chunks))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            count = sum(update_chunk(chunk) for chunk in chunks)
+
+        self.stdout.write("Updated the metadata of %d images." % count)
@@ -0,0 +1,354 @@
+"""
+Production metrics of block rendering: render latency, rendered bytes and
+queries per GridBlock block type, fragment cache and settings cache hits and
+rendition misses. Metrics go to the sink in STREAMFIELDS_METRICS_SINK and
+are not recorded at all without one.
+
+FileSink counts in the memory of each process and writes its totals to a
+file of its own in STREAMFIELDS_METRICS_DIR at most every
+STREAMFIELDS_METRICS_FLUSH_INTERVAL seconds, so any number of worker
+processes can be served from the metrics view, which sums the files. The
+files of exited processes are merged into one.
+"""
+import atexit
+import errno
+import glob
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import partial
+
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.utils.module_loading import import_string
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .conf import get_setting
+
+METRICS = {
+    'streamfields_block_render_seconds': (
+        'histogram', "Time rendering a block, by GridBlock block type."),
+    'streamfields_block_render_bytes_total': (
+        'counter', "Bytes of HTML rendered, by GridBlock block type."),
+    'streamfields_block_render_queries': (
+        'histogram', "Database queries per block render, by GridBlock block type."),
+    'streamfields_fragment_cache_requests_total': (
+        'counter', "Fragment cache lookups, by result."),
+    'streamfields_settings_cache_requests_total': (
+        'counter', "Streamfields settings lookups, by result."),
+    'streamfields_rendition_misses_total': (
+        'counter', "Image renditions generated, by filter spec."),
+}
+
+BUCKETS = {
+    'streamfields_block_render_seconds': (
+        0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+    'streamfields_block_render_queries': (0, 1, 2, 5, 10, 20, 50, 100),
+}
+
+# the file of a process: its pid and a token
+PROCESS_FILE_RE = re.compile(r'^(\d+)(?:-\w+)?\.json$')
+
+_sink = None
+_sink_lock = threading.Lock()
+_queries = threading.local()
+
+
+class MetricsSink(object):
+    """Receives counter increments and histogram observations."""
+    def inc(self, name, labels, value=1):
+        raise NotImplementedError
+
+    def observe(self, name, labels, value):
+        raise NotImplementedError
+
+    def collect(self):
+        """Return the metrics in the Prometheus text format, or None."""
+        return None
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def read_totals(path):
+    """Return the counters and histograms of a metrics file, by key."""
+    counters = {}
+    histograms = {}
+    with open(path) as f:
+        data = json.load(f)
+    for name, labels, value in data['counters']:
+        key = (name, tuple(tuple(label) for label in labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, value in data['histograms']:
+        key = (name, tuple(tuple(label) for label in labels))
+        histograms[key] = list(value)
+    return counters, histograms
+
+
+def add_totals(totals, other):
+    counters, histograms = totals
+    other_counters, other_histograms = other
+    for key, value in other_counters.items():
+        counters[key] = counters.get(key, 0) + value
+    for key, value in other_histograms.items():
+        total = histograms.setdefault(key, [0] * len(value))
+        for i, count in enumerate(value):
+            total[i] += count
+
+
+class FileSink(MetricsSink):
+    # totals of the processes which exited
+    exited_name = 'exited.json'
+
+    def __init__(self):
+        self.directory = get_setting('STREAMFIELDS_METRICS_DIR')
+        self.flush_interval = get_setting('STREAMFIELDS_METRICS_FLUSH_INTERVAL')
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self.lock = threading.Lock()
+        self.pid = None
+        atexit.register(self.flush)
+
+    def check_process(self):
+        # a forked worker starts counting from zero, its parent's counts
+        # are in the parent's file
+        if self.pid != os.getpid():
+            with self.lock:
+                self.pid = os.getpid()
+                # a later process with the same pid gets a file of its own
+                self.name = '%d-%s.json' % (self.pid, uuid.uuid4().hex[:8])
+                self.counters = {}
+                self.histograms = {}
+                self.next_flush = time.time() + self.flush_interval
+
+    def inc(self, name, labels, value=1):
+        self.check_process()
+        with self.lock:
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+        self.maybe_flush()
+
+    def observe(self, name, labels, value):
+        self.check_process()
+        buckets = BUCKETS[name]
+        with self.lock:
+            key = (name, labels)
+            # count per bucket (the last one is +Inf), then sum and count
+            histogram = self.histograms.setdefault(key, [0] * (len(buckets) + 3))
+            histogram[bisect_left(buckets, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if time.time() >= self.next_flush:
+            self.next_flush = time.time() + self.flush_interval
+            self.flush()
+
+    def flush(self):
+        if self.pid != os.getpid():
+            return
+        with self.lock:
+            totals = (dict(self.counters), dict(
+                (key, list(value)) for key, value in self.histograms.items()))
+        self.write(self.name, totals)
+
+    def write(self, name, totals):
+        counters, histograms = totals
+        data = {
+            'counters': [[key, labels, value] for (key, labels), value in counters.items()],
+            'histograms': [[key, labels, value] for (key, labels), value in histograms.items()],
+        }
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        # readers see either the previous or the new totals
+        os.rename(temp_path, os.path.join(self.directory, name))
+
+    def merge_exited(self):
+        """
+        Merge the files of processes which exited into one, so the directory
+        does not grow as workers are replaced. The pids are only meaningful
+        when STREAMFIELDS_METRICS_DIR is local to the host.
+        """
+        if fcntl is None:
+            return
+        with open(os.path.join(self.directory, 'merge.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            exited_path = os.path.join(self.directory, self.exited_name)
+            paths = []
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                match = PROCESS_FILE_RE.match(os.path.basename(path))
+                if match is not None and not is_running(int(match.group(1))):
+                    paths.append(path)
+            if not paths:
+                return
+            totals = ({}, {})
+            if os.path.exists(exited_path):
+                add_totals(totals, read_totals(exited_path))
+            for path in paths:
+                try:
+                    add_totals(totals, read_totals(path))
+                except (IOError, ValueError):
+                    pass
+            self.write(self.exited_name, totals)
+            for path in paths:
+                os.remove(path)
+
+    def collect(self):
+        self.flush()
+        self.merge_exited()
+        totals = ({}, {})
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                add_totals(totals, read_totals(path))
+            except (IOError, ValueError):
+                continue
+        return render_prometheus(*totals)
+
+
+def format_labels(labels):
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, ('%s' % value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in labels) if labels else ''
+
+
+def render_prometheus(counters, histograms):
+    lines = []
+    for name in sorted(METRICS):
+        metric_type, description = METRICS[name]
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append('%s%s %s' % (name, format_labels(labels), value))
+        for (metric, labels), value in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS[name] + ('+Inf',), value):
+                cumulative += count
+                lines.append('%s_bucket%s %s' % (
+                    name, format_labels(labels + (('le', bound),)), cumulative))
+            lines.append('%s_sum%s %s' % (name, format_labels(labels), value[-2]))
+            lines.append('%s_count%s %s' % (name, format_labels(labels), value[-1]))
+    return '\n'.join(lines) + '\n'
+
+
+def get_sink():
+    """Return the configured MetricsSink, or None when metrics are off."""
+    global _sink
+    if _sink is None:
+        path = get_setting('STREAMFIELDS_METRICS_SINK')
+        with _sink_lock:
+            if _sink is None:
+                _sink = import_string(path)() if path else False
+    return _sink or None
+
+
+def inc(name, value=1, **labels):
+    sink = get_sink()
+    if sink is not None:
+        sink.inc(name, tuple(sorted(labels.items())), value)
+
+
+def observe(name, value, **labels):
+    sink = get_sink()
+    if sink is not None:
+        sink.observe(name, tuple(sorted(labels.items())), value)
+
+
+class QueryCounter(object):
+    def __init__(self):
+        self.count = 0
+
+
+def count_query():
+    for counter in getattr(_queries, 'counters', ()):
+        counter.count += 1
+
+
+def counting_execute_wrapper(execute, sql, params, many, context):
+    count_query()
+    return execute(sql, params, many, context)
+
+
+class CountingCursorWrapper(CursorWrapper):
+    def execute(self, sql, params=None):
+        count_query()
+        return super(CountingCursorWrapper, self).execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        count_query()
+        return super(CountingCursorWrapper, self).executemany(sql, param_list)
+
+
+def make_counting_cursor(connection, cursor):
+    return CountingCursorWrapper(cursor, connection)
+
+
+@contextmanager
+def count_queries():
+    """
+    Count the queries of the current thread within the block, with the
+    execute wrappers of its connections or, before Django 2.0, by wrapping
+    their cursors; connections are per thread. Before Django 2.0, queries
+    through debug cursors (with DEBUG on) are not counted.
+    """
+    counter = QueryCounter()
+    counters = getattr(_queries, 'counters', None)
+    if get_sink() is None or counters:
+        # nothing to record, or an enclosing block counts already
+        if counters:
+            counters.append(counter)
+        try:
+            yield counter
+        finally:
+            if counters:
+                counters.remove(counter)
+        return
+
+    _queries.counters = [counter]
+    wrapped = list(connections.all())
+    for connection in wrapped:
+        if hasattr(connection, 'execute_wrappers'):
+            connection.execute_wrappers.append(counting_execute_wrapper)
+        else:
+            connection.make_cursor = partial(make_counting_cursor, connection)
+    try:
+        yield counter
+    finally:
+        for connection in wrapped:
+            if hasattr(connection, 'execute_wrappers'):
+                connection.execute_wrappers.remove(counting_execute_wrapper)
+            else:
+                del connection.make_cursor
+        _queries.counters = None
+
+
+def record_render(block_type, seconds, size, queries):
+    sink = get_sink()
+    if sink is None:
+        return
+    labels = (('block_type', block_type),)
+    sink.observe('streamfields_block_render_seconds', labels, seconds)
+    sink.inc('streamfields_block_render_bytes_total', labels, size)
+    sink.observe('streamfields_block_render_queries', labels, queries)
@@ -0,0 +1,83 @@
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:
+    MiddlewareMixin = object
+
+from wagtail.wagtailcore.models import Page
+
+from .blocks import (
+    activate_grid_block, deactivate_grid_block, get_grid_block_for_site)
+from .budgets import activate_budgets, deactivate_budgets
+from .page_patch import insert_patch_config
+from .rendering import STYLES_PLACEHOLDER, insert_style_rules
+
+
+class StreamfieldsSiteMiddleware(MiddlewareMixin):
+    """
+    Activates the per-site streamfields allowlist and performance budgets
+    while a page is created or edited in the Wagtail admin, and lets the
+    page editor save patches. Other requests are left untouched.
+    """
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return None
+
+        if match.url_name == 'uwkm_streamfields_page_patch':
+            page_id = view_args[0]
+        elif match.namespace != 'wagtailadmin_pages':
+            return None
+        elif match.url_name in ('edit', 'preview_on_edit'):
+            page_id = view_args[0]
+        elif match.url_name in ('add', 'preview_on_add'):
+            page_id = view_args[2]
+        else:
+            return None
+
+        page = Page.objects.filter(id=page_id).first()
+        site = page.get_site() if page is not None else None
+        if site is not None:
+            activate_grid_block(get_grid_block_for_site(site))
+        if page is not None:
+            activate_budgets(site)
+        return None
+
+    def process_response(self, request, response):
+        deactivate_grid_block()
+        deactivate_budgets()
+        config = getattr(request, '_streamfields_patch', None)
+        if config is None or response.status_code != 200 or response.streaming:
+            return response
+        if 'text/html' not in response.get('Content-Type', ''):
+            return response
+
+        response.content = insert_patch_config(
+            response.content.decode(response.charset), config)
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = str(len(response.content))
+        return response
+
+    def process_exception(self, request, exception):
+        deactivate_grid_block()
+        deactivate_budgets()
+        return None
+
+
+class StreamfieldsStylesMiddleware(MiddlewareMixin):
+    """
+    Inserts the rules of the style classes used by the blocks of a page at
+    the {% streamfields_styles %} placeholder.
+    """
+    def process_response(self, request, response):
+        state = getattr(request, '_streamfields_render_state', None)
+        if state is None or not state.defer_styles or response.streaming:
+            return response
+        if 'text/html' not in response.get('Content-Type', ''):
+            return response
+
+        content = response.content.decode(response.charset)
+        if STYLES_PLACEHOLDER in content:
+            response.content = insert_style_rules(content, state)
+            if response.has_header('Content-Length'):
+                response['Content-Length'] = str(len(response.content))
+        return response
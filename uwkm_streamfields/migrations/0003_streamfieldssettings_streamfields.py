@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uwkm_streamfields', '0002_auto_20170628_1614'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='streamfieldssettings',
+            name='streamfields',
+            field=models.TextField(blank=True, help_text="Streamfields available on this site, separated with a ','. Leave empty to use the STREAMFIELDS setting."),
+        ),
+        migrations.AddField(
+            model_name='streamfieldssettings',
+            name='exclude_streamfields',
+            field=models.TextField(blank=True, help_text="Streamfields not available on this site, separated with a ','. Leave empty to use the EXCLUDE_STREAMFIELDS setting."),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailcore', '0033_remove_golive_expiry_help_text'),
+        ('uwkm_streamfields', '0003_streamfieldssettings_streamfields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='streamfieldssettings',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.CreateModel(
+            name='PageRenderVersion',
+            fields=[
+                ('page', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='wagtailcore.Page')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('last_modified', models.DateTimeField()),
+                ('revision', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='wagtailcore.PageRevision')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PageReference',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_type', models.CharField(max_length=100)),
+                ('object_id', models.PositiveIntegerField()),
+                ('page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='wagtailcore.Page')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='pagereference',
+            index_together=set([('object_type', 'object_id')]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uwkm_streamfields', '0004_page_render_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagereference',
+            name='revision',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='wagtailcore.PageRevision'),
+        ),
+        migrations.AddField(
+            model_name='pagereference',
+            name='block_path',
+            field=models.CharField(default='', max_length=255),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailcore', '0033_remove_golive_expiry_help_text'),
+        ('uwkm_streamfields', '0005_pagereference_block_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlockInstance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('block_type', models.CharField(db_index=True, help_text="Name of the nearest enclosing stream child, e.g. 'google_maps'.", max_length=100)),
+                ('block_class', models.CharField(db_index=True, max_length=100)),
+                ('path', models.CharField(max_length=255)),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='wagtailcore.Page')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BlockInstanceValue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('value', models.CharField(max_length=255)),
+                ('block', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='values', to='uwkm_streamfields.BlockInstance')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='blockinstancevalue',
+            index_together=set([('name', 'value')]),
+        ),
+    ]
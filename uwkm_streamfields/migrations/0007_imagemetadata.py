@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+from wagtail.wagtailimages import get_image_model_string
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(get_image_model_string()),
+        ('uwkm_streamfields', '0006_blockinstance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageMetadata',
+            fields=[
+                ('image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=get_image_model_string())),
+                ('source', models.CharField(help_text='Name of the file the metadata was computed from.', max_length=255)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('dominant_color', models.CharField(max_length=7)),
+                ('placeholder', models.TextField(help_text='Data URI of the placeholder image.')),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uwkm_streamfields', '0007_imagemetadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='streamfieldssettings',
+            name='eager_media',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Number of images and videos at the top of a page which load immediately, the others load lazily. Leave empty to use the STREAMFIELDS_EAGER_MEDIA setting.', null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('uwkm_streamfields', '0008_streamfieldssettings_eager_media'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredTable',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(help_text='Name of the imported file.', max_length=255)),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('column_count', models.PositiveIntegerField(default=0)),
+                ('first_row_is_table_header', models.BooleanField(default=False)),
+                ('first_col_is_header', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('uploaded_by_user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StoredTableChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('first_row', models.PositiveIntegerField()),
+                ('rows', models.TextField(help_text='JSON list of rows, lists of cell texts.')),
+                ('table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='uwkm_streamfields.StoredTable')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='storedtablechunk',
+            unique_together=set([('table', 'index')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uwkm_streamfields', '0009_storedtable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IconSubset',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('icons', models.TextField(help_text="Names of the icons in the subset, separated with a ','.")),
+                ('css', models.CharField(help_text='Name of the stylesheet in the default storage.', max_length=255)),
+                ('font', models.CharField(help_text='Name of the preloaded font file in the default storage.', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
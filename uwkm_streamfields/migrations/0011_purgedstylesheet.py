@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uwkm_streamfields', '0010_iconsubset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurgedStylesheet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stylesheet', models.CharField(help_text='Name of the purged stylesheet in the default storage.', max_length=255)),
+                ('rules', models.TextField(help_text='JSON of the purged rules and the selectors of each block type.')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
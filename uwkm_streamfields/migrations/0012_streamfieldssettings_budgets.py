@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uwkm_streamfields', '0011_purgedstylesheet'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='streamfieldssettings',
+            name='budgets',
+            field=models.TextField(blank=True, help_text="Performance budgets overriding the STREAMFIELDS_BUDGETS setting, one per line as 'name: warning, error' (e.g. 'images: 60, 150'). Leave a limit empty to disable it."),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uwkm_streamfields', '0012_streamfieldssettings_budgets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='streamfieldssettings',
+            name='last_modified',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
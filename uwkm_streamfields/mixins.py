@@ -0,0 +1,114 @@
+import hashlib
+from calendar import timegm
+
+from django.core.exceptions import ValidationError
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from wagtail.wagtailcore.blocks.stream_block import StreamBlockValidationError
+
+from .budgets import check_page_budgets
+from .hints import get_page_hints
+from .models import PageRenderVersion, StreamfieldsSettings
+
+
+def get_etag(page_id, render_version, settings_version):
+    """Return the ETag of a live page from its PageRenderVersion."""
+    return '"%s"' % hashlib.sha1(('%s:%s:%s:%s' % (
+        page_id, render_version.revision_id, render_version.version,
+        settings_version)).encode('utf-8')).hexdigest()
+
+
+def is_authenticated(user):
+    # a method before Django 1.10
+    if callable(user.is_authenticated):
+        return user.is_authenticated()
+    return user.is_authenticated
+
+
+class ConditionalPageMixin(object):
+    """
+    Page mixin answering If-None-Match and If-Modified-Since with 304 Not
+    Modified before rendering. The validators are precomputed when the page
+    is published and when objects it references change, so checking them
+    costs two small queries.
+    """
+    def get_validators(self, request):
+        """Return the (etag, last modified timestamp) of the live page."""
+        render_version = PageRenderVersion.objects.filter(page_id=self.pk).first()
+        if render_version is None:
+            return None, None
+
+        if getattr(request, 'site', None) is not None:
+            settings = StreamfieldsSettings.for_request(request)
+        else:
+            settings = StreamfieldsSettings.for_site(self.get_site())
+        # a change of the settings changes the page as well
+        last_modified = render_version.last_modified
+        if settings.last_modified is not None:
+            last_modified = max(last_modified, settings.last_modified)
+        return (get_etag(self.pk, render_version, settings.version),
+                timegm(last_modified.utctimetuple()))
+
+    def serve(self, request, *args, **kwargs):
+        user = getattr(request, 'user', None)
+        if request.method not in ('GET', 'HEAD') or \
+                getattr(request, 'is_preview', False) or \
+                (user is not None and is_authenticated(user)):
+            return super(ConditionalPageMixin, self).serve(request, *args, **kwargs)
+
+        etag, last_modified = self.get_validators(request)
+        if etag is None:
+            return super(ConditionalPageMixin, self).serve(request, *args, **kwargs)
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super(ConditionalPageMixin, self).serve(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class PreloadHintsMixin(object):
+    """
+    Page mixin sending Link preload and preconnect headers for the hero
+    image, assets and fonts the page's blocks need. Servers and proxies
+    which support it turn them into 103 Early Hints; a WSGI server offering
+    a wsgi.early_hints callable gets them before the page renders.
+    """
+    def serve(self, request, *args, **kwargs):
+        if getattr(request, 'is_preview', False):
+            return super(PreloadHintsMixin, self).serve(request, *args, **kwargs)
+
+        hints = get_page_hints(self, request)
+        early_hints = request.META.get('wsgi.early_hints')
+        if hints and callable(early_hints):
+            early_hints([('Link', ', '.join(hints))])
+
+        response = super(PreloadHintsMixin, self).serve(request, *args, **kwargs)
+        if hints and response.status_code == 200:
+            response['Link'] = ', '.join(hints)
+        return response
+
+
+class PerformanceBudgetMixin(object):
+    """
+    Page mixin checking the performance budgets of the page's blocks (see
+    budgets.py) when it is cleaned while being edited in the admin.
+    StreamFields left out of a form are not checked, so the check is done
+    in full_clean(), which knows them.
+    """
+    def full_clean(self, exclude=None, validate_unique=True):
+        errors = {}
+        try:
+            super(PerformanceBudgetMixin, self).full_clean(exclude, validate_unique)
+        except ValidationError as e:
+            errors = e.update_error_dict(errors)
+        for name, messages in check_page_budgets(self, exclude or ()).items():
+            # a StreamField renders a single error
+            if name not in errors:
+                errors[name] = [StreamBlockValidationError(non_block_errors=messages)]
+        if errors:
+            raise ValidationError(errors)
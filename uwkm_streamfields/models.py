@@ -1,7 +1,15 @@
-# UWKM Streamfields.
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 
 from wagtail.contrib.settings.models import BaseSetting, register_setting
+from wagtail.wagtailimages import get_image_model_string
+
+from .conf import get_setting
+
+# see budgets.py
+BUDGET_NAMES = ('blocks', 'depth', 'images', 'iframes', 'transfer_bytes', 'stream_bytes')
 
 @register_setting
 class StreamfieldsSettings(BaseSetting):
@@ -17,4 +25,341 @@ class StreamfieldsSettings(BaseSetting):
     	max_length=255,
     	help_text="API Key van Google",
         blank=True
-    )
\ No newline at end of file
+    )
+    streamfields = models.TextField(
+        help_text="Streamfields available on this site, separated with a ','. "
+                  "Leave empty to use the STREAMFIELDS setting.",
+        blank=True
+    )
+    exclude_streamfields = models.TextField(
+        help_text="Streamfields not available on this site, separated with a ','. "
+                  "Leave empty to use the EXCLUDE_STREAMFIELDS setting.",
+        blank=True
+    )
+    eager_media = models.PositiveSmallIntegerField(
+        help_text="Number of images and videos at the top of a page which load "
+                  "immediately, the others load lazily. Leave empty to use the "
+                  "STREAMFIELDS_EAGER_MEDIA setting.",
+        null=True,
+        blank=True
+    )
+    budgets = models.TextField(
+        help_text="Performance budgets overriding the STREAMFIELDS_BUDGETS setting, "
+                  "one per line as 'name: warning, error' (e.g. 'images: 60, 150'). "
+                  "Leave a limit empty to disable it.",
+        blank=True
+    )
+    version = models.PositiveIntegerField(
+        default=1,
+        editable=False
+    )
+    last_modified = models.DateTimeField(
+        null=True,
+        editable=False
+    )
+
+    def clean(self):
+        try:
+            parse_budgets(self.budgets)
+        except ValueError as e:
+            raise ValidationError({'budgets': '%s' % e})
+
+    def save(self, *args, **kwargs):
+        raise_version = self.pk is not None and not self._state.adding
+        if raise_version:
+            # in the database, so concurrent saves each raise it
+            self.version = models.F('version') + 1
+        self.last_modified = timezone.now()
+        super(StreamfieldsSettings, self).save(*args, **kwargs)
+        if raise_version:
+            self.refresh_from_db(fields=['version'])
+
+    @classmethod
+    def for_request(cls, request):
+        """Return the settings of the request's site, loaded once per request."""
+        from .metrics import inc
+        try:
+            instance = request._streamfields_settings
+        except AttributeError:
+            instance = request._streamfields_settings = cls.for_site(request.site)
+            inc('streamfields_settings_cache_requests_total', result='miss')
+        else:
+            inc('streamfields_settings_cache_requests_total', result='hit')
+        return instance
+
+    def get_streamfields(self):
+        """
+        Return the (streamfields, exclude_streamfields) allowlist of this
+        site, falling back to the project settings.
+        """
+        streamfields = split_names(self.streamfields) or settings.STREAMFIELDS
+        if '__all__' in streamfields:
+            streamfields = '__all__'
+        exclude_streamfields = split_names(self.exclude_streamfields) or \
+            settings.EXCLUDE_STREAMFIELDS
+        return streamfields, exclude_streamfields
+
+
+    def get_budgets(self):
+        """
+        Return the performance budgets of this site, name -> (warning limit,
+        error limit), falling back to the project settings.
+        """
+        budgets = dict(get_setting('STREAMFIELDS_BUDGETS'))
+        budgets.update(parse_budgets(self.budgets))
+        return budgets
+
+
+def split_names(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def parse_budgets(value):
+    """Parse the 'name: warning, error' lines of StreamfieldsSettings.budgets."""
+    budgets = {}
+    for line in value.splitlines():
+        if not line.strip():
+            continue
+        name, sep, limits = line.partition(':')
+        name = name.strip()
+        limits = limits.split(',')
+        if not sep or name not in BUDGET_NAMES or len(limits) != 2:
+            raise ValueError("Invalid budget line %r." % line.strip())
+        try:
+            budgets[name] = tuple(
+                int(limit) if limit.strip() else None for limit in limits)
+        except ValueError:
+            raise ValueError("Invalid limit in budget line %r." % line.strip())
+    return budgets
+
+
+class PageRenderVersion(models.Model):
+    """
+    Validator data of a live page: the revision it was published from and a
+    version which is raised whenever an object its stream data references
+    changes.
+    """
+    page = models.OneToOneField(
+        'wagtailcore.Page',
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    revision = models.ForeignKey(
+        'wagtailcore.PageRevision',
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='+'
+    )
+    version = models.PositiveIntegerField(
+        default=1
+    )
+    last_modified = models.DateTimeField()
+
+
+class PageReference(models.Model):
+    """
+    An image, page, document or product chosen in the stream data of a live
+    page, with the revision and the block path it was found at.
+    """
+    page = models.ForeignKey(
+        'wagtailcore.Page',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    revision = models.ForeignKey(
+        'wagtailcore.PageRevision',
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='+'
+    )
+    block_path = models.CharField(
+        max_length=255
+    )
+    object_type = models.CharField(
+        max_length=100
+    )
+    object_id = models.PositiveIntegerField()
+
+    class Meta:
+        index_together = [
+            ('object_type', 'object_id'),
+        ]
+
+
+class BlockInstance(models.Model):
+    """
+    A block in the stream data of a live page: a child of a StreamBlock or a
+    StructBlock value (including ListBlock items).
+    """
+    page = models.ForeignKey(
+        'wagtailcore.Page',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    block_type = models.CharField(
+        max_length=100,
+        db_index=True,
+        help_text="Name of the nearest enclosing stream child, e.g. 'google_maps'."
+    )
+    block_class = models.CharField(
+        max_length=100,
+        db_index=True
+    )
+    path = models.CharField(
+        max_length=255
+    )
+    depth = models.PositiveSmallIntegerField()
+
+
+class BlockInstanceValue(models.Model):
+    """A scalar field of an indexed block, see STREAMFIELDS_INDEXED_FIELDS."""
+    block = models.ForeignKey(
+        BlockInstance,
+        on_delete=models.CASCADE,
+        related_name='values'
+    )
+    name = models.CharField(
+        max_length=100
+    )
+    value = models.CharField(
+        max_length=255
+    )
+
+    class Meta:
+        index_together = [
+            ('name', 'value'),
+        ]
+
+
+class ImageMetadata(models.Model):
+    """
+    Intrinsic size, dominant color and a tiny blurred placeholder of an
+    image, so templates can reserve its space and paint something before
+    the image itself arrives.
+    """
+    image = models.OneToOneField(
+        get_image_model_string(),
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+'
+    )
+    source = models.CharField(
+        max_length=255,
+        help_text="Name of the file the metadata was computed from."
+    )
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    dominant_color = models.CharField(
+        max_length=7
+    )
+    placeholder = models.TextField(
+        help_text="Data URI of the placeholder image."
+    )
+
+    @property
+    def aspect_ratio(self):
+        """Height as a percentage of the width, for padding-bottom boxes."""
+        if not self.width:
+            return None
+        return '%.3f%%' % (100.0 * self.height / self.width)
+
+
+class StoredTable(models.Model):
+    """
+    Table imported from a CSV or XLSX file. Its rows are stored in chunks
+    outside the page JSON, which only holds the table's id, see
+    TableStructBlock.
+    """
+    title = models.CharField(
+        max_length=255,
+        help_text="Name of the imported file."
+    )
+    row_count = models.PositiveIntegerField(
+        default=0
+    )
+    column_count = models.PositiveIntegerField(
+        default=0
+    )
+    first_row_is_table_header = models.BooleanField(
+        default=False
+    )
+    first_col_is_header = models.BooleanField(
+        default=False
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True
+    )
+    uploaded_by_user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='+'
+    )
+
+    def get_rows(self, start=0, stop=None):
+        """Return rows start to stop, loading only the chunks holding them."""
+        from .tables import get_rows
+        return get_rows(self, start, stop)
+
+
+class StoredTableChunk(models.Model):
+    """STREAMFIELDS_TABLE_CHUNK_ROWS consecutive rows of a StoredTable."""
+    table = models.ForeignKey(
+        StoredTable,
+        on_delete=models.CASCADE,
+        related_name='chunks'
+    )
+    index = models.PositiveIntegerField()
+    first_row = models.PositiveIntegerField()
+    rows = models.TextField(
+        help_text="JSON list of rows, lists of cell texts."
+    )
+
+    class Meta:
+        unique_together = [
+            ('table', 'index'),
+        ]
+
+
+class IconSubset(models.Model):
+    """
+    A Font Awesome subset holding only the icons used by the blocks, see
+    icon_subset.py. The latest one is served.
+    """
+    icons = models.TextField(
+        help_text="Names of the icons in the subset, separated with a ','."
+    )
+    css = models.CharField(
+        max_length=255,
+        help_text="Name of the stylesheet in the default storage."
+    )
+    font = models.CharField(
+        max_length=255,
+        help_text="Name of the preloaded font file in the default storage."
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    def get_icons(self):
+        return set(split_names(self.icons))
+
+
+class PurgedStylesheet(models.Model):
+    """
+    The block stylesheets purged of the selectors no block template can
+    produce, with the rules each block type needs above the fold, see
+    critical_css.py. The latest one is served.
+    """
+    stylesheet = models.CharField(
+        max_length=255,
+        help_text="Name of the purged stylesheet in the default storage."
+    )
+    rules = models.TextField(
+        help_text="JSON of the purged rules and the selectors of each block type."
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True
+    )
@@ -0,0 +1,118 @@
+"""
+Saving pages from a patch of the editor form instead of the whole form, see
+the page_patch view and custom-admin.js. A patch holds the fields outside of
+StreamFields and, for each StreamField the editor changed, the order of its
+children: unchanged ones by their index in the revision the editor was
+opened with, changed and new ones with their form data. Only those are
+converted and validated; the others keep their stored data as it is.
+"""
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.datastructures import MultiValueDict
+from django.utils.translation import ugettext as _
+
+from wagtail.wagtailcore.blocks import StreamValue
+
+from .stream import get_raw_stream, get_stream_fields
+
+
+class PatchError(Exception):
+    pass
+
+
+def insert_patch_config(html, config):
+    """
+    Add the patch config of an editor (see wagtail_hooks.remember_edited_page)
+    to its html as the streamfieldsPatch variable custom-admin.js reads.
+    """
+    script = '<script type="text/javascript">var streamfieldsPatch = %s;</script>' % (
+        json.dumps(config).replace('</', '<\\/'))
+    index = html.rfind('</body>')
+    if index == -1:
+        return html
+    return html[:index] + script + html[index:]
+
+
+def to_datadict(data):
+    """Return the form data of a patch, name -> list of values, as a MultiValueDict."""
+    if not isinstance(data, dict):
+        raise PatchError("Form data must be an object.")
+    return MultiValueDict(dict(
+        (name, value if isinstance(value, list) else [value])
+        for name, value in data.items()
+    ))
+
+
+def apply_stream_patch(field, raw, children, data):
+    """
+    Return the stored data of a StreamField after a patch, and the errors
+    of the changed children by their form prefix.
+    """
+    stream_block = field.stream_block
+    # the editor skips children of unknown types, so do their indexes
+    valid_children = [child for child in raw if child.get('type') in stream_block.child_blocks]
+    patched = []
+    errors = {}
+    for child in children:
+        if 'index' in child:
+            try:
+                patched.append(valid_children[int(child['index'])])
+            except (IndexError, TypeError, ValueError):
+                raise PatchError("Unknown child %r of %s." % (child['index'], field.name))
+            continue
+
+        prefix = '%s' % child.get('prefix')
+        if not prefix.startswith('%s-' % field.name):
+            raise PatchError("Invalid prefix %r." % prefix)
+        type_name = data.get('%s-type' % prefix)
+        block = stream_block.child_blocks.get(type_name)
+        if block is None:
+            raise PatchError("Unknown block type %r." % type_name)
+        value = block.value_from_datadict(data, {}, '%s-value' % prefix)
+        try:
+            value = block.clean(value)
+        except ValidationError as e:
+            errors[prefix] = e.messages
+            continue
+        patched.append({'type': type_name, 'value': block.get_prep_value(value)})
+
+    if not patched and not field.blank:
+        errors[field.name] = [_("This field is required.")]
+    return patched, errors
+
+
+def apply_patch(page, patch):
+    """
+    Apply the StreamField part of a patch to a page object, returning the
+    stored data of every StreamField and the errors.
+    """
+    streams = patch.get('streams') or {}
+    data = to_datadict(patch.get('data') or {})
+    stream_data = {}
+    errors = {}
+    for field in get_stream_fields(type(page)):
+        raw = get_raw_stream(page, field)
+        if field.name in streams:
+            raw, field_errors = apply_stream_patch(field, raw, streams[field.name], data)
+            errors.update(field_errors)
+        stream_data[field.name] = raw
+    return stream_data, errors
+
+
+def set_stored_stream_data(page, stream_data, lazy=False):
+    """
+    Set the StreamFields of a page to stored data. Unless lazy, the data is
+    passed as the raw_text of an empty StreamValue, which
+    StreamField.get_prep_value writes out as it is, so saving a revision
+    does not convert every block of the page.
+    """
+    for field in get_stream_fields(type(page)):
+        raw = stream_data[field.name]
+        if lazy:
+            value = StreamValue(field.stream_block, raw, is_lazy=True)
+        else:
+            value = StreamValue(
+                field.stream_block, [], raw_text=json.dumps(raw, cls=DjangoJSONEncoder))
+        setattr(page, field.name, value)
@@ -0,0 +1,94 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from wagtail.wagtailcore.blocks import ChooserBlock
+
+from .models import PageReference, PageRenderVersion
+from .stream import get_object_type, iter_references
+
+_tracked_object_types = None
+
+
+def iter_block_definitions(block):
+    yield block
+    children = getattr(block, 'child_blocks', None)
+    if children is not None:
+        children = children.values()
+    elif hasattr(block, 'child_block'):
+        children = [block.child_block]
+    for child_block in children or []:
+        for item in iter_block_definitions(child_block):
+            yield item
+
+
+def get_tracked_object_types():
+    """Return the object types the GridBlock choosers can reference."""
+    global _tracked_object_types
+    if _tracked_object_types is None:
+        from .blocks import GridBlock
+        _tracked_object_types = frozenset(
+            get_object_type(block.target_model)
+            for block in iter_block_definitions(GridBlock())
+            if isinstance(block, ChooserBlock)
+        )
+    return _tracked_object_types
+
+
+def update_page_references(page, revision=None):
+    """
+    Record the objects referenced by a live page, the revision it was
+    published from and where in the stream data they are chosen.
+    """
+    references = [
+        PageReference(
+            page_id=page.pk,
+            revision=revision,
+            block_path='.'.join(path)[:255],
+            object_type=object_type,
+            object_id=int(object_id),
+        )
+        for object_type, object_id, path in iter_references(page)
+    ]
+    with transaction.atomic():
+        PageReference.objects.filter(page_id=page.pk).delete()
+        PageReference.objects.bulk_create(references)
+        PageRenderVersion.objects.update_or_create(page_id=page.pk, defaults={
+            'revision': revision,
+            'last_modified': timezone.now(),
+        })
+
+
+def remove_page_references(page):
+    PageReference.objects.filter(page_id=page.pk).delete()
+    PageRenderVersion.objects.filter(page_id=page.pk).delete()
+
+
+def get_referencing_page_ids(object_type, object_id):
+    return list(PageReference.objects.filter(
+        object_type=object_type, object_id=object_id,
+    ).values_list('page_id', flat=True).distinct())
+
+
+def get_usage(instance):
+    """Return the references to an image, page, document or product."""
+    return PageReference.objects.filter(
+        object_type=get_object_type(type(instance)), object_id=instance.pk,
+    ).select_related('page')
+
+
+def invalidate_object(instance):
+    """
+    Raise the render version of the live pages which reference a changed
+    image, page, document or product. This changes their validators and the
+    keys of their cached fragments.
+    """
+    object_type = get_object_type(type(instance))
+    if object_type not in get_tracked_object_types() or instance.pk is None:
+        return []
+
+    page_ids = get_referencing_page_ids(object_type, instance.pk)
+    if page_ids:
+        PageRenderVersion.objects.filter(page_id__in=page_ids).update(
+            version=F('version') + 1, last_modified=timezone.now())
+    return page_ids
@@ -0,0 +1,467 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connections
+from django.utils import timezone, translation
+from django.utils.html import format_html_join
+from django.utils.safestring import mark_safe
+
+from wagtail.wagtailcore.blocks import StreamValue, StructValue
+
+from . import metrics
+from .conf import get_setting
+from .routers import read_from_replica
+
+PRESERVED_RE = re.compile(
+    r'(<(pre|textarea|script)\b.*?</\2\s*>)', re.IGNORECASE | re.DOTALL)
+STYLE_RE = re.compile(r'<style\b[^>]*>(.*?)</style\s*>', re.IGNORECASE | re.DOTALL)
+COMMENT_RE = re.compile(r'<!--(?!\[if).*?-->', re.DOTALL)
+WHITESPACE_RE = re.compile(r'\s+')
+CSS_PUNCTUATION_RE = re.compile(r'\s*([{};,])\s*')
+CSS_VALUE_RE = re.compile(r'^[^<>{};]*$')
+
+STYLES_PLACEHOLDER = '<!--uwkm-streamfields-styles-->'
+
+MediaLoading = namedtuple('MediaLoading', ['loading', 'fetchpriority'])
+EAGER = MediaLoading('eager', 'high')
+LAZY = MediaLoading('lazy', 'auto')
+
+
+class RenderState(object):
+    """
+    State shared by all GridBlock content rendered for one page. It lives on
+    the request, so every block template that receives the page context sees
+    the same instance.
+    """
+    def __init__(self):
+        self.styles = set()
+        # hashed class name -> css declarations, see get_style_class()
+        self.style_classes = {}
+        self.emitted_style_classes = set()
+        self.defer_styles = False
+        # captures are per thread, fragments may render in the render pool
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # page id -> PageRenderVersion.version
+        self.page_versions = {}
+        # image id -> ImageMetadata or None, see get_image_metadata()
+        self.image_metadata = None
+        # images and iframes rendered so far, in page order
+        self.media_count = 0
+        self.eager_media = None
+        self.settings_version = None
+        # id(stream value) -> (stream value, fragments), see prerender_grids()
+        self.prerendered = {}
+
+    def get_page_version(self, page):
+        if page.pk not in self.page_versions:
+            from .models import PageRenderVersion
+            self.page_versions[page.pk] = PageRenderVersion.objects.filter(
+                page_id=page.pk).values_list('version', flat=True).first() or 0
+        return self.page_versions[page.pk]
+
+    def get_settings_version(self, request, page):
+        """
+        Return the version of the Streamfields settings of the request's
+        site, or of the page's site outside of requests.
+        """
+        if self.settings_version is None:
+            from .models import StreamfieldsSettings
+            if getattr(request, 'site', None) is not None:
+                self.settings_version = StreamfieldsSettings.for_request(request).version
+            elif getattr(page, 'pk', None) is not None and page.get_site() is not None:
+                self.settings_version = StreamfieldsSettings.for_site(page.get_site()).version
+            else:
+                self.settings_version = 0
+        return self.settings_version
+
+    def get_image_metadata(self, page, image):
+        """
+        Return the ImageMetadata of an image. The metadata of all images of
+        the page is loaded on the first call.
+        """
+        from .image_metadata import get_image_metadata, get_page_image_ids
+        if self.image_metadata is None:
+            page_image_ids = get_page_image_ids(page) if page is not None else ()
+            self.image_metadata = get_image_metadata(page_image_ids)
+        if image.pk not in self.image_metadata:
+            self.image_metadata.update(get_image_metadata([image.pk]))
+        return self.image_metadata[image.pk]
+
+    def get_eager_media(self, request):
+        """
+        Return how many media at the top of the page load eagerly, from the
+        Streamfields settings of the request's site.
+        """
+        if self.eager_media is None:
+            self.eager_media = get_setting('STREAMFIELDS_EAGER_MEDIA')
+            site = getattr(request, 'site', None)
+            if site is not None:
+                from .models import StreamfieldsSettings
+                eager_media = StreamfieldsSettings.for_request(request).eager_media
+                if eager_media is not None:
+                    self.eager_media = eager_media
+        return self.eager_media
+
+    @property
+    def _captures(self):
+        try:
+            return self._local.captures
+        except AttributeError:
+            self._local.captures = []
+            return self._local.captures
+
+    def next_media(self):
+        with self._lock:
+            index = self.media_count
+            self.media_count += 1
+        for capture in self._captures:
+            capture['media'] += 1
+        return index
+
+    def add_style_class(self, name, declarations):
+        self.style_classes[name] = declarations
+        for capture in self._captures:
+            capture['style_classes'][name] = declarations
+
+    def capture(self):
+        """
+        Start recording the style classes added and the media rendered while
+        rendering a fragment, so they can be cached with it.
+        """
+        self._captures.append({'style_classes': {}, 'media': 0})
+
+    def end_capture(self):
+        return self._captures.pop()
+
+    def pop_style_rules(self):
+        """Return the rules of the style classes not emitted yet."""
+        names = sorted(set(self.style_classes) - self.emitted_style_classes)
+        self.emitted_style_classes.update(names)
+        return ''.join(
+            '.%s{%s}' % (name, self.style_classes[name]) for name in names)
+
+
+def get_render_state(context):
+    request = context.get('request') if context else None
+    if request is None:
+        return RenderState()
+    try:
+        return request._streamfields_render_state
+    except AttributeError:
+        request._streamfields_render_state = RenderState()
+        return request._streamfields_render_state
+
+
+def minify_css(css):
+    return CSS_PUNCTUATION_RE.sub(r'\1', WHITESPACE_RE.sub(' ', css)).strip()
+
+
+def minify_html(html):
+    """
+    Collapse whitespace and drop comments. The contents of <pre>, <textarea>
+    and <script> are left untouched, <style> contents are minified.
+    """
+    parts = PRESERVED_RE.split(html)
+    minified = []
+    # split() yields text, preserved element, tag name, text, ...
+    for i in range(0, len(parts), 3):
+        text = COMMENT_RE.sub('', parts[i])
+        text = WHITESPACE_RE.sub(' ', text)
+        text = STYLE_RE.sub(
+            lambda match: '<style>%s</style>' % minify_css(match.group(1)), text)
+        minified.append(text)
+        if i + 1 < len(parts):
+            minified.append(parts[i + 1])
+    return ''.join(minified).strip()
+
+
+def dedupe_styles(html, state):
+    """Drop <style> elements which were already emitted on this page."""
+    def replace(match):
+        digest = hashlib.sha1(match.group(1).strip().encode('utf-8')).hexdigest()
+        if digest in state.styles:
+            return ''
+        state.styles.add(digest)
+        return match.group(0)
+    return STYLE_RE.sub(replace, html)
+
+
+def get_style_class(state, declarations):
+    """
+    Return the hashed class name for a list of (property, value) pairs and
+    register its rule on the render state. Values which could break out of
+    a rule are dropped.
+    """
+    values = [
+        (prop, ('%s' % value).strip()) for prop, value in declarations
+        if value is not None
+    ]
+    css = ';'.join(
+        '%s:%s' % (prop, value) for prop, value in values
+        if value and not value.startswith('!') and CSS_VALUE_RE.match(value)
+    )
+    if not css:
+        return ''
+    name = 'sf-%s' % hashlib.sha1(css.encode('utf-8')).hexdigest()[:8]
+    state.add_style_class(name, css)
+    return name
+
+
+def get_media_loading(context):
+    """
+    Return the loading and fetchpriority attributes of the next image or
+    iframe of the page: the first STREAMFIELDS_EAGER_MEDIA load eagerly with
+    high priority, the rest lazily.
+    """
+    state = get_render_state(context)
+    eager_media = state.get_eager_media(context.get('request') if context else None)
+    if state.next_media() < eager_media:
+        return EAGER
+    return LAZY
+
+
+def insert_style_rules(html, state):
+    """Replace the {% streamfields_styles %} placeholder by the page's rules."""
+    rules = state.pop_style_rules()
+    return html.replace(
+        STYLES_PLACEHOLDER, '<style>%s</style>' % rules if rules else '', 1)
+
+
+def get_fragment_cache(context):
+    """
+    Return the cache of fragments, or None for previews and static exports,
+    which render lists in full.
+    """
+    from .export import EXPORT_ENVIRON_KEY
+
+    alias = get_setting('STREAMFIELDS_CACHE')
+    if alias is None:
+        return None
+    request = context.get('request') if context else None
+    if (getattr(request, 'is_preview', False)
+            or EXPORT_ENVIRON_KEY in getattr(request, 'META', {})):
+        return None
+    return caches[alias]
+
+
+def get_block_type(stream_value, index):
+    if stream_value.is_lazy:
+        return stream_value.stream_data[index]['type']
+    return stream_value.stream_data[index][0]
+
+
+def get_fragment_key(stream_value, index, context, state):
+    """
+    Cache key of the i-th child of a stream, derived from its stored JSON so
+    no chooser values need to be loaded to look a fragment up. The render
+    version of the page is part of the key, raising it purges the page's
+    fragments, as is the version of the Streamfields settings. So is the
+    position of the fragment's first media while it is within the eagerly
+    loaded ones.
+    """
+    if stream_value.is_lazy:
+        raw_value = stream_value.stream_data[index]['value']
+    else:
+        child = stream_value[index]
+        raw_value = child.block.get_prep_value(child.value)
+    digest = hashlib.sha1(json.dumps(
+        raw_value, sort_keys=True, cls=DjangoJSONEncoder).encode('utf-8'))
+    page = context['page']
+    request = context.get('request')
+    eager_media = state.get_eager_media(request)
+    return 'uwkm_streamfields:fragment:%s.%s:%s:%s:%s:%d:%d/%d' % (
+        page.pk, state.get_page_version(page),
+        state.get_settings_version(request, page), get_block_type(stream_value, index),
+        digest.hexdigest(), get_setting('STREAMFIELDS_MINIFY_HTML'),
+        min(state.media_count, eager_media), eager_media)
+
+
+def render_fragment(stream_value, index, context, state):
+    """
+    Render one child of a stream, returning a dict with the html, the style
+    classes it uses and the number of media it contains. Fragments are
+    minified and cached when enabled in the settings, the latter only when
+    they belong to a saved page, whose render version purges them.
+    """
+    cache = get_fragment_cache(context)
+    if getattr(context.get('page') if context else None, 'pk', None) is None:
+        cache = None
+    if cache is not None:
+        key = get_fragment_key(stream_value, index, context, state)
+        fragment = cache.get(key)
+        metrics.inc('streamfields_fragment_cache_requests_total',
+                    result='miss' if fragment is None else 'hit')
+        if fragment is not None:
+            for name, css in fragment.get('style_classes', {}).items():
+                state.add_style_class(name, css)
+            for i in range(fragment.get('media', 0)):
+                state.next_media()
+            return fragment
+
+    started = time.time()
+    state.capture()
+    try:
+        with metrics.count_queries() as queries:
+            html = stream_value[index].render(context=context)
+    finally:
+        captured = state.end_capture()
+    if get_setting('STREAMFIELDS_MINIFY_HTML'):
+        html = minify_html(html)
+    metrics.record_render(
+        get_block_type(stream_value, index), time.time() - started, len(html),
+        queries.count)
+    fragment = {
+        'html': html,
+        'style_classes': captured['style_classes'],
+        'media': captured['media'],
+    }
+
+    if cache is not None:
+        cache.set(key, fragment, get_setting('STREAMFIELDS_CACHE_TIMEOUT'))
+    return fragment
+
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+_render_worker = threading.local()
+
+
+def get_render_pool():
+    """
+    Return the thread pool fragments are rendered in, or None when they
+    have to be rendered serially: when STREAMFIELDS_RENDER_WORKERS is not
+    set, inside the pool itself and inside transactions, whose uncommitted
+    data the workers' connections would not see.
+    """
+    global _render_pool
+    workers = get_setting('STREAMFIELDS_RENDER_WORKERS')
+    if not workers or getattr(_render_worker, 'active', False):
+        return None
+    if any(connection.in_atomic_block for connection in connections.all()):
+        return None
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ThreadPool(workers)
+    return _render_pool
+
+
+def render_fragment_in_worker(args):
+    stream_value, index, context, state, language, current_timezone = args
+    _render_worker.active = True
+    close_old_connections()
+    try:
+        with translation.override(language), timezone.override(current_timezone), \
+                read_from_replica(context):
+            return render_fragment(stream_value, index, context, state)
+    finally:
+        close_old_connections()
+        _render_worker.active = False
+
+
+def render_fragments(streams, context, state):
+    """
+    Render all children of the given streams, returning a list of fragments
+    per stream. Children are rendered in page order until the eagerly
+    loaded media are placed, the rest concurrently in the render pool.
+    """
+    fragments = [[None] * len(stream_value) for stream_value in streams]
+    pool = get_render_pool()
+    eager_media = state.get_eager_media(context.get('request') if context else None)
+
+    pending = []
+    for n, stream_value in enumerate(streams):
+        for i in range(len(stream_value)):
+            if pool is not None and state.media_count >= eager_media:
+                pending.append((n, i))
+            else:
+                fragments[n][i] = render_fragment(stream_value, i, context, state)
+
+    if pending:
+        language = translation.get_language()
+        current_timezone = timezone.get_current_timezone()
+        results = pool.map(render_fragment_in_worker, [
+            (streams[n], i, context, state, language, current_timezone)
+            for n, i in pending
+        ])
+        for (n, i), fragment in zip(pending, results):
+            fragments[n][i] = fragment
+    return fragments
+
+
+def iter_grid_streams(value):
+    """Yield the GridBlock contents within a value, in page order."""
+    from .blocks import GridContentBlock
+
+    if isinstance(value, StreamValue):
+        if isinstance(value.stream_block, GridContentBlock):
+            yield value
+            return
+        for child in value:
+            for stream_value in iter_grid_streams(child.value):
+                yield stream_value
+    elif isinstance(value, StructValue):
+        for child_value in value.values():
+            for stream_value in iter_grid_streams(child_value):
+                yield stream_value
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            for stream_value in iter_grid_streams(item):
+                yield stream_value
+
+
+def prerender_grids(value, context):
+    """
+    Render the contents of all GridBlocks within a value (a StreamField, or
+    a list of GridBlocks) at once, so independent columns render
+    concurrently. render_stream() picks the fragments up.
+    """
+    if get_render_pool() is None:
+        return
+    state = get_render_state(context)
+    with read_from_replica(context):
+        streams = [
+            stream_value for stream_value in iter_grid_streams(value)
+            if id(stream_value) not in state.prerendered
+        ]
+        for stream_value, fragments in zip(
+                streams, render_fragments(streams, context, state)):
+            # the stream value is kept so its id is not reused
+            state.prerendered[id(stream_value)] = (stream_value, fragments)
+
+
+def render_stream(stream_value, context=None):
+    """
+    Render the children of a GridBlock's content the way StreamBlock does,
+    going through the fragment cache and page level post-processing.
+    """
+    state = get_render_state(context)
+    minify = get_setting('STREAMFIELDS_MINIFY_HTML')
+
+    prerendered, fragments = state.prerendered.pop(id(stream_value), (None, None))
+    if prerendered is not stream_value:
+        with read_from_replica(context):
+            fragments = render_fragments([stream_value], context, state)[0]
+
+    rendered = []
+    for i, fragment in enumerate(fragments):
+        html = fragment['html']
+        if minify:
+            html = dedupe_styles(html, state)
+        rendered.append((mark_safe(html), get_block_type(stream_value, i)))
+
+    html = format_html_join(
+        '\n', '<div class="block-{1}">{0}</div>', rendered)
+    if not state.defer_styles:
+        # nobody will collect the rules for the page, emit the new ones here
+        rules = state.pop_style_rules()
+        if rules:
+            html = mark_safe('<style>%s</style>\n%s' % (rules, html))
+    return html
@@ -0,0 +1,152 @@
+"""
+The image renditions stream data still uses, see the
+clean_streamfields_renditions command. An image chosen within a block uses
+the filter specs of the block templates of its GridBlock block type (and its
+hero image filter spec); images chosen outside of GridBlocks use the filter
+specs of all block templates. Images used outside of stream data (foreign
+keys and rich text) keep all of their renditions.
+"""
+import json
+import re
+
+from django.apps import apps
+from django.utils import six
+
+from wagtail.wagtailcore.blocks import RichTextBlock
+from wagtail.wagtailcore.fields import RichTextField
+from wagtail.wagtailimages import get_image_model
+from wagtail.wagtailimages.blocks import ImageChooserBlock
+
+from .conf import get_setting
+from .critical_css import iter_blocks, read_template
+from .stream import get_raw_stream, get_stream_fields, walk
+
+TEMPLATE_FILTER_SPEC_RES = (
+    re.compile(r'\{%\s*image\s+\S+\s+([^\s%]+)'),
+    re.compile(r'''\bimage\(\s*[^,()]+,\s*["']([^"']+)["']'''),
+)
+RICH_TEXT_IMAGE_RE = re.compile(r'<embed\b[^>]*\bembedtype="image"[^>]*>')
+EMBED_ID_RE = re.compile(r'\bid="(\d+)"')
+
+_block_filter_specs = None
+
+
+def get_template_filter_specs(source):
+    specs = set()
+    for spec_re in TEMPLATE_FILTER_SPEC_RES:
+        specs.update(spec.strip('"\'') for spec in spec_re.findall(source))
+    return specs
+
+
+def get_block_filter_specs():
+    """Return the filter specs the templates of each GridBlock block type use."""
+    global _block_filter_specs
+    if _block_filter_specs is None:
+        from .blocks import grid_array
+
+        hero_blocks = get_setting('STREAMFIELDS_HERO_BLOCKS')
+        block_filter_specs = {}
+        for block_type, block in grid_array:
+            specs = set()
+            for descendant in iter_blocks(block):
+                template = getattr(descendant.meta, 'template', None)
+                if template:
+                    specs |= get_template_filter_specs(read_template(template))
+            if block_type in hero_blocks and hero_blocks[block_type][1] is not None:
+                specs.add(hero_blocks[block_type][1])
+            block_filter_specs[block_type] = specs
+        _block_filter_specs = block_filter_specs
+    return _block_filter_specs
+
+
+def iter_used_renditions(block, raw, path=()):
+    """Yield the (image id, filter spec) pairs stored stream data uses."""
+    from .blocks import GridContentBlock
+
+    block_filter_specs = get_block_filter_specs()
+    all_specs = set().union(*block_filter_specs.values())
+    grid_child = None
+    for child_path, child_block, child_raw, parent in walk(block, raw, path):
+        if isinstance(parent, GridContentBlock):
+            grid_child = child_path
+        if not isinstance(child_block, ImageChooserBlock) or not child_raw:
+            continue
+        if grid_child is not None and child_path[:len(grid_child)] == grid_child:
+            specs = block_filter_specs.get(grid_child[-1], all_specs)
+        else:
+            specs = all_specs
+        for spec in specs:
+            yield child_raw, spec
+
+
+def iter_page_streams(page):
+    """Yield the (StreamField, stored data) of a page."""
+    for field in get_stream_fields(type(page)):
+        yield field, get_raw_stream(page, field)
+
+
+def iter_revision_streams(model, content_json):
+    """Yield the (StreamField, stored data) of a page revision."""
+    content = json.loads(content_json)
+    for field in get_stream_fields(model):
+        raw = content.get(field.name)
+        if not raw:
+            continue
+        if isinstance(raw, six.string_types):
+            raw = json.loads(raw)
+        yield field, raw
+
+
+def iter_stream_renditions(streams):
+    """Yield the renditions of (StreamField, stored data) pairs."""
+    for field, raw in streams:
+        for pair in iter_used_renditions(field.stream_block, raw, (field.name,)):
+            yield pair
+
+
+def get_rich_text_image_ids(html):
+    """Return the ids of the images embedded in rich text."""
+    return set(
+        int(image_id) for embed in RICH_TEXT_IMAGE_RE.findall(html)
+        for image_id in EMBED_ID_RE.findall(embed))
+
+
+def get_stream_rich_text_image_ids(streams):
+    """Return the ids of the images embedded in the rich text blocks of streams."""
+    image_ids = set()
+    for field, raw in streams:
+        for path, block, child_raw, parent in walk(field.stream_block, raw, (field.name,)):
+            if isinstance(block, RichTextBlock) and child_raw:
+                image_ids |= get_rich_text_image_ids(child_raw)
+    return image_ids
+
+
+def get_non_stream_image_ids():
+    """
+    Return the ids of the images used outside of stream data: by foreign
+    keys and many to many fields of other models (pages, snippets, ...) and
+    in rich text fields. Renditions and this package's own image data do
+    not count.
+    """
+    image_model = get_image_model()
+    rendition_model = image_model.get_rendition_model()
+    image_ids = set()
+    for relation in image_model._meta.get_fields(include_hidden=True):
+        if not relation.auto_created or relation.concrete or not relation.is_relation:
+            continue
+        related_model = relation.related_model
+        if related_model is rendition_model or \
+                related_model._meta.app_label == 'uwkm_streamfields':
+            continue
+        image_ids.update(related_model._base_manager.filter(**{
+            '%s__isnull' % relation.field.name: False,
+        }).values_list(relation.field.name, flat=True).distinct())
+
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, RichTextField):
+                for html in model._base_manager.filter(**{
+                        '%s__contains' % field.name: 'embedtype="image"'}).values_list(
+                        field.name, flat=True):
+                    image_ids |= get_rich_text_image_ids(html)
+    return image_ids
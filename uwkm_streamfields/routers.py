@@ -0,0 +1,72 @@
+"""
+Routing of the read-only queries made while rendering GridBlock content
+(chooser lookups, renditions, settings) to the database alias in
+STREAMFIELDS_REPLICA_DATABASE. Add ReplicaRouter to DATABASE_ROUTERS;
+queries are only routed within read_from_replica(), which rendering enters.
+Writes always go to the default database, and a model written to during a
+render stays on it for STREAMFIELDS_REPLICA_LAG seconds, so e.g. a
+rendition generated then is not looked up on a replica which lacks it yet.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .conf import get_setting
+
+_routing = threading.local()
+# db table -> time until which the model is read from the default database
+_written = {}
+
+
+@contextmanager
+def read_from_replica(context=None):
+    """
+    Send the reads of the current thread to the replica. Previews, reads
+    inside transactions and replicas missing from DATABASES stay on the
+    default database.
+    """
+    alias = get_setting('STREAMFIELDS_REPLICA_DATABASE')
+    request = context.get('request') if context else None
+    if (alias is None or alias not in connections.databases
+            or getattr(request, 'is_preview', False)
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+        yield
+        return
+
+    previous = getattr(_routing, 'alias', None)
+    _routing.alias = alias
+    try:
+        yield
+    finally:
+        _routing.alias = previous
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        alias = getattr(_routing, 'alias', None)
+        if alias is None:
+            return None
+        if _written.get(model._meta.db_table, 0) > time.time():
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        if getattr(_routing, 'alias', None) is not None:
+            _written[model._meta.db_table] = time.time() + get_setting('STREAMFIELDS_REPLICA_LAG')
+        alias = get_setting('STREAMFIELDS_REPLICA_DATABASE')
+        # Django writes objects to the database they were read from
+        instance = hints.get('instance')
+        if alias is not None and (
+                getattr(_routing, 'alias', None) is not None or
+                getattr(instance, '_state', None) is not None and instance._state.db == alias):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        alias = get_setting('STREAMFIELDS_REPLICA_DATABASE')
+        aliases = (DEFAULT_DB_ALIAS, alias)
+        if alias is not None and obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
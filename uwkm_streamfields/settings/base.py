@@ -1,4 +1,138 @@
 BS_SIZE = 'sm'
 
 STREAMFIELDS = '__all__'
-EXCLUDE_STREAMFIELDS = []
\ No newline at end of file
+EXCLUDE_STREAMFIELDS = []
+
+# Rendering of GridBlock content
+STREAMFIELDS_MINIFY_HTML = False
+STREAMFIELDS_CACHE = None
+STREAMFIELDS_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Filter specs of the image renditions API clients may request with the
+# renditions query parameter of GridPagesAPIEndpoint
+STREAMFIELDS_API_RENDITIONS = []
+
+# Struct fields whose scalar values are stored in the block instance index
+STREAMFIELDS_INDEXED_FIELDS = [
+    'address', 'cta_url', 'ext_link', 'form_action_url', 'icon', 'link',
+    'video_id',
+]
+
+# Template engine of the grid_array block templates: 'django' or 'jinja2'
+STREAMFIELDS_TEMPLATE_ENGINE = 'django'
+
+# Longest side in pixels of the blurred placeholders of gallery and slider images
+STREAMFIELDS_IMAGE_PLACEHOLDER_SIZE = 16
+
+# Threads computing the metadata of saved images in the background (0 computes
+# it while saving)
+STREAMFIELDS_IMAGE_METADATA_WORKERS = 2
+
+# Number of images and iframes at the top of a page which load eagerly
+STREAMFIELDS_EAGER_MEDIA = 2
+
+# Block types whose first image is preloaded when they open a page:
+# block type -> (image field, filter spec or None for the original file)
+STREAMFIELDS_HERO_BLOCKS = {
+    'rev_slider': ('image', 'height-2000'),
+    'tab_slider': ('image', 'original'),
+    'image_with_text': ('background_image', None),
+}
+
+# Static files preloaded and origins preconnected for pages using a block type
+STREAMFIELDS_BLOCK_ASSETS = {
+    'masonry_gallery': ['js/isotope.min.js', 'js/magnific-popup.min.js'],
+    'owl_gallery': ['css/owl.carousel.css', 'js/owl.carousel.min.js'],
+    'rev_slider': [
+        'css/revolution_slider.css', 'js/revolution.min.js',
+        'js/revolution_slider.min.js',
+    ],
+    'tab_slider': ['js/slick.min.js'],
+    'video': ['https://www.youtube.com'],
+    'google_maps': ['https://www.google.com'],
+}
+
+# Font preloaded for pages using icons
+STREAMFIELDS_ICON_FONT = 'fonts/font-awesome-4.7.0/fonts/fontawesome-webfont.woff2'
+
+# Stylesheet of the icon font, served until an icon subset is built
+STREAMFIELDS_ICON_CSS = 'fonts/font-awesome-4.7.0/css/font-awesome.min.css'
+
+# Directory of the icon subsets in the default storage, and icons always kept
+# in them (e.g. icons used by the project's own templates)
+STREAMFIELDS_ICON_SUBSET_PATH = 'streamfields/icons'
+STREAMFIELDS_ICON_SUBSET_EXTRA = []
+
+# Threads storing the images uploaded at once to a gallery or slider, and the
+# most files (including zip members) accepted per upload
+STREAMFIELDS_BULK_UPLOAD_WORKERS = 4
+STREAMFIELDS_BULK_UPLOAD_MAX_FILES = 500
+
+# Threads rendering independent grid columns and blocks concurrently (0 renders
+# them one after another)
+STREAMFIELDS_RENDER_WORKERS = 0
+
+# Items of the masonry gallery, logo, collaborator and project lists rendered
+# per page, the next pages load on demand
+STREAMFIELDS_LIST_PAGE_SIZE = 24
+
+# Collaborator lists whose search index is kept in memory per process
+STREAMFIELDS_LIST_SEARCH_INDEXES = 100
+
+# Rows of imported tables stored per chunk, the most rows imported per file
+# and the rows per page of their preview in the editor
+STREAMFIELDS_TABLE_CHUNK_ROWS = 500
+STREAMFIELDS_TABLE_MAX_ROWS = 100000
+STREAMFIELDS_TABLE_PREVIEW_ROWS = 20
+
+# Stylesheets purged by build_streamfields_critical_css, templates (e.g. page
+# templates) whose classes are kept for every page, patterns of classes added
+# by scripts which are kept in the purged stylesheet, and the directory it is
+# written to in the default storage
+STREAMFIELDS_CRITICAL_CSS_SOURCES = ['css/essentials.css', 'css/streamfields.css']
+STREAMFIELDS_CRITICAL_CSS_TEMPLATES = [
+    'streamfields/grid.html',
+    'streamfields/full_grid.html',
+    'streamfields/fixed_grid.html',
+]
+STREAMFIELDS_CRITICAL_CSS_SAFELIST = [
+    r'^owl-', r'^mfp-', r'^slick-', r'^tp-', r'^rev', r'^isotope',
+    r'^(active|in|open|fade|collapse|collapsing|show|hover|focus|disabled|selected)$',
+]
+STREAMFIELDS_CRITICAL_CSS_PATH = 'streamfields/css'
+
+# GridBlocks at the top of a page whose blocks' rules are inlined
+STREAMFIELDS_CRITICAL_CSS_SECTIONS = 2
+
+# Days the renditions used by page revisions are kept by
+# clean_streamfields_renditions, and filter specs it never deletes (e.g. the
+# ones of the Wagtail admin and of project templates)
+STREAMFIELDS_RENDITION_REVISION_DAYS = 30
+STREAMFIELDS_RENDITION_KEEP_SPECS = ['max-165x165', 'max-320x200', 'max-800x600']
+
+# Dotted path of the metrics sink class (None records no metrics), the
+# directory and flush interval in seconds of FileSink, and the bearer token
+# the metrics view accepts besides superusers
+STREAMFIELDS_METRICS_SINK = None
+STREAMFIELDS_METRICS_DIR = '/tmp/uwkm_streamfields_metrics'
+STREAMFIELDS_METRICS_FLUSH_INTERVAL = 10
+STREAMFIELDS_METRICS_TOKEN = None
+
+# Database alias the reads of block rendering go to with
+# uwkm_streamfields.routers.ReplicaRouter (None reads from the default
+# database), and the seconds a model is read from the default database
+# after a write
+STREAMFIELDS_REPLICA_DATABASE = None
+STREAMFIELDS_REPLICA_LAG = 5
+
+# Performance budgets of pages with PerformanceBudgetMixin: name ->
+# (warning limit, error limit), None disables a limit. Sites override them
+# in their Streamfields settings
+STREAMFIELDS_BUDGETS = {
+    'blocks': (150, 400),
+    'depth': (5, 8),
+    'images': (60, 200),
+    'iframes': (5, 15),
+    'transfer_bytes': (3 * 1024 * 1024, 10 * 1024 * 1024),
+    'stream_bytes': (256 * 1024, 1024 * 1024),
+}
@@ -0,0 +1,49 @@
+from django.db.models.signals import post_delete, post_save
+
+from wagtail.wagtailcore.signals import page_published, page_unpublished
+from wagtail.wagtailimages import get_image_model
+
+from .block_index import remove_block_index, update_block_index
+from .icon_subset import update_icon_subset
+from .metrics import inc
+from .image_metadata import schedule_image_metadata
+from .references import (
+    invalidate_object, remove_page_references, update_page_references)
+
+
+def page_published_signal_handler(sender, instance, revision=None, **kwargs):
+    update_page_references(instance, revision)
+    update_block_index(instance)
+    update_icon_subset(instance)
+
+
+def page_unpublished_signal_handler(sender, instance, **kwargs):
+    remove_page_references(instance)
+    remove_block_index(instance)
+
+
+def object_changed_signal_handler(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_object(instance)
+
+
+def image_saved_signal_handler(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_image_metadata(instance)
+
+
+def rendition_saved_signal_handler(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        inc('streamfields_rendition_misses_total', filter_spec=instance.filter_spec)
+
+
+def register_signal_handlers():
+    page_published.connect(page_published_signal_handler)
+    page_unpublished.connect(page_unpublished_signal_handler)
+    post_save.connect(object_changed_signal_handler)
+    post_delete.connect(object_changed_signal_handler)
+    post_save.connect(image_saved_signal_handler, sender=get_image_model())
+    post_save.connect(
+        rendition_saved_signal_handler, sender=get_image_model().get_rendition_model())
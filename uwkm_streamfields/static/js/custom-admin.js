@@ -94,3 +94,250 @@ $(document).ready(function(){
   //
 });
 
+
+
+/* Add many images at once to a gallery or slider, see views.bulk_images */
+$(document).on('click', 'button.bulk-images', function() {
+	var button = $(this);
+	var prefix = button.attr('data-prefix');
+
+	ModalWorkflow({
+		url: button.attr('data-chooser-url'),
+		responses: {
+			imagesChosen: function(imageIds, errors) {
+				if (errors.length) {
+					window.alert(errors.join('\n'));
+				}
+				if (!imageIds.length) {
+					return;
+				}
+
+				var data = $('[name^="' + prefix + '-"]', button.closest('form')).serializeArray();
+				data.push({name: 'prefix', value: prefix});
+				data.push({name: 'csrfmiddlewaretoken', value: $('input[name="csrfmiddlewaretoken"]').val()});
+				$.each(imageIds, function(i, imageId) {
+					data.push({name: 'image', value: imageId});
+				});
+
+				$.post(button.attr('data-list-url'), $.param(data), function(response) {
+					button.prev('.sequence-container').replaceWith(response.html);
+					eval('(' + response.js + ')')(prefix);
+				}, 'json');
+			}
+		}
+	});
+});
+
+
+// Imported tables of TableStructBlock, see StoredTableInput.
+function initStoredTable(id, importUrl, previewUrl) {
+	var input = $('#' + id),
+		widget = $('#' + id + '-stored-table'),
+		// the Handsontable table of the same TableStructBlock
+		handsontable = $('#' + id.replace(/stored_table$/, 'table')).closest('.field');
+
+	function showPreview(page) {
+		if (!input.val()) {
+			widget.find('.stored-table-preview').empty();
+			widget.find('.stored-table-remove').prop('hidden', true);
+			handsontable.show();
+			return;
+		}
+		handsontable.hide();
+		widget.find('.stored-table-remove').prop('hidden', false);
+		$.getJSON(previewUrl.replace('/0/', '/' + input.val() + '/'), {p: page || 1}, function(data) {
+			widget.find('.stored-table-preview').html(data.html);
+		});
+	}
+
+	widget.on('click', '.stored-table-page', function() {
+		showPreview($(this).data('page'));
+	});
+
+	widget.on('click', '.stored-table-remove', function() {
+		input.val('');
+		showPreview();
+	});
+
+	widget.on('click', '.stored-table-import', function() {
+		var button = $(this),
+			file = $('#' + id + '-file')[0].files[0],
+			data = new FormData();
+
+		if (!file) {
+			return;
+		}
+		data.append('file', file);
+		data.append('first_row_is_table_header', $('#' + id + '-header').prop('checked'));
+		data.append('first_col_is_header', $('#' + id + '-col-header').prop('checked'));
+		data.append('csrfmiddlewaretoken', $('input[name="csrfmiddlewaretoken"]').val());
+
+		button.prop('disabled', true);
+		widget.find('.stored-table-error').text('');
+		$.ajax({
+			url: importUrl,
+			type: 'POST',
+			data: data,
+			processData: false,
+			contentType: false,
+			dataType: 'json'
+		}).done(function(table) {
+			input.val(table.id);
+			showPreview(1);
+		}).fail(function(xhr) {
+			var error = xhr.responseJSON && xhr.responseJSON.error;
+			widget.find('.stored-table-error').text(error || xhr.statusText);
+		}).always(function() {
+			button.prop('disabled', false);
+		});
+	});
+
+	showPreview(1);
+}
+
+
+// Save the page editor as a patch of the StreamField children which changed
+// since the page was opened, see views.page_patch. Anything the patch view
+// does not accept is posted as the full form instead.
+$(window).on('load', function() {
+	var form = $('#page-edit-form'),
+		patch = window.streamfieldsPatch,
+		submitter = null,
+		fullPost = false,
+		formAction = document.createElement('a'),
+		initial;
+
+	if (!patch || patch.revision === null || !form.length || form.find('input[name="revision"]').length) {
+		return;
+	}
+	// only the edit form of the page the patch config was made for
+	formAction.href = form.attr('action') || '';
+	if (formAction.pathname.replace(/^\/?/, '/') !== patch.edit_url) {
+		return;
+	}
+
+	function formValues() {
+		var values = {};
+		$.each(form.serializeArray(), function(i, field) {
+			(values[field.name] = values[field.name] || []).push(field.value);
+		});
+		return values;
+	}
+
+	function streamOf(name) {
+		for (var i = 0; i < patch.streams.length; i++) {
+			if (name.indexOf(patch.streams[i] + '-') === 0) {
+				return patch.streams[i];
+			}
+		}
+		return null;
+	}
+
+	function first(values, name, fallback) {
+		return values[name] ? values[name][0] : fallback;
+	}
+
+	function buildPatch(current, action) {
+		var data = {base_revision: patch.revision, action: action, form: {}, streams: {}, data: {}},
+			changed = {},
+			names = $.extend({}, initial, current);
+
+		$.each(names, function(name) {
+			var stream = streamOf(name), match;
+			if (stream === null) {
+				if (current[name]) {
+					data.form[name] = current[name];
+				}
+				return;
+			}
+			match = name.slice(stream.length + 1).match(/^(\d+)-(.*)$/);
+			// the order and deletion of children are part of the patch itself
+			if (match && match[2] !== 'order' && match[2] !== 'deleted' &&
+					JSON.stringify(initial[name]) !== JSON.stringify(current[name])) {
+				changed[stream + '-' + match[1]] = true;
+			}
+		});
+
+		$.each(patch.streams, function(i, stream) {
+			var initialCount = parseInt(first(initial, stream + '-count', '0'), 10),
+				count = parseInt(first(current, stream + '-count', '0'), 10),
+				children = [],
+				unchanged = true;
+
+			for (var index = 0; index < count; index++) {
+				var prefix = stream + '-' + index;
+				if (first(current, prefix + '-deleted', '') !== '1' && current[prefix + '-type']) {
+					children.push({index: index, prefix: prefix, order: parseInt(first(current, prefix + '-order', index), 10)});
+				}
+			}
+			children.sort(function(a, b) { return a.order - b.order; });
+
+			data.streams[stream] = $.map(children, function(child, position) {
+				if (child.index < initialCount && !changed[child.prefix]) {
+					unchanged = unchanged && child.index === position;
+					return {index: child.index};
+				}
+				unchanged = false;
+				$.each(current, function(name, value) {
+					if (name.indexOf(child.prefix + '-') === 0) {
+						data.data[name] = value;
+					}
+				});
+				return {prefix: child.prefix};
+			});
+			if (unchanged && children.length === initialCount) {
+				delete data.streams[stream];
+			}
+		});
+		return data;
+	}
+
+	initial = formValues();
+
+	form.on('click', '[type="submit"]', function() {
+		submitter = this;
+	});
+
+	form.on('submit', function(event) {
+		var name = submitter ? submitter.name : '',
+			action = name === 'action-publish' ? 'publish' : (name ? null : 'draft');
+
+		// submitting for moderation goes through the full form
+		if (fullPost || action === null || event.isDefaultPrevented()) {
+			return;
+		}
+		event.preventDefault();
+
+		$.ajax({
+			url: patch.url,
+			type: 'POST',
+			data: JSON.stringify(buildPatch(formValues(), action)),
+			contentType: 'application/json',
+			dataType: 'text',
+			headers: {'X-CSRFToken': $('input[name="csrfmiddlewaretoken"]', form).val()}
+		}).done(function(response, status, xhr) {
+			if ((xhr.getResponseHeader('Content-Type') || '').indexOf('application/json') === 0) {
+				window.location.href = JSON.parse(response).redirect;
+			} else {
+				// the response of an after_edit_page hook
+				document.open();
+				document.write(response);
+				document.close();
+			}
+		}).fail(function(xhr) {
+			if (xhr.status !== 400 && xhr.status !== 409) {
+				// the page may be saved already, show what went wrong
+				document.open();
+				document.write(xhr.responseText);
+				document.close();
+				return;
+			}
+			fullPost = true;
+			if (name) {
+				// a script submitting the form does not send the clicked button
+				form.append($('<input type="hidden">').attr('name', name).val(submitter.value));
+			}
+			form[0].submit();
+		});
+	});
+});
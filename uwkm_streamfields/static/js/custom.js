@@ -73,9 +73,9 @@ if(_el.length > 0) {
 }
 
 
-if(jQuery(".masonry-gallery").length > 0) {
+function initMasonryGalleries(galleries) {
 
-	jQuery(".masonry-gallery").each(function() {
+	galleries.each(function() {
 		var _container = jQuery(this),
 			columns	= _container.attr('data-columns');
 
@@ -112,7 +112,10 @@ if(jQuery(".masonry-gallery").length > 0) {
 
 	});
 
+}
 
+if(jQuery(".masonry-gallery").length > 0) {
+	initMasonryGalleries(jQuery(".masonry-gallery"));
 }
 
 
@@ -134,7 +137,8 @@ $('.single-slide').slick({
     slidesToScroll: 1,
     arrows: false,
      dots: false,
-    asNavFor: '.thumb-slide'
+    asNavFor: '.thumb-slide',
+    lazyLoad: 'ondemand'
 });
 $('.thumb-slide').slick({
     slidesToShow: 4,
@@ -154,3 +158,78 @@ $('.thumb-slide').slick({
     ]
 });
 
+
+// Paginated lists: load the next page or the search results from the list
+// fragment view and add their items to the list, see listing.py.
+function setListItems(list, data, replace) {
+	var items = list.find('[data-sf-list-items]').first(),
+		newItems = jQuery('<div>').html(data.html).find('[data-sf-list-items]').first().children(),
+		owl = items.data('owlCarousel');
+
+	if(data.styles) {
+		jQuery('<style>').text(data.styles).appendTo('head');
+	}
+
+	if(owl) {
+		if(replace) {
+			while(items.find('.owl-item').length > 0) {
+				owl.removeItem(0);
+			}
+		}
+		newItems.each(function() {
+			owl.addItem(this.outerHTML);
+		});
+	} else {
+		if(replace) {
+			items.empty();
+		}
+		items.append(newItems);
+		if(items.is('.masonry-gallery')) {
+			// more images of a masonry gallery
+			if(items.data('isotope')) {
+				items.isotope('appended', newItems);
+			}
+			initMasonryGalleries(items);
+		} else {
+			initMasonryGalleries(newItems.filter('.masonry-gallery'));
+		}
+	}
+
+	list.find('[data-sf-list-more]')
+		.attr('data-sf-list-more', data.next || '')
+		.prop('hidden', !data.next);
+}
+
+jQuery(document).on('click', '[data-sf-list-more]', function() {
+	var button = jQuery(this),
+		list = button.closest('[data-sf-list]');
+
+	if(!button.attr('data-sf-list-more')) {
+		return;
+	}
+	button.prop('disabled', true);
+	jQuery.getJSON(button.attr('data-sf-list-more'), function(data) {
+		setListItems(list, data, false);
+	}).always(function() {
+		button.prop('disabled', false);
+	});
+});
+
+jQuery(document).on('input', '[data-sf-list-search]', function() {
+	var input = jQuery(this),
+		list = input.closest('[data-sf-list]');
+
+	clearTimeout(input.data('timeout'));
+	input.data('timeout', setTimeout(function() {
+		var query = jQuery.trim(input.val()),
+			request = jQuery.getJSON(input.attr('data-sf-list-search'), {q: query});
+
+		// only the response to the latest query is shown
+		input.data('request', request);
+		request.done(function(data) {
+			if(input.data('request') === request) {
+				setListItems(list, data, true);
+			}
+		});
+	}, 250));
+});
@@ -0,0 +1,61 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage which also writes gzip and, with the brotli
+    package installed, brotli compressed variants of the hashed files, for
+    the web server to send as they are (e.g. nginx's gzip_static and
+    brotli_static). References to files missing from the package's
+    stylesheets are left as they are instead of failing collectstatic.
+    """
+    compress_extensions = (
+        '.css', '.js', '.svg', '.eot', '.ttf', '.otf', '.json', '.txt', '.map',
+    )
+    # variants saving less than this fraction of the file are not written
+    min_compress_ratio = 0.95
+
+    def url_converter(self, name, *args, **kwargs):
+        converter = super(PrecompressedManifestStaticFilesStorage, self).url_converter(
+            name, *args, **kwargs)
+
+        def tolerant_converter(matchobj):
+            try:
+                return converter(matchobj)
+            except ValueError:
+                return matchobj.group(0)
+        return tolerant_converter
+
+    def post_process(self, *args, **kwargs):
+        for name, hashed_name, processed in super(
+                PrecompressedManifestStaticFilesStorage, self).post_process(*args, **kwargs):
+            if hashed_name and not isinstance(processed, Exception):
+                # later passes may rewrite a file under the same name
+                self.compress(hashed_name)
+            yield name, hashed_name, processed
+
+    def compress(self, name):
+        if os.path.splitext(name)[1].lower() not in self.compress_extensions:
+            return
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        with gzip.GzipFile(path + '.gz', 'wb', compresslevel=9, mtime=0) as f:
+            f.write(content)
+        if os.path.getsize(path + '.gz') > len(content) * self.min_compress_ratio:
+            os.remove(path + '.gz')
+
+        if brotli is not None:
+            compressed = brotli.compress(content)
+            if len(compressed) <= len(content) * self.min_compress_ratio:
+                with open(path + '.br', 'wb') as f:
+                    f.write(compressed)
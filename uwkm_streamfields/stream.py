@@ -0,0 +1,112 @@
+import json
+
+from django.contrib.contenttypes.models import ContentType
+
+from wagtail.wagtailcore.blocks import (
+    BaseStreamBlock, BaseStructBlock, ChooserBlock, ListBlock)
+from wagtail.wagtailcore.fields import StreamField
+from wagtail.wagtailcore.models import Page, get_page_models
+
+
+def get_stream_fields(model):
+    return [
+        field for field in model._meta.get_fields()
+        if isinstance(field, StreamField)
+    ]
+
+
+def get_stream_page_models():
+    """Return the page models which have at least one StreamField."""
+    return [model for model in get_page_models() if get_stream_fields(model)]
+
+
+def iter_live_pages(model, chunk_size=500):
+    """
+    Stream the live pages of exactly this page type in primary key order,
+    fetching chunk_size pages at a time.
+    """
+    queryset = model.objects.live().filter(
+        content_type=ContentType.objects.get_for_model(model)).order_by('pk')
+    last_pk = 0
+    while True:
+        pages = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not pages:
+            return
+        for page in pages:
+            yield page
+        last_pk = pages[-1].pk
+
+
+def get_raw_stream(page, field):
+    """
+    Return the stored JSON data of a page's StreamField without converting
+    (and querying) the chooser values.
+    """
+    value = field.value_from_object(page)
+    if value is None:
+        return []
+    if value.is_lazy:
+        return value.stream_data
+    if not value and value.raw_text:
+        # stored data set as it is, see page_patch.set_stored_stream_data()
+        try:
+            return json.loads(value.raw_text)
+        except ValueError:
+            return []
+    return field.stream_block.get_prep_value(value)
+
+
+def walk(block, raw, path=(), parent=None):
+    """
+    Yield (path, block, raw value, parent block) for a block and all of its
+    descendants, working on stored JSON data. Paths are tuples of stream
+    indexes, block types and field names.
+    """
+    yield path, block, raw, parent
+    if raw in (None, ''):
+        return
+
+    if isinstance(block, BaseStreamBlock):
+        for i, child in enumerate(raw):
+            child_block = block.child_blocks.get(child['type'])
+            if child_block is None:
+                continue
+            for item in walk(child_block, child['value'], path + (str(i), child['type']), block):
+                yield item
+    elif isinstance(block, ListBlock):
+        # compactly stored items, see BulkImageListBlock
+        expand_item = getattr(block, 'expand_item', None)
+        for i, child in enumerate(raw):
+            if expand_item is not None:
+                child = expand_item(child)
+            for item in walk(block.child_block, child, path + (str(i),), block):
+                yield item
+    elif isinstance(block, BaseStructBlock):
+        for name, child_block in block.child_blocks.items():
+            if name in raw:
+                for item in walk(child_block, raw[name], path + (name,), block):
+                    yield item
+
+
+def walk_page(page):
+    """Walk the stored data of every StreamField of a page."""
+    for field in get_stream_fields(type(page)):
+        for item in walk(field.stream_block, get_raw_stream(page, field), (field.name,)):
+            yield item
+
+
+def get_object_type(model):
+    """
+    Return the label chooser references are recorded under. All page types
+    share 'wagtailcore.page', like PageChooserBlock values do.
+    """
+    if issubclass(model, Page):
+        return 'wagtailcore.page'
+    return model._meta.label_lower
+
+
+def iter_references(page):
+    """Yield (object type, object id, path) for every chosen object of a page."""
+    for path, block, raw, parent in walk_page(page):
+        if isinstance(block, ChooserBlock) and raw not in (None, ''):
+            yield get_object_type(block.target_model), raw, path
@@ -0,0 +1,211 @@
+"""
+Import of CSV and XLSX files into StoredTables. Files are parsed and stored
+row by row, so neither the file nor the table is ever held in memory as a
+whole.
+"""
+import codecs
+import csv
+import json
+import os
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from django.db.models.functions import Length
+from django.utils import six, timezone
+from django.utils.encoding import force_text
+
+from wagtail.wagtailcore.models import Page, PageRevision
+
+from .conf import get_setting
+from .models import PageReference, StoredTable, StoredTableChunk
+from .stream import get_object_type, walk
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+IMPORT_EXTENSIONS = ('csv', 'xlsx')
+
+
+class TableImportError(Exception):
+    pass
+
+
+def iter_csv_rows(f):
+    """Yield the rows of a CSV file, sniffing its delimiter."""
+    sample = f.read(4096)
+    f.seek(0)
+    if isinstance(sample, bytes):
+        sample = sample.decode('utf-8-sig', 'replace')
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+
+    if six.PY2:
+        for row in csv.reader(f, dialect):
+            yield [cell.decode('utf-8-sig', 'replace') for cell in row]
+        return
+    lines = codecs.iterdecode(f, 'utf-8-sig')
+    for row in csv.reader(lines, dialect):
+        yield row
+
+
+def iter_xlsx_rows(f):
+    """Yield the rows of the first sheet of an XLSX file."""
+    if openpyxl is None:
+        raise TableImportError("Importing XLSX files requires openpyxl.")
+    try:
+        workbook = openpyxl.load_workbook(f, read_only=True, data_only=True)
+    except Exception:
+        raise TableImportError("The file is not a valid XLSX file.")
+    try:
+        sheet = workbook.worksheets[0]
+        for row in sheet.iter_rows():
+            yield ['' if cell.value is None else force_text(cell.value) for cell in row]
+    finally:
+        # read only workbooks keep the file open
+        close = getattr(workbook, 'close', None)
+        if close is not None:
+            close()
+
+
+def iter_uploaded_rows(uploaded):
+    extension = os.path.splitext(uploaded.name)[1][1:].lower()
+    if extension == 'csv':
+        return iter_csv_rows(uploaded)
+    if extension == 'xlsx':
+        return iter_xlsx_rows(uploaded)
+    raise TableImportError("Only CSV and XLSX files can be imported.")
+
+
+def store_table(uploaded, user=None, first_row_is_table_header=False,
+                first_col_is_header=False):
+    """
+    Store the rows of an uploaded CSV or XLSX file as a StoredTable, writing
+    STREAMFIELDS_TABLE_CHUNK_ROWS rows at a time.
+    """
+    chunk_rows = get_setting('STREAMFIELDS_TABLE_CHUNK_ROWS')
+    max_rows = get_setting('STREAMFIELDS_TABLE_MAX_ROWS')
+    rows = iter_uploaded_rows(uploaded)
+
+    with transaction.atomic():
+        table = StoredTable.objects.create(
+            title=uploaded.name[:255],
+            uploaded_by_user=user,
+            first_row_is_table_header=first_row_is_table_header,
+            first_col_is_header=first_col_is_header,
+        )
+        index = 0
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk:
+                break
+            if table.row_count + len(chunk) > max_rows:
+                raise TableImportError("Tables can have at most %d rows." % max_rows)
+            StoredTableChunk.objects.create(
+                table=table, index=index, first_row=table.row_count,
+                rows=json.dumps(chunk))
+            index += 1
+            table.row_count += len(chunk)
+            table.column_count = max([table.column_count] + [len(row) for row in chunk])
+        if not table.row_count:
+            raise TableImportError("The file contains no rows.")
+        table.save(update_fields=['row_count', 'column_count'])
+    return table
+
+
+def get_rows(table, start=0, stop=None):
+    """
+    Return rows start to stop of a StoredTable, padded to its column count,
+    loading only the chunks holding them.
+    """
+    stop = table.row_count if stop is None else min(stop, table.row_count)
+    if start >= stop:
+        return []
+    chunks = StoredTableChunk.objects.filter(table=table).order_by('index')
+    first_chunk = chunks.filter(first_row__lte=start).order_by('-index').values_list(
+        'index', flat=True).first() or 0
+
+    rows = []
+    first_row = None
+    for chunk_first_row, chunk in chunks.filter(
+            index__gte=first_chunk, first_row__lt=stop).values_list('first_row', 'rows'):
+        if first_row is None:
+            first_row = chunk_first_row
+        rows.extend(json.loads(chunk))
+    rows = rows[start - (first_row or 0):stop - (first_row or 0)]
+    return [row + [''] * (table.column_count - len(row)) for row in rows]
+
+
+def get_live_table_page_ids(table):
+    """Return the ids of the live pages a StoredTable is chosen in."""
+    return PageReference.objects.filter(
+        object_type=get_object_type(StoredTable), object_id=table.pk,
+    ).values_list('page_id', flat=True).distinct()
+
+
+def can_preview_table(user, table):
+    """
+    Return whether a user may see the rows of a StoredTable: its uploader,
+    superusers and the editors of the live pages it is chosen in.
+    """
+    if user.is_superuser or (
+            table.uploaded_by_user_id is not None and table.uploaded_by_user_id == user.pk):
+        return True
+    return any(
+        page.permissions_for_user(user).can_edit()
+        for page in Page.objects.filter(pk__in=list(get_live_table_page_ids(table))))
+
+
+def get_used_table_ids(revision_days):
+    """
+    Return the ids of the StoredTables chosen in live pages, looked up in the
+    reference index, in revisions saved in the last revision_days days and
+    in the drafts of pages.
+    """
+    from .blocks import StoredTableChooserBlock
+    from .renditions import iter_revision_streams
+
+    table_ids = set(PageReference.objects.filter(
+        object_type=get_object_type(StoredTable),
+    ).values_list('object_id', flat=True))
+
+    drafts = PageRevision.objects.filter(
+        page__has_unpublished_changes=True,
+    ).values('page_id').annotate(latest=Max('pk')).values_list('latest', flat=True)
+    revisions = PageRevision.objects.filter(
+        Q(created_at__gte=timezone.now() - timedelta(days=revision_days))
+        | Q(pk__in=list(drafts)))
+    for content_type_id, content_json in revisions.values_list(
+            'page__content_type', 'content_json').iterator():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is None:
+            continue
+        for field, raw in iter_revision_streams(model, content_json):
+            for path, block, child_raw, parent in walk(field.stream_block, raw):
+                if isinstance(block, StoredTableChooserBlock) and child_raw:
+                    table_ids.add(int(child_raw))
+    return table_ids
+
+
+def get_unused_tables(revision_days, min_age_hours):
+    """
+    Return the StoredTables no page or recent revision chooses, leaving the
+    ones imported in the last min_age_hours hours for pages not saved yet.
+    """
+    return StoredTable.objects.filter(
+        created_at__lt=timezone.now() - timedelta(hours=min_age_hours),
+    ).exclude(pk__in=get_used_table_ids(revision_days))
+
+
+def get_stored_table_bytes(table_ids):
+    """Return the bytes of the stored rows of StoredTables."""
+    if not table_ids:
+        return 0
+    return StoredTableChunk.objects.filter(table_id__in=table_ids).aggregate(
+        bytes=Sum(Length('rows')))['bytes'] or 0
@@ -0,0 +1,58 @@
+function(modal) {
+    var searchUrl = $('form.bulk-images-search', modal.body).attr('action');
+    /* selected image ids in selection order, kept while searching and paging */
+    var selected = [];
+
+    function initResults(context) {
+        $('input[name="image"]', context).each(function() {
+            this.checked = selected.indexOf(this.value) != -1;
+        }).change(function() {
+            var index = selected.indexOf(this.value);
+            if (this.checked && index == -1) {
+                selected.push(this.value);
+            } else if (!this.checked && index != -1) {
+                selected.splice(index, 1);
+            }
+        });
+
+        $('.pagination a', context).click(function() {
+            fetchResults({p: this.getAttribute('data-page'), q: $('#id_q', modal.body).val()});
+            return false;
+        });
+    }
+
+    function fetchResults(requestData) {
+        $.get(searchUrl, requestData, function(data) {
+            $('#bulk-image-results', modal.body).html(data);
+            initResults($('#bulk-image-results', modal.body));
+        });
+    }
+
+    $('form.bulk-images-search', modal.body).submit(function() {
+        fetchResults({q: $('#id_q', modal.body).val()});
+        return false;
+    });
+
+    $('form.bulk-images-form', modal.body).submit(function() {
+        var formData = new FormData(this);
+        /* the checkboxes only cover the current page of results */
+        formData.delete('image');
+        $.each(selected, function(i, imageId) {
+            formData.append('image', imageId);
+        });
+        $('button[type="submit"]', this).prop('disabled', true).addClass('button-longrunning-active');
+
+        $.ajax({
+            url: this.action,
+            data: formData,
+            processData: false,
+            contentType: false,
+            type: 'POST',
+            dataType: 'text',
+            success: modal.loadResponseText
+        });
+        return false;
+    });
+
+    initResults(modal.body);
+}
@@ -0,0 +1,4 @@
+function(modal) {
+    modal.respond('imagesChosen', {{ image_ids_json|safe }}, {{ errors_json|safe }});
+    modal.close();
+}
@@ -0,0 +1,87 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from ..critical_css import render_stylesheets
+from ..icon_subset import get_icon_css_url
+from ..rendering import (
+    STYLES_PLACEHOLDER, get_media_loading, get_render_state, get_style_class,
+    prerender_grids)
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def style_class(context, *args):
+    """
+    Return a hashed class name for the given CSS property/value pairs and
+    register its rule on the page, e.g.
+    {% style_class "color" item.color "font-size" item.size|stringformat:"dpx" %}
+    Empty values are left out.
+    """
+    declarations = [
+        (args[i], args[i + 1]) for i in range(0, len(args) - 1, 2)
+    ]
+    return get_style_class(get_render_state(context), declarations)
+
+
+@register.simple_tag(takes_context=True)
+def image_metadata(context, image):
+    """
+    Return the precomputed size, dominant color and placeholder of an image,
+    e.g. {% image_metadata item.image as meta %}. None when not computed yet.
+    """
+    if not image:
+        return None
+    return get_render_state(context).get_image_metadata(context.get('page'), image)
+
+
+@register.simple_tag(takes_context=True)
+def media_loading(context):
+    """
+    Return the loading and fetchpriority attributes of the next image or
+    iframe in page order, e.g.
+    {% media_loading as media %}
+    {% image item.image original loading=media.loading fetchpriority=media.fetchpriority %}
+    """
+    return get_media_loading(context)
+
+
+@register.simple_tag(takes_context=True)
+def prerender_grid(context, value):
+    """
+    Render the content of all GridBlocks in a StreamField or list of
+    GridBlocks concurrently when STREAMFIELDS_RENDER_WORKERS is set, e.g.
+    {% prerender_grid page.some_content %} before rendering its blocks.
+    """
+    prerender_grids(value, context.flatten())
+    return ''
+
+
+@register.simple_tag(takes_context=True)
+def streamfields_styles(context):
+    """
+    Mark the place (usually in <head>) where the rules of all style classes
+    used on the page are inserted by StreamfieldsStylesMiddleware.
+    """
+    get_render_state(context).defer_styles = True
+    return mark_safe(STYLES_PLACEHOLDER)
+
+
+@register.simple_tag
+def streamfields_icon_css():
+    """
+    Return the url of the icon font stylesheet, the subset built by
+    build_streamfields_icon_subset if there is one, e.g.
+    <link href="{% streamfields_icon_css %}" rel="stylesheet" />
+    """
+    return get_icon_css_url()
+
+
+@register.simple_tag(takes_context=True)
+def streamfields_stylesheets(context):
+    """
+    Include the block stylesheets (usually in <head>): the critical CSS of
+    the blocks at the top of the page inline, the purged stylesheet built
+    by build_streamfields_critical_css loading asynchronously.
+    """
+    return render_stylesheets(context)
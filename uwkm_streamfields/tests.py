@@ -0,0 +1,110 @@
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings)
+
+from wagtail.api.v2.utils import BadRequestError
+
+from .api import RepresentationOptions
+from .blocks import GridBlock, grid_array
+from .budgets import measure_stream
+from .management.commands.check_streamfields_templates import (
+    get_sample_value, get_template_name, render)
+from .routers import _written, read_from_replica
+
+JINJA2_TEMPLATES = {
+    'BACKEND': 'django.template.backends.jinja2.Jinja2',
+    'APP_DIRS': True,
+    'OPTIONS': {
+        'extensions': [
+            'wagtail.wagtailimages.jinja2tags.images',
+            'uwkm_streamfields.jinja2tags.streamfields',
+        ],
+    },
+}
+
+
+@override_settings(STREAMFIELDS_API_RENDITIONS=['fill-267x267', 'width-1000'])
+class RepresentationOptionsTestCase(SimpleTestCase):
+    def get_options(self, renditions):
+        request = RequestFactory().get('/api/v2/pages/', {'renditions': renditions})
+        return RepresentationOptions.from_request(request)
+
+    def test_allowed_renditions(self):
+        options = self.get_options('width-1000, fill-267x267')
+        self.assertEqual(options.renditions, ['fill-267x267', 'width-1000'])
+
+    def test_invalid_rendition(self):
+        with self.assertRaises(BadRequestError):
+            self.get_options('fill-267x267,fill-abc')
+
+    def test_rendition_not_allowed(self):
+        with self.assertRaises(BadRequestError):
+            self.get_options('width-5000')
+
+
+class MeasureStreamTestCase(SimpleTestCase):
+    def test_video_list(self):
+        content = GridBlock().child_blocks['content']
+        raw = [{'type': 'video', 'value': [{'video_id': 'dQw4w9WgXcQ'}] * 10}]
+        measures, images = measure_stream(content, raw)
+        self.assertEqual(measures['iframes'], 10)
+        self.assertEqual(measures['blocks'], 10)
+
+
+@override_settings(TEMPLATES=[
+    engine for engine in settings.TEMPLATES
+    if engine['BACKEND'] != JINJA2_TEMPLATES['BACKEND']] + [JINJA2_TEMPLATES])
+class TemplateEngineTestCase(TestCase):
+    def test_equal_output(self):
+        for block_type, block in grid_array:
+            name = get_template_name(block)
+            if name is None:
+                continue
+            value = block.to_python(get_sample_value(block))
+            self.assertEqual(
+                render('django', name, block, value), render('jinja2', name, block, value),
+                "%s renders differently with Jinja2" % block_type)
+
+
+@skipUnless('replica' in settings.DATABASES, "Needs a 'replica' database alias.")
+@override_settings(
+    DATABASE_ROUTERS=['uwkm_streamfields.routers.ReplicaRouter'],
+    STREAMFIELDS_REPLICA_DATABASE='replica')
+class ReplicaRouterTestCase(TransactionTestCase):
+    # reads inside transactions stay on the default database
+    multi_db = True
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        _written.clear()
+
+    def test_reads_go_to_replica(self):
+        with read_from_replica():
+            self.assertEqual(Group.objects.all().db, 'replica')
+        self.assertEqual(Group.objects.all().db, 'default')
+
+    def test_writes_stay_on_default(self):
+        with read_from_replica():
+            group = Group.objects.create(name='editors')
+            self.assertEqual(group._state.db, 'default')
+            # until the replica caught up
+            self.assertEqual(Group.objects.all().db, 'default')
+
+    def test_writes_outside_renders(self):
+        Group.objects.create(name='editors')
+        with read_from_replica():
+            self.assertEqual(Group.objects.all().db, 'replica')
+
+    def test_preview(self):
+        request = RequestFactory().get('/')
+        request.is_preview = True
+        with read_from_replica({'request': request}):
+            self.assertEqual(Group.objects.all().db, 'default')
+
+    def test_atomic(self):
+        with transaction.atomic(), read_from_replica():
+            self.assertEqual(Group.objects.all().db, 'default')
@@ -0,0 +1,10 @@
+from django.conf.urls import url
+
+from . import views
+
+urlpatterns = [
+    url(r'^list/(\d+)/([0-9a-f]{40})/$', views.list_fragment,
+        name='uwkm_streamfields_list_fragment'),
+    url(r'^metrics/$', views.metrics_view,
+        name='uwkm_streamfields_metrics'),
+]
@@ -0,0 +1,405 @@
+import hashlib
+import json
+import os
+import zipfile
+from multiprocessing.pool import ThreadPool
+
+from django.contrib import messages
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.template.loader import render_to_string
+from django.utils.crypto import constant_time_compare
+from django.utils.http import is_safe_url, urlencode, urlquote
+from django.utils.translation import ugettext as _
+from django.views.decorators.http import require_POST
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+from wagtail.utils.pagination import paginate
+from wagtail.wagtailadmin.forms import SearchForm
+from wagtail.wagtailadmin.modal_workflow import render_modal_workflow
+from wagtail.wagtailcore import blocks, hooks
+from wagtail.wagtailcore.models import Page
+from wagtail.wagtailimages import get_image_model
+from wagtail.wagtailimages.fields import ALLOWED_EXTENSIONS
+from wagtail.wagtailimages.forms import get_image_form
+from wagtail.wagtailimages.permissions import permission_policy
+
+from .blocks import (
+    BulkImageListBlock, activate_grid_block, deactivate_grid_block,
+    get_grid_block_for_site)
+from .conf import get_setting
+from .listing import find_list, get_list_page, get_list_url
+from .metrics import get_sink
+from .models import StoredTable
+from .page_patch import (
+    PatchError, apply_patch, set_stored_stream_data, to_datadict)
+from .rendering import get_fragment_cache, get_render_state, minify_html
+from .stream import get_stream_fields
+from .tables import TableImportError, can_preview_table, store_table
+
+
+def get_bulk_block(bulk_key):
+    try:
+        return BulkImageListBlock.bulk_blocks[bulk_key]
+    except KeyError:
+        raise Http404
+
+
+def iter_uploaded_images(files):
+    """Yield the uploaded files, replacing zip files by the images they contain."""
+    for uploaded in files:
+        if not uploaded.name.lower().endswith('.zip'):
+            yield uploaded
+            continue
+        try:
+            archive = zipfile.ZipFile(uploaded)
+        except zipfile.BadZipfile:
+            yield uploaded
+            continue
+        with archive:
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                # skips directories and the resource forks of macOS archives
+                if not name or name.startswith('.'):
+                    continue
+                if os.path.splitext(name)[1][1:].lower() not in ALLOWED_EXTENSIONS:
+                    continue
+                yield SimpleUploadedFile(name, archive.read(info))
+
+
+def store_image(args):
+    """Validate and save one uploaded image, return (image id, error)."""
+    user, collection, uploaded = args
+    ImageForm = get_image_form(get_image_model())
+    try:
+        form = ImageForm({
+            'title': os.path.splitext(uploaded.name)[0],
+            'collection': collection,
+        }, {
+            'file': uploaded,
+        }, user=user)
+        if not form.is_valid():
+            errors = [error for field_errors in form.errors.values() for error in field_errors]
+            return None, '%s: %s' % (uploaded.name, ' '.join(errors))
+        image = form.save(commit=False)
+        image.uploaded_by_user = user
+        image.file_size = image.file.size
+        image.save()
+        return image.pk, None
+    finally:
+        # every pool thread opens its own connection
+        connection.close()
+
+
+def store_images(request, files):
+    """
+    Save uploaded images and the images in uploaded zip files using a pool
+    of threads. Return the ids of the saved images in upload order and the
+    errors.
+    """
+    uploads = list(iter_uploaded_images(files))
+    max_files = get_setting('STREAMFIELDS_BULK_UPLOAD_MAX_FILES')
+    if len(uploads) > max_files:
+        return [], [_("At most %d images can be uploaded at once.") % max_files]
+
+    collections = permission_policy.collections_user_has_permission_for(request.user, 'add')
+    collection = request.POST.get('collection') or collections[0].pk
+    pool = ThreadPool(get_setting('STREAMFIELDS_BULK_UPLOAD_WORKERS'))
+    try:
+        results = pool.map(store_image, [
+            (request.user, collection, uploaded) for uploaded in uploads])
+    finally:
+        pool.close()
+        pool.join()
+
+    image_ids = [image_id for image_id, error in results if image_id is not None]
+    errors = [error for image_id, error in results if error is not None]
+    return image_ids, errors
+
+
+def bulk_images(request, bulk_key):
+    """
+    Modal for choosing many images from the library and/or uploading image
+    and zip files for a gallery or slider. Responds with the image ids.
+    """
+    get_bulk_block(bulk_key)
+
+    if request.method == 'POST':
+        image_ids = [int(pk) for pk in request.POST.getlist('image') if pk.isdigit()]
+        errors = []
+        files = request.FILES.getlist('files')
+        if files:
+            if not permission_policy.user_has_permission(request.user, 'add'):
+                raise PermissionDenied
+            uploaded_ids, errors = store_images(request, files)
+            image_ids.extend(uploaded_ids)
+        return render_modal_workflow(
+            request, None, 'streamfields/admin/bulk_images_chosen.js', {
+                'image_ids_json': json.dumps(image_ids),
+                'errors_json': json.dumps(errors),
+            })
+
+    images = get_image_model().objects.order_by('-created_at')
+    searchform = SearchForm(request.GET if 'q' in request.GET else None)
+    if searchform.is_valid():
+        images = images.search(searchform.cleaned_data['q'])
+    paginator, images = paginate(request, images, per_page=48)
+
+    context = {
+        'bulk_key': bulk_key,
+        'images': images,
+        'searchform': searchform,
+        'can_upload': permission_policy.user_has_permission(request.user, 'add'),
+    }
+    if 'q' in request.GET or 'p' in request.GET:
+        return render(request, 'streamfields/admin/bulk_images_results.html', context)
+    return render_modal_workflow(
+        request, 'streamfields/admin/bulk_images.html',
+        'streamfields/admin/bulk_images.js', context)
+
+
+@require_POST
+def bulk_image_list(request, bulk_key):
+    """
+    Append the given images to the posted state of a gallery or slider list
+    and return the list's form, rendered once for all new items.
+    """
+    block = get_bulk_block(bulk_key)
+    prefix = request.POST.get('prefix', '')
+    try:
+        value = block.value_from_datadict(request.POST, request.FILES, prefix)
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest("Incomplete list data")
+
+    image_ids = [int(pk) for pk in request.POST.getlist('image') if pk.isdigit()]
+    images = get_image_model().objects.in_bulk(image_ids)
+    value.extend(
+        block.get_image_item(images[pk]) for pk in image_ids if pk in images)
+
+    return JsonResponse({
+        # without the bulk button, which stays in place
+        'html': blocks.ListBlock.render_form(block, value, prefix),
+        'js': block.js_initializer(),
+    })
+
+
+@require_POST
+def table_import(request):
+    """
+    Store an uploaded CSV or XLSX file as a StoredTable, parsing and writing
+    it row by row, and return the new table's id.
+    """
+    uploaded = request.FILES.get('file')
+    if uploaded is None:
+        return JsonResponse({'error': _("Choose a file to import.")}, status=400)
+    try:
+        table = store_table(
+            uploaded, user=request.user,
+            first_row_is_table_header=request.POST.get('first_row_is_table_header') == 'true',
+            first_col_is_header=request.POST.get('first_col_is_header') == 'true')
+    except TableImportError as e:
+        return JsonResponse({'error': '%s' % e}, status=400)
+    return JsonResponse({
+        'id': table.pk,
+        'rows': table.row_count,
+        'columns': table.column_count,
+    })
+
+
+def table_preview(request, table_id):
+    """Return one page of the rows of a StoredTable, rendered for the editor."""
+    table = get_object_or_404(StoredTable, pk=table_id)
+    if not can_preview_table(request.user, table):
+        raise PermissionDenied
+    per_page = get_setting('STREAMFIELDS_TABLE_PREVIEW_ROWS')
+    num_pages = max((table.row_count + per_page - 1) // per_page, 1)
+    try:
+        page = min(max(int(request.GET.get('p', 1)), 1), num_pages)
+    except ValueError:
+        page = 1
+
+    html = render_to_string('streamfields/admin/stored_table_preview.html', {
+        'table': table,
+        'rows': table.get_rows((page - 1) * per_page, page * per_page),
+        'page': page,
+        'num_pages': num_pages,
+        'previous_page': page - 1 if page > 1 else None,
+        'next_page': page + 1 if page < num_pages else None,
+    }, request=request)
+    return JsonResponse({'html': html})
+
+
+def list_fragment(request, page_id, digest):
+    """
+    Render a page of a paginated list of a live page, or of the items
+    matching the search query q, as JSON with the items' html, their style
+    rules and the url of the next page.
+    """
+    page = get_object_or_404(Page.objects.live(), pk=page_id).specific
+    restrictions = list(page.get_view_restrictions())
+    for restriction in restrictions:
+        if not restriction.accept_request(request):
+            raise PermissionDenied
+    try:
+        number = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid page number")
+    query = request.GET.get('q', '').strip()[:100]
+
+    state = get_render_state({'request': request})
+    # pages further down the list are never above the fold
+    state.eager_media = 0
+    cache = get_fragment_cache({'request': request}) if not restrictions else None
+    if cache is not None:
+        key = 'uwkm_streamfields:list:%s.%s:%s:%d:%s' % (
+            page.pk, state.get_page_version(page), digest, number,
+            hashlib.sha1(query.encode('utf-8')).hexdigest())
+        data = cache.get(key)
+        if data is not None:
+            return JsonResponse(data)
+
+    found = find_list(page, digest)
+    if found is None:
+        raise Http404
+    block, raw = found
+    items, has_next = get_list_page(block, raw, digest, number, query)
+
+    html = block.render(block.to_python(items), {
+        'page': page,
+        'request': request,
+        'streamfields_list_fragment': True,
+    })
+    if get_setting('STREAMFIELDS_MINIFY_HTML'):
+        html = minify_html(html)
+    rules = state.pop_style_rules()
+    data = {
+        'html': html,
+        'styles': rules,
+        'next': None,
+    }
+    if has_next:
+        params = {'page': number + 1}
+        if query:
+            params['q'] = query
+        data['next'] = '%s?%s' % (get_list_url(page, digest), urlencode(params))
+
+    if cache is not None:
+        cache.set(key, data, get_setting('STREAMFIELDS_CACHE_TIMEOUT'))
+    return JsonResponse(data)
+
+
+def metrics_view(request):
+    """
+    Serve the metrics in the Prometheus text format to superusers and to
+    requests bearing STREAMFIELDS_METRICS_TOKEN.
+    """
+    token = get_setting('STREAMFIELDS_METRICS_TOKEN')
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    user = getattr(request, 'user', None)
+    if not (token and constant_time_compare(authorization, 'Bearer %s' % token)) and \
+            not (user is not None and user.is_superuser):
+        raise PermissionDenied
+
+    sink = get_sink()
+    text = sink.collect() if sink is not None else None
+    if text is None:
+        raise Http404
+    return HttpResponse(text, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_POST
+def page_patch(request, page_id):
+    """
+    Save a draft of a page, or publish it, from the editor's patch of the
+    changed StreamField children (see page_patch.py), answering with the url
+    to continue at. The editor posts the full form instead when the patch
+    is refused (400 or 409), e.g. when the page got a newer revision since
+    it was opened.
+    """
+    page = get_object_or_404(Page, pk=page_id)
+    latest_revision = page.get_latest_revision()
+    page = page.get_latest_revision_as_page()
+    page_perms = page.permissions_for_user(request.user)
+    if not page_perms.can_edit():
+        raise PermissionDenied
+
+    try:
+        patch = json.loads(request.body.decode('utf-8'))
+    except ValueError:
+        return JsonResponse({'error': "Invalid patch."}, status=400)
+    if latest_revision is None or patch.get('base_revision') != latest_revision.pk:
+        return JsonResponse({'error': _("The page was changed in the meantime.")}, status=409)
+    if page.locked:
+        return JsonResponse({'error': _("The page could not be saved as it is locked")}, status=409)
+    is_publishing = patch.get('action') == 'publish' and page_perms.can_publish()
+
+    for fn in hooks.get_hooks('before_edit_page'):
+        if hasattr(fn(request, page), 'status_code'):
+            # let the full form post get the hook's response
+            return JsonResponse({'error': "Handled by a hook."}, status=409)
+
+    page_class = type(page)
+    form_class = page_class.get_edit_handler().get_form_class(page_class)
+    site = page.get_site()
+    if site is not None:
+        activate_grid_block(get_grid_block_for_site(site))
+    try:
+        form = form_class(
+            to_datadict(patch.get('form') or {}), {}, instance=page,
+            parent_page=page.get_parent())
+        # the patch carries them instead
+        for field in get_stream_fields(page_class):
+            form.fields.pop(field.name, None)
+        stream_data, errors = apply_patch(page, patch)
+    except PatchError as e:
+        return JsonResponse({'error': '%s' % e}, status=400)
+    finally:
+        deactivate_grid_block()
+    if not form.is_valid() or errors:
+        errors.update(
+            (name, list(field_errors)) for name, field_errors in form.errors.items())
+        return JsonResponse({'errors': errors}, status=400)
+
+    page = form.save(commit=False)
+    set_stored_stream_data(page, stream_data)
+    try:
+        revision = page.save_revision(user=request.user)
+    except ValidationError as e:
+        # e.g. exceeded performance budgets, the full form post shows them
+        return JsonResponse({'error': ' '.join(e.messages)}, status=400)
+    set_stored_stream_data(page, stream_data, lazy=True)
+    if is_publishing:
+        revision.publish()
+        page = page.specific_class.objects.get(pk=page.pk)
+        messages.success(request, _("Page '{0}' has been published.").format(
+            page.get_admin_display_title()))
+    else:
+        messages.success(request, _("Page '{0}' has been updated.").format(
+            page.get_admin_display_title()))
+
+    for fn in hooks.get_hooks('after_edit_page'):
+        result = fn(request, page)
+        if hasattr(result, 'status_code'):
+            if result.status_code in (301, 302) and result.has_header('Location'):
+                return JsonResponse({'redirect': result['Location']})
+            # shown in place of the editor by custom-admin.js
+            return result
+
+    next_url = form.data.get('next')
+    if not next_url or not is_safe_url(url=next_url, host=request.get_host()):
+        next_url = None
+    if is_publishing:
+        redirect_url = next_url or reverse('wagtailadmin_explore', args=[page.get_parent().pk])
+    else:
+        redirect_url = reverse('wagtailadmin_pages:edit', args=[page.pk])
+        if next_url:
+            # passed through again like the edit view does
+            redirect_url += '?next=%s' % urlquote(next_url)
+    return JsonResponse({'redirect': redirect_url})
@@ -9,20 +9,73 @@
 
 """
 
-from django.conf import settings
+from django.conf.urls import url
+from django.contrib import messages
+from django.templatetags.static import static
 from wagtail.wagtailcore import hooks
 
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
 
+from . import views
+from .budgets import pop_budget_warnings
+from .stream import get_stream_fields
+
+
+@hooks.register('before_edit_page')
+def remember_edited_page(request, page):
+    """
+    Keep what custom-admin.js needs to save the edit form as a patch on the
+    request, StreamfieldsSiteMiddleware adds it to the editor's html.
+    """
+    if request.method != 'GET':
+        return
+    revision = page.get_latest_revision()
+    request._streamfields_patch = {
+        'url': reverse('uwkm_streamfields_page_patch', args=[page.pk]),
+        'edit_url': reverse('wagtailadmin_pages:edit', args=[page.pk]),
+        'revision': revision.pk if revision is not None else None,
+        'streams': [field.name for field in get_stream_fields(type(page))],
+    }
+
+
+@hooks.register('after_create_page')
+@hooks.register('after_edit_page')
+def warn_about_budgets(request, page):
+    for warning in pop_budget_warnings():
+        messages.warning(request, warning)
+
+
+# resolved through the staticfiles storage, so hashed names are used when
+# collected with PrecompressedManifestStaticFilesStorage
 @hooks.register('insert_editor_js')
 def editor_js():
     s = """<script type="text/javascript">var collapse = false;</script>"""
-    s += """<script src="{0}colorpicker/js/colorpicker.js"></script>"""
-    s += """<script src="{0}js/custom-admin.js"></script>"""
-    s += """<script src="{0}js/colorPicker.js"></script>"""
-    return s.format(settings.STATIC_URL)
+    s += """<script src="{0}"></script>""".format(static('colorpicker/js/colorpicker.js'))
+    s += """<script src="{0}"></script>""".format(static('js/custom-admin.js'))
+    s += """<script src="{0}"></script>""".format(static('js/colorPicker.js'))
+    return s
 
 @hooks.register('insert_editor_css')
 def editor_css():
-    s = """<link rel="stylesheet" href="{0}colorpicker/css/colorpicker.css"></link>"""
-    s += """<link rel="stylesheet" href="{0}css/custom-admin.css"></link>"""
-    return s.format(settings.STATIC_URL)
+    s = """<link rel="stylesheet" href="{0}"></link>""".format(static('colorpicker/css/colorpicker.css'))
+    s += """<link rel="stylesheet" href="{0}"></link>""".format(static('css/custom-admin.css'))
+    return s
+
+
+@hooks.register('register_admin_urls')
+def register_admin_urls():
+    return [
+        url(r'^streamfields/bulk-images/(\w+)/$', views.bulk_images,
+            name='uwkm_streamfields_bulk_images'),
+        url(r'^streamfields/bulk-images/(\w+)/list/$', views.bulk_image_list,
+            name='uwkm_streamfields_bulk_image_list'),
+        url(r'^streamfields/tables/import/$', views.table_import,
+            name='uwkm_streamfields_table_import'),
+        url(r'^streamfields/tables/(\d+)/$', views.table_preview,
+            name='uwkm_streamfields_table_preview'),
+        url(r'^streamfields/pages/(\d+)/patch/$', views.page_patch,
+            name='uwkm_streamfields_page_patch'),
+    ]
@@ -1,6 +1,16 @@
+import json
+
 from django import forms
+from django.template.loader import render_to_string
 from django.utils.safestring import mark_safe
 
+from wagtail.utils.widgets import WidgetWithScript
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+
 from .models import StreamfieldsSettings as settings
 
 class ColorPickerWidget(forms.TextInput):
@@ -14,3 +24,25 @@ class ColorPickerWidget(forms.TextInput):
             field.ColorPicker();
             field.ColorPickerSetColor('%s');
             </script>''' % (name, value))
+
+
+class StoredTableInput(WidgetWithScript, forms.HiddenInput):
+    """
+    Holds the id of a StoredTable, with a form to import a CSV or XLSX file
+    into a new one and a paginated preview of the current one.
+    """
+    def render_html(self, name, value, attrs):
+        if hasattr(value, 'pk'):
+            value = value.pk
+        original_field_html = super(StoredTableInput, self).render_html(name, value, attrs)
+        return render_to_string('streamfields/admin/stored_table_input.html', {
+            'original_field_html': original_field_html,
+            'attrs': attrs,
+            'value': value,
+        })
+
+    def render_js_init(self, id_, name, value):
+        return "initStoredTable({0}, {1}, {2});".format(
+            json.dumps(id_),
+            json.dumps(reverse('uwkm_streamfields_table_import')),
+            json.dumps(reverse('uwkm_streamfields_table_preview', args=['0'])))